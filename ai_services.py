@@ -1,183 +1,342 @@
 # ai_services.py
 import logging
 import time
+import math
+import asyncio
 from google.genai import types
 
 import io  
+import os
 import wave 
+import mimetypes
 from pydub import AudioSegment 
 
 # Import the initialized client from our config file
+import config
 from config import google_client
+from limiter import is_transient_error
+from audio_processing import estimate_audio_job_memory
 from texts import Texts
 
+# Gemini Batch API job states after which a batch no longer changes.
+_BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
 
-def count_text_tokens(text: str, model: str = "gemini-2.0-flash-lite") -> int:
+# Gemini TTS returns 16-bit mono PCM at 24kHz.
+TTS_SAMPLE_RATE = 24000
+
+# Limiter slot costs: text latency is compared per TEXT_COST_TOKENS, speech per TTS_COST_CHARS.
+TEXT_COST_TOKENS = 1024
+TTS_COST_CHARS = 1000
+
+
+def _text_cost(max_tokens: int) -> float:
+    return max(max_tokens / TEXT_COST_TOKENS, 1.0)
+
+
+def _speech_cost(text: str) -> float:
+    return max(len(text) / TTS_COST_CHARS, 1.0)
+
+
+def _usage_counts(response) -> dict:
+    """Extracts token counts from a Gemini response, defaulting missing ones to 0."""
+    usage = response.usage_metadata if hasattr(response, 'usage_metadata') else None
+    return {
+        "prompt_token_count": (getattr(usage, 'prompt_token_count', 0) or 0) if usage else 0,
+        "candidates_token_count": (getattr(usage, 'candidates_token_count', 0) or 0) if usage else 0,
+        "total_token_count": (getattr(usage, 'total_token_count', 0) or 0) if usage else 0,
+    }
+
+def _transcription_config(duration_seconds: int) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+        temperature=1,
+        topP=0.95,
+        max_output_tokens=duration_seconds * 15,
+    )
+
+def _transcription_result(transcription_response, file_path: str) -> dict:
+    if transcription_response is None:
+        return {"error": "Google API returned empty response"}
+
+    transcription_text = ""
+    if hasattr(transcription_response, 'text') and transcription_response.text is not None:
+        transcription_text = transcription_response.text.strip()
+    else:
+        logging.warning(f"Transcription response text is None for file: {file_path}")
+
+    return {"transcription": transcription_text, **_usage_counts(transcription_response)}
+
+def _text_config(max_tokens: int) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+        temperature=0.9,
+        topP=0.95,
+        max_output_tokens=max_tokens
+    )
+
+def _speech_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_modalities=["AUDIO"],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    # Using a high-quality voice
+                    voice_name='Kore',
+                )
+            )
+        ),
+    )
+
+def _pcm_to_mp3(pcm_data: bytes) -> bytes:
+    """Wraps raw Gemini TTS PCM in a WAV container and re-encodes it as MP3."""
+    # 1. Create a WAV file in memory from the raw PCM data
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wf:
+        wf.setnchannels(1)       # Mono
+        wf.setsampwidth(2)       # 16-bit
+        wf.setframerate(TTS_SAMPLE_RATE)
+        wf.writeframes(pcm_data)
+    wav_buffer.seek(0) # Rewind the buffer to the beginning
+
+    # 2. Load the in-memory WAV file using pydub
+    audio_segment = AudioSegment.from_wav(wav_buffer)
+
+    # 3. Export it as an MP3 to another in-memory buffer
+    mp3_buffer = io.BytesIO()
+    audio_segment.export(mp3_buffer, format="mp3")
+
+    # 4. Get the final MP3 data as bytes
+    return mp3_buffer.getvalue()
+
+def _speech_result(response, mp3_data: bytes) -> dict:
+    logging.info(f"Successfully converted TTS output to MP3. Size: {len(mp3_data)} bytes.")
+    usage = _usage_counts(response)
+    logging.info(f"TTS Usage - Prompt tokens: {usage['prompt_token_count']}, Candidate tokens: {usage['candidates_token_count']}, Total tokens: {usage['total_token_count']}")
+    return {
+        "audio_data": mp3_data,
+        "total_token_count": usage["total_token_count"], # For potential future cost calculation
+        "error": None
+    }
+
+def _speech_pcm(response) -> bytes:
+    if not response.candidates or not response.candidates[0].content.parts:
+        raise ValueError("API returned no audio data.")
+    return response.candidates[0].content.parts[0].inline_data.data
+
+# Telegram voice notes are .oga, which mimetypes doesn't know.
+_AUDIO_MIME_TYPES = {".oga": "audio/ogg", ".ogg": "audio/ogg", ".opus": "audio/ogg", ".mp3": "audio/mpeg", ".flac": "audio/flac"}
+
+def _audio_mime_type(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    return _AUDIO_MIME_TYPES.get(extension) or mimetypes.guess_type(file_path)[0] or "audio/mpeg"
+
+def _use_inline_audio(file_path: str) -> bool:
+    """Small files go inline in the request, saving the Files API upload round trip."""
+    return os.path.getsize(file_path) <= config.INLINE_AUDIO_MAX_BYTES
+
+def _read_audio_part(file_path: str, mime_type: str) -> types.Part:
+    with open(file_path, "rb") as f:
+        return types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+
+
+async def count_text_tokens_async(text: str, model: str = "gemini-2.0-flash-lite") -> int:
     """
-    Counts the number of tokens in a given text using the specified Gemini model.
-    Returns the token count or 0 if an error occurs.
+    Counts the tokens of a text for cost estimates, locally once the estimator is calibrated.
+    Returns the token count, or the local estimate if the remote count fails.
     """
+    cache_key = config.token_count_cache.key(text, model)
+    cached = config.token_count_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    estimator = config.token_estimator
+    if config.TOKEN_ESTIMATOR_ENABLED and (estimator.trusted or not config.TOKEN_ESTIMATOR_REMOTE_FALLBACK):
+        count = estimator.estimate(text)
+        config.token_count_cache.put(cache_key, count)
+        return count
     try:
-        response = google_client.models.count_tokens(model=model, contents=text)
+        async with config.token_counting_limiter.slot():
+            response = await google_client.aio.models.count_tokens(model=model, contents=text)
+        estimator.observe(text, response.total_tokens)
+        config.token_count_cache.put(cache_key, response.total_tokens)
         return response.total_tokens
     except Exception as e:
         logging.error(f"Error during token counting: {e}", exc_info=True)
-        return 0
+        return estimator.estimate(text) if config.TOKEN_ESTIMATOR_ENABLED else 0
 
-def transcribe_audio_google_sync(file_path: str, duration_seconds: int, model: str , prompt: str) -> dict:
+async def transcribe_audio_google_async(file_path: str, duration_seconds: int, model: str, prompt: str, mime_type: str | None = None) -> dict:
     """
-    Synchronous transcription function - to be run in thread pool.
-    Returns a dictionary with transcription and usage data or an error.
+    Transcribes one audio file, inline if small enough, otherwise through the Files API.
+    Returns a dictionary with transcription and usage data, or an error with "retryable".
     """
+    mime_type = mime_type or _audio_mime_type(file_path)
+    uploaded_file = None
     try:
-        logging.info(f"Uploading audio {file_path} to Google for transcription.")
-        start_time = time.time()
-        uploaded_file = google_client.files.upload(file=file_path)
-        logging.info(f"Uploaded audio {file_path} to Google: {uploaded_file.uri}")
-        max_tokens = duration_seconds * 15
-        # max_tokens = 65536
-        
-        transcription_response = google_client.models.generate_content(
-            model=model,
-            contents=[prompt, uploaded_file],
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0),
-                temperature=1,
-                topP=0.95,
-                max_output_tokens=max_tokens,
-            ),
-        )
-        
+        async with config.transcription_limiter.slot(cost=max(duration_seconds, 1)):
+            start_time = time.time()
+            if _use_inline_audio(file_path):
+                logging.info(f"Sending audio {file_path} inline to Google for transcription.")
+                loop = asyncio.get_running_loop()
+                audio_part = await loop.run_in_executor(config.AUDIO_PROCESS_EXECUTOR, _read_audio_part, file_path, mime_type)
+            else:
+                logging.info(f"Uploading audio {file_path} to Google for transcription.")
+                uploaded_file = await google_client.aio.files.upload(file=file_path, config={"mime_type": mime_type})
+                logging.info(f"Uploaded audio {file_path} to Google: {uploaded_file.uri}")
+                audio_part = uploaded_file
+
+            transcription_response = await google_client.aio.models.generate_content(
+                model=model,
+                contents=[prompt, audio_part],
+                config=_transcription_config(duration_seconds),
+            )
+
         duration = time.time() - start_time
         logging.info(f"Successfully received  the response from Gemini. duration: {duration:.2f}s")
-
-        if transcription_response is None:
-            return {"error": "Google API returned empty response"}
-        
-        transcription_text = ""
-        if hasattr(transcription_response, 'text') and transcription_response.text is not None:
-            transcription_text = transcription_response.text.strip()
-        else:
-            logging.warning(f"Transcription response text is None for file: {file_path}")
-            transcription_text = ""
-
-        usage = transcription_response.usage_metadata if hasattr(transcription_response, 'usage_metadata') else None
-        prompt_token_count = 0
-        candidates_token_count = 0
-        total_token_count = 0
-
-        if usage is not None:
-            prompt_token_count = getattr(usage, 'prompt_token_count', 0) or 0
-            candidates_token_count = getattr(usage, 'candidates_token_count', 0) or 0
-            total_token_count = getattr(usage, 'total_token_count', 0) or 0
-        
-        return {
-            "transcription": transcription_text,
-            "prompt_token_count": prompt_token_count,
-            "candidates_token_count": candidates_token_count,
-            "total_token_count": total_token_count,
-        }
+        return _transcription_result(transcription_response, file_path)
     except Exception as e:
         logging.error(f"Error during Google transcription: {e}", exc_info=True)
-        return {"error": f"An error occurred during Google transcription: {e}"}
-    
-def process_text_with_gemini(prompt_text: str, model: str = "gemini-2.5-flash-lite-preview-09-2025", max_tokens:int = 1024) -> dict:
+        return {
+            "error": f"An error occurred during Google transcription: {e}",
+            "retryable": is_transient_error(e),
+        }
+    finally:
+        if uploaded_file is not None:
+            try:
+                await google_client.aio.files.delete(name=uploaded_file.name)
+            except Exception as e:
+                logging.warning(f"Failed to delete uploaded file {uploaded_file.name}: {e}")
+
+async def process_text_with_gemini_async(prompt_text: str, model: str = "gemini-2.5-flash-lite-preview-09-2025", max_tokens:int = 1024) -> dict:
     """
-    Sends a text prompt to a GEMINI model and returns the response.
+    Sends a text prompt to a Gemini model.
     Returns a dictionary with the generated text and usage data or an error.
-    model1: gemini-2.5-flash-lite
-    model2: gemini-2.5-flash
     """
     try:
         logging.info(f"Processing text with Gemini model: {model}")
-        response = google_client.models.generate_content(
-            model=model,
-            contents=prompt_text,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0), 
-                temperature=0.9,
-                topP=0.95,
-                max_output_tokens=max_tokens
-            ),
-        )
-
-        usage = response.usage_metadata
-        return {
-            "text": response.text.strip(),
-            "prompt_token_count": usage.prompt_token_count,
-            "candidates_token_count": usage.candidates_token_count,
-            "total_token_count": usage.total_token_count,
-        }
+        async with config.text_process_limiter.slot(cost=_text_cost(max_tokens)):
+            response = await google_client.aio.models.generate_content(
+                model=model,
+                contents=prompt_text,
+                config=_text_config(max_tokens),
+            )
+        usage = _usage_counts(response)
+        config.token_estimator.observe(prompt_text, usage["prompt_token_count"])
+        return {"text": response.text.strip(), **usage}
     except Exception as e:
         logging.error(f"Error during Gemini text processing: {e}", exc_info=True)
         return {"error": f"An error occurred during Gemini text processing: {e}"}
 
-def generate_speech_gemini(text: str) -> dict:
+async def stream_text_with_gemini_async(
+    prompt_text: str,
+    model: str = "gemini-2.5-flash-lite-preview-09-2025",
+    max_tokens: int = 1024,
+    on_text=None
+) -> dict:
+    """
+    Streaming variant of process_text_with_gemini_async; `on_text(text_so_far)` is awaited per chunk.
+    Returns the same dictionary once the response is complete.
+    """
+    try:
+        logging.info(f"Streaming text from Gemini model: {model}")
+        parts = []
+        last_chunk = None
+        async with config.text_process_limiter.slot(cost=_text_cost(max_tokens)):
+            stream = await google_client.aio.models.generate_content_stream(
+                model=model,
+                contents=prompt_text,
+                config=_text_config(max_tokens),
+            )
+            async for chunk in stream:
+                last_chunk = chunk
+                if chunk.text:
+                    parts.append(chunk.text)
+                    if on_text:
+                        await on_text("".join(parts))
+        usage = _usage_counts(last_chunk)
+        config.token_estimator.observe(prompt_text, usage["prompt_token_count"])
+        return {"text": "".join(parts).strip(), **usage}
+    except Exception as e:
+        logging.error(f"Error during Gemini text streaming: {e}", exc_info=True)
+        return {"error": f"An error occurred during Gemini text processing: {e}"}
+
+async def generate_speech_gemini_async(text: str) -> dict:
     """
     Converts text to speech using the Gemini TTS model.
-    Returns a dictionary with the audio data or an error.
+    Returns a dictionary with the MP3 audio data or an error.
     """
     try:
         logging.info(f"Generating speech for text of length: {len(text)}")
-        
-        # The 'text-to-speech' model automatically routes to the best available version.
-        response = google_client.models.generate_content(
-            model="gemini-2.5-flash-preview-tts", 
-            contents=text,
-            config=types.GenerateContentConfig(
-                response_modalities=["AUDIO"],
-                speech_config=types.SpeechConfig(
-                    voice_config=types.VoiceConfig(
-                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                            # Using a high-quality voice
-                            voice_name='Kore', 
-                        )
-                    )
-                ),
+        async with config.tts_limiter.slot(cost=_speech_cost(text)):
+            response = await google_client.aio.models.generate_content(
+                model="gemini-2.5-flash-preview-tts",
+                contents=text,
+                config=_speech_config()
             )
+        pcm_data = _speech_pcm(response)
+        loop = asyncio.get_running_loop()
+        # pydub holds the PCM, its WAV wrapper, the decoded segment and the export input at once.
+        memory_bytes = estimate_audio_job_memory(len(pcm_data) / (2 * TTS_SAMPLE_RATE), TTS_SAMPLE_RATE, channels=1, pcm_copies=4)
+        async with config.audio_memory_budget.reserve(memory_bytes):
+            mp3_data = await loop.run_in_executor(config.AUDIO_PROCESS_EXECUTOR, _pcm_to_mp3, pcm_data)
+        return _speech_result(response, mp3_data)
+    except Exception as e:
+        logging.error(f"Error during Gemini speech generation or conversion: {e}", exc_info=True)
+        return {"audio_data": None, "error": str(e)}
+
+async def submit_transcription_batch_async(chunks: list[dict], model: str, prompt: str, display_name: str) -> tuple[str, list[str]]:
+    """
+    Submits one Gemini Batch API job with a transcription request per chunk.
+    Returns the batch job name and the names of the uploaded files; raises on failure.
+    """
+    inlined_requests = []
+    file_names = []
+    try:
+        for chunk in chunks:
+            uploaded_file = await google_client.aio.files.upload(file=chunk["path"])
+            file_names.append(uploaded_file.name)
+            logging.info(f"Uploaded batch chunk {chunk['path']} to Google: {uploaded_file.uri}")
+            inlined_requests.append(types.InlinedRequest(
+                contents=[types.Content(role="user", parts=[
+                    types.Part(text=prompt),
+                    types.Part(file_data=types.FileData(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)),
+                ])],
+                config=_transcription_config(math.ceil(chunk["duration_seconds"])),
+            ))
+        batch_job = await google_client.aio.batches.create(
+            model=model,
+            src=inlined_requests,
+            config=types.CreateBatchJobConfig(display_name=display_name),
         )
+    except BaseException:
+        await delete_uploaded_files_async(file_names)
+        raise
+    logging.info(f"Submitted Gemini batch {batch_job.name} with {len(inlined_requests)} request(s).")
+    return batch_job.name, file_names
 
-        if not response.candidates or not response.candidates[0].content.parts:
-            raise ValueError("API returned no audio data.")
-
-        # audio_data = response.candidates[0].content.parts[0].inline_data.data
-        pcm_data = response.candidates[0].content.parts[0].inline_data.data
-        # 1. Create a WAV file in memory from the raw PCM data
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, "wb") as wf:
-            wf.setnchannels(1)       # Mono
-            wf.setsampwidth(2)       # 16-bit
-            wf.setframerate(24000)   # 24kHz sample rate (Gemini TTS default)
-            wf.writeframes(pcm_data)
-        wav_buffer.seek(0) # Rewind the buffer to the beginning
-
-        # 2. Load the in-memory WAV file using pydub
-        audio_segment = AudioSegment.from_wav(wav_buffer)
-        
-        # 3. Export it as an MP3 to another in-memory buffer
-        mp3_buffer = io.BytesIO()
-        audio_segment.export(mp3_buffer, format="mp3")
-        mp3_buffer.seek(0) # Rewind the buffer
-
-        # 4. Get the final MP3 data as bytes
-        mp3_data = mp3_buffer.getvalue()
-
-        logging.info(f"Successfully converted TTS output to MP3. Size: {len(mp3_data)} bytes.")
-
-        # It's good practice to also get usage metadata if available, though TTS might not provide it
-        usage = response.usage_metadata if hasattr(response, 'usage_metadata') else None
-        total_token_count = 0
-        if usage:
-            total_token_count = getattr(usage, 'total_token_count', 0) or 0
-            prompt_token_count = getattr(usage, 'prompt_token_count', 0) or 0
-            candidates_token_count = getattr(usage, 'candidates_token_count', 0) or 0
-            logging.info(f"TTS Usage - Prompt tokens: {prompt_token_count}, Candidate tokens: {candidates_token_count}, Total tokens: {total_token_count}")
+async def delete_uploaded_files_async(file_names: list[str]):
+    """Deletes files uploaded to the Files API, logging the ones that fail."""
+    for file_name in file_names:
+        try:
+            await google_client.aio.files.delete(name=file_name)
+        except Exception as e:
+            logging.warning(f"Failed to delete uploaded file {file_name}: {e}")
 
-        return {
-            "audio_data": mp3_data,
-            "total_token_count": total_token_count, # For potential future cost calculation
-            "error": None
-        }
-    except Exception as e:
-        logging.error(f"Error during Gemini speech generation or conversion: {e}", exc_info=True)
-        return {"audio_data": None, "error": str(e)}
\ No newline at end of file
+async def get_transcription_batch_async(batch_name: str) -> dict:
+    """
+    Polls a batch submitted by submit_transcription_batch_async.
+    Returns {"state": "running"}, {"state": "succeeded", "results"} or {"state": "failed", "error"}.
+    """
+    batch_job = await google_client.aio.batches.get(name=batch_name)
+    state = getattr(batch_job.state, "name", str(batch_job.state))
+    if state not in _BATCH_DONE_STATES:
+        return {"state": "running"}
+    if state != "JOB_STATE_SUCCEEDED":
+        return {"state": "failed", "error": f"{state}: {batch_job.error}"}
+
+    results = []
+    for inlined_response in batch_job.dest.inlined_responses:
+        if inlined_response.error:
+            results.append({"error": str(inlined_response.error)})
+        else:
+            results.append(_transcription_result(inlined_response.response, batch_name))
+    return {"state": "succeeded", "results": results}
@@ -0,0 +1,596 @@
+# audio_processing.py
+import os
+import csv
+import json
+import glob
+import bisect
+import logging
+import subprocess
+
+import numpy as np
+
+FFMPEG_BINARY = "ffmpeg"
+FFPROBE_BINARY = "ffprobe"
+
+# Intermediate format sent to the transcription service: mono with a gain stage, encoded
+# with one of the named profiles below.
+TARGET_CHANNELS = 1
+TARGET_GAIN_DB = 6.0
+
+ENCODING_PROFILES = {
+    "mp3_32k": {"sample_rate": 32000, "extension": "mp3", "codec_args": ["-c:a", "libmp3lame", "-b:a", "32k"]},
+    "opus_16k": {"sample_rate": 16000, "extension": "ogg", "codec_args": ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"]},
+    "flac_16k": {"sample_rate": 16000, "extension": "flac", "codec_args": ["-c:a", "flac", "-sample_fmt", "s16"]},
+}
+DEFAULT_ENCODING_PROFILE = "mp3_32k"
+
+# Inputs the transcription service accepts as is, by codec: (ffprobe container, mime type).
+PASSTHROUGH_FORMATS = {
+    "opus": ("ogg", "audio/ogg"),
+    "vorbis": ("ogg", "audio/ogg"),
+    "mp3": ("mp3", "audio/mpeg"),
+}
+
+# Silence analysis runs on a heavily downsampled copy of the signal.
+ANALYSIS_SAMPLE_RATE = 8000
+ANALYSIS_FRAME_MS = 20
+
+
+# Working set of one ffmpeg/ffprobe process: a fixed base (binary, codec and muxer state),
+# a few seconds of decoded float samples buffered in the filter graph and encoder at the
+# input's rate and channel count, and the demuxer's packet index, which grows with the
+# duration (audio codecs carry about SAMPLES_PER_PACKET samples per packet).
+FFMPEG_BASE_BYTES = 24 * 1024 * 1024
+FFMPEG_BUFFERED_SECONDS = 10
+FFMPEG_INDEX_BYTES_PER_PACKET = 32
+SAMPLES_PER_PACKET = 1024
+# Assumed until a file has been probed: 48kHz stereo, the largest common input.
+DEFAULT_ESTIMATE_SAMPLE_RATE = 48000
+DEFAULT_ESTIMATE_CHANNELS = 2
+# Energy envelope arrays per analysis frame: energies, cumulative sums, quietness, frame times and masks.
+ANALYSIS_BYTES_PER_FRAME = 40
+
+
+class AudioProcessingError(Exception):
+    """Raised when an ffmpeg/ffprobe subprocess fails."""
+
+    def __init__(self, message: str, stderr: str = ""):
+        super().__init__(message)
+        self.stderr = stderr
+
+    @property
+    def is_decode_error(self) -> bool:
+        markers = ("Invalid data found", "could not find codec", "matches no streams", "does not contain any stream")
+        return any(marker in self.stderr for marker in markers)
+
+
+def _run_subprocess(command: list[str]) -> subprocess.CompletedProcess:
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        stderr_tail = result.stderr.strip()[-2000:]
+        logging.error(f"{command[0]} failed with code {result.returncode}: {stderr_tail}")
+        raise AudioProcessingError(f"{command[0]} exited with code {result.returncode}", stderr_tail)
+    return result
+
+
+def run_ffmpeg(args: list[str]) -> subprocess.CompletedProcess:
+    """
+    Runs ffmpeg with the given arguments and returns the completed process.
+    Audio is streamed between the subprocess and disk, never decoded into Python memory.
+    Raises AudioProcessingError on a non-zero exit code.
+    """
+    return _run_subprocess([FFMPEG_BINARY, "-hide_banner", "-nostdin", *args])
+
+
+def estimate_audio_job_memory(
+    duration_seconds: float,
+    sample_rate: int | None = None,
+    channels: int | None = None,
+    pcm_copies: float = 0,
+    analysis: bool = False,
+) -> int:
+    """
+    Estimates the peak memory in bytes of one audio job, for admission against the audio
+    memory budget: one ffmpeg process for an input of `duration_seconds` at the probed
+    `sample_rate` and `channels` (the defaults are assumed when unknown), plus
+    `pcm_copies` copies of the whole signal as 16-bit PCM held in Python (in-memory
+    conversions), plus the energy envelope when `analysis` is set.
+    """
+    sample_rate = sample_rate or DEFAULT_ESTIMATE_SAMPLE_RATE
+    channels = channels or DEFAULT_ESTIMATE_CHANNELS
+    buffer_bytes = FFMPEG_BUFFERED_SECONDS * sample_rate * channels * 4
+    index_bytes = duration_seconds * sample_rate / SAMPLES_PER_PACKET * FFMPEG_INDEX_BYTES_PER_PACKET
+    pcm_bytes = duration_seconds * sample_rate * channels * 2 * pcm_copies
+    analysis_bytes = duration_seconds * 1000 / ANALYSIS_FRAME_MS * ANALYSIS_BYTES_PER_FRAME if analysis else 0
+    return int(FFMPEG_BASE_BYTES + buffer_bytes + index_bytes + pcm_bytes + analysis_bytes)
+
+
+def probe_audio_sync(file_path: str) -> dict:
+    """
+    Reads the container and first audio stream parameters with ffprobe; nothing is decoded.
+    Returns {"format_name", "codec_name", "channels", "sample_rate", "bit_rate",
+    "duration_seconds", "has_video"}, with None for values the file doesn't declare.
+    Raises AudioProcessingError if ffprobe fails or the file has no audio stream.
+    """
+    result = _run_subprocess([
+        FFPROBE_BINARY, "-v", "error",
+        "-show_entries",
+        "format=format_name,duration,bit_rate:stream=codec_type,codec_name,channels,sample_rate,bit_rate:stream_disposition=attached_pic",
+        "-of", "json", file_path,
+    ])
+    info = json.loads(result.stdout or "{}")
+    container = info.get("format", {})
+    streams = info.get("streams", [])
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    if audio is None:
+        raise AudioProcessingError(f"{file_path} has no audio stream", "does not contain any stream")
+
+    def number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "format_name": container.get("format_name"),
+        "codec_name": audio.get("codec_name"),
+        "channels": number(audio.get("channels"), int),
+        "sample_rate": number(audio.get("sample_rate"), int),
+        "bit_rate": number(audio.get("bit_rate"), int) or number(container.get("bit_rate"), int),
+        "duration_seconds": number(container.get("duration"), float),
+        # Cover art in MP3/M4A files shows up as a video stream; it doesn't count.
+        "has_video": any(
+            stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic")
+            for stream in streams
+        ),
+    }
+
+
+def probe_duration_sync(file_path: str) -> float:
+    """
+    Returns the audio duration in seconds as cheaply as the file allows: the container's
+    declared duration, else the end of the last audio packet (demuxed, not decoded),
+    else a full decode for files whose headers and timestamps are broken.
+    Raises AudioProcessingError if none of these yields a duration.
+    """
+    try:
+        result = _run_subprocess([
+            FFPROBE_BINARY, "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "format=duration:stream=duration", "-of", "json", file_path,
+        ])
+        info = json.loads(result.stdout or "{}")
+        for value in [info.get("format", {}).get("duration")] + [stream.get("duration") for stream in info.get("streams", [])]:
+            try:
+                if float(value) > 0:
+                    return float(value)
+            except (TypeError, ValueError):
+                pass
+
+        result = _run_subprocess([
+            FFPROBE_BINARY, "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", file_path,
+        ])
+        end_seconds = 0.0
+        for line in result.stdout.splitlines():
+            pts_time, _, duration_time = line.partition(",")
+            try:
+                end_seconds = max(end_seconds, float(pts_time) + float(duration_time or 0))
+            except ValueError:
+                pass
+        if end_seconds > 0:
+            logging.info(f"{file_path} declares no duration, read {end_seconds:.1f}s from packet timestamps")
+            return end_seconds
+    except AudioProcessingError as e:
+        logging.warning(f"Probing the duration of {file_path} failed, decoding it instead: {e}")
+
+    result = run_ffmpeg(["-i", file_path, "-vn", "-map", "0:a:0", "-f", "null", "-progress", "pipe:1", "-nostats", "-"])
+    length_ms = parse_progress_out_time_ms(result.stdout)
+    if not length_ms:
+        raise AudioProcessingError(f"could not determine the duration of {file_path}")
+    logging.info(f"Decoded {file_path} to measure its duration: {length_ms / 1000:.1f}s")
+    return length_ms / 1000
+
+
+def passthrough_mime_type(
+    probe: dict,
+    codecs: list[str],
+    max_channels: int,
+    max_sample_rate: int,
+    max_bit_rate: int,
+) -> str | None:
+    """
+    Returns the mime type to send a probed file with when it can skip re-encoding: an
+    allowed codec in its native container, no video, and within the channel, sample
+    rate and bitrate limits. Returns None when the file has to be transcoded.
+    """
+    codec = probe.get("codec_name")
+    if codec not in codecs or codec not in PASSTHROUGH_FORMATS or probe.get("has_video"):
+        return None
+    container, mime_type = PASSTHROUGH_FORMATS[codec]
+    if container not in (probe.get("format_name") or "").split(","):
+        return None
+    if not probe.get("channels") or probe["channels"] > max_channels:
+        return None
+    if not probe.get("sample_rate") or probe["sample_rate"] > max_sample_rate:
+        return None
+    if probe.get("bit_rate") and probe["bit_rate"] > max_bit_rate:
+        return None
+    return mime_type
+
+
+def parse_progress_out_time_ms(progress_output: str) -> int | None:
+    """Returns the last `out_time_us` reported by `ffmpeg -progress`, in milliseconds."""
+    out_time_us = None
+    for line in progress_output.splitlines():
+        key, _, value = line.partition("=")
+        if key == "out_time_us" and value.strip().isdigit():
+            out_time_us = int(value)
+    return out_time_us // 1000 if out_time_us is not None else None
+
+
+def get_encoding_profile(name: str) -> dict:
+    """Returns the named entry of ENCODING_PROFILES; raises ValueError for an unknown name."""
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown audio encoding profile '{name}', expected one of: {', '.join(ENCODING_PROFILES)}")
+    return ENCODING_PROFILES[name]
+
+
+def encoding_args(profile: str = DEFAULT_ENCODING_PROFILE, filter_script_path: str | None = None) -> list[str]:
+    """
+    ffmpeg output options for the intermediate transcription format in `profile`. A filter
+    script (used for long filter graphs such as silence trimming) replaces the plain gain filter.
+    """
+    settings = get_encoding_profile(profile)
+    filter_args = ["-filter_script:a", filter_script_path] if filter_script_path else ["-af", f"volume={TARGET_GAIN_DB}dB"]
+    return [
+        "-vn", "-map", "0:a:0",
+        "-ac", str(TARGET_CHANNELS),
+        "-ar", str(settings["sample_rate"]),
+        *filter_args,
+        *settings["codec_args"],
+    ]
+
+
+def _write_trim_filter_script(keep_intervals: list[tuple[float, float]], script_path: str):
+    """Writes an aselect/asetpts filter graph that keeps only `keep_intervals`, plus the gain stage."""
+    selection = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in keep_intervals)
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(f"aselect='{selection}',asetpts=N/SR/TB,volume={TARGET_GAIN_DB}dB")
+
+
+def read_segment_manifest(segment_list_path: str, chunk_dir: str) -> list[dict]:
+    """
+    Parses a `-segment_list_type csv` file into an ordered chunk manifest. ffmpeg appends
+    a row only after the segment file is closed, so this is also safe to call while the
+    segment pass is still running; a trailing partial line is ignored.
+    """
+    if not os.path.exists(segment_list_path):
+        return []
+    with open(segment_list_path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+    complete_lines = content.split("\n")[:-1]
+
+    chunks = []
+    for index, row in enumerate(csv.reader(complete_lines)):
+        if len(row) < 3:
+            continue
+        start_seconds, end_seconds = float(row[1]), float(row[2])
+        chunks.append({
+            "index": index,
+            "path": os.path.join(chunk_dir, row[0]),
+            "start_seconds": start_seconds,
+            "duration_seconds": end_seconds - start_seconds,
+        })
+    return chunks
+
+
+def frame_energy_db(samples: np.ndarray, frame_samples: int) -> np.ndarray:
+    """
+    Returns the RMS energy in dBFS of each complete frame of 16-bit PCM samples.
+    Fully vectorized; trailing samples that do not fill a frame are ignored.
+    """
+    frame_count = len(samples) // frame_samples
+    frames = samples[:frame_count * frame_samples].astype(np.float32).reshape(frame_count, frame_samples)
+    mean_square = np.mean(np.square(frames / 32768.0), axis=1)
+    return 10.0 * np.log10(mean_square + 1e-10)
+
+
+def compute_frame_energy_sync(raw_file_path: str, sample_rate: int = ANALYSIS_SAMPLE_RATE, frame_ms: int = ANALYSIS_FRAME_MS) -> np.ndarray:
+    """
+    Streams a downsampled mono PCM decode of the file out of ffmpeg and returns the
+    per-frame energy in dBFS. Only one block of PCM is held at a time, so a 3-hour
+    file needs a few MB for the energy envelope instead of the whole signal.
+    """
+    frame_samples = sample_rate * frame_ms // 1000
+    block_bytes = frame_samples * 2 * 500  # 10 seconds at the default settings
+    process = subprocess.Popen(
+        [FFMPEG_BINARY, "-hide_banner", "-nostdin", "-i", raw_file_path,
+         "-vn", "-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate),
+         "-f", "s16le", "-c:a", "pcm_s16le", "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    energies = []
+    remainder = b""
+    try:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            data = remainder + block
+            usable = len(data) - len(data) % (frame_samples * 2)
+            remainder = data[usable:]
+            if usable:
+                energies.append(frame_energy_db(np.frombuffer(data[:usable], dtype="<i2"), frame_samples))
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise AudioProcessingError(f"{FFMPEG_BINARY} exited with code {returncode} during silence analysis")
+    return np.concatenate(energies) if energies else np.empty(0, dtype=np.float32)
+
+
+def plan_chunk_boundaries(
+    energy_db: np.ndarray,
+    target_seconds: float,
+    search_seconds: float,
+    frame_ms: int = ANALYSIS_FRAME_MS,
+    min_silence_ms: int = 300,
+) -> list[float]:
+    """
+    Picks chunk cut points (in seconds) that fall inside pauses near multiples of
+    `target_seconds`. For every cut the window [target - search, target + search]
+    after the previous cut is scanned for the quietest `min_silence_ms` stretch
+    (moving average of frame energy via cumulative sums), and the cut is placed in
+    its middle. Without a clear pause the quietest spot is used, so the planner never
+    produces a chunk longer than `target_seconds + search_seconds`.
+    Returns the sorted cut points, excluding 0 and the end of the audio.
+    """
+    frames_per_second = 1000 / frame_ms
+    total_frames = len(energy_db)
+    target_frames = int(target_seconds * frames_per_second)
+    search_frames = int(search_seconds * frames_per_second)
+    window = max(1, int(min_silence_ms / frame_ms))
+    if total_frames <= target_frames + search_frames or target_frames <= 0:
+        return []
+
+    # quietness[i] is the mean energy of frames [i, i + window).
+    cumulative = np.concatenate(([0.0], np.cumsum(energy_db, dtype=np.float64)))
+    quietness = (cumulative[window:] - cumulative[:-window]) / window
+
+    cuts = []
+    previous = 0
+    while total_frames - previous > target_frames + search_frames:
+        low = previous + max(1, target_frames - search_frames)
+        high = min(previous + target_frames + search_frames, len(quietness))
+        if high > low:
+            best_start = low + int(np.argmin(quietness[low:high]))
+            cut = min(best_start + window // 2, total_frames - 1)
+        else:
+            cut = previous + target_frames
+        cuts.append(round(cut / frames_per_second, 3))
+        previous = cut
+    return cuts
+
+
+def find_long_silences(
+    energy_db: np.ndarray,
+    min_silence_seconds: float,
+    frame_ms: int = ANALYSIS_FRAME_MS,
+    threshold_db: float | None = None,
+) -> list[tuple[float, float]]:
+    """
+    Returns (start, end) seconds of every pause at least `min_silence_seconds` long.
+    Frames below `threshold_db` count as silent; by default the threshold sits 12 dB
+    above the recording's noise floor (10th percentile), capped at -30 dBFS.
+    """
+    if len(energy_db) == 0:
+        return []
+    if threshold_db is None:
+        threshold_db = min(float(np.percentile(energy_db, 10)) + 12.0, -30.0)
+
+    silent = np.concatenate(([False], energy_db < threshold_db, [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    min_frames = int(min_silence_seconds * 1000 / frame_ms)
+    long_runs = (ends - starts) >= min_frames
+    seconds_per_frame = frame_ms / 1000
+    return [(float(s * seconds_per_frame), float(e * seconds_per_frame)) for s, e in zip(starts[long_runs], ends[long_runs])]
+
+
+def plan_keep_intervals(silences: list[tuple[float, float]], total_seconds: float, keep_gap_seconds: float) -> list[tuple[float, float]]:
+    """
+    Turns long pauses into the list of original-time intervals to keep, so that each
+    pause is compressed to `keep_gap_seconds` (half kept on each side).
+    """
+    half_gap = keep_gap_seconds / 2
+    keep = []
+    position = 0.0
+    for start, end in silences:
+        cut_start, cut_end = start + half_gap, end - half_gap
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            keep.append((round(position, 3), round(cut_start, 3)))
+        position = cut_end
+    if total_seconds > position:
+        keep.append((round(position, 3), round(total_seconds, 3)))
+    return keep
+
+
+class TimeMap:
+    """
+    Maps timestamps of silence-trimmed audio back to the original recording.
+    Built from the ordered original-time intervals that were kept.
+    """
+
+    def __init__(self, keep_intervals: list[tuple[float, float]]):
+        self.keep_intervals = [tuple(interval) for interval in keep_intervals]
+        self.original_starts = [start for start, _ in self.keep_intervals]
+        self.trimmed_starts = []
+        trimmed_position = 0.0
+        for start, end in self.keep_intervals:
+            self.trimmed_starts.append(trimmed_position)
+            trimmed_position += end - start
+        self.trimmed_duration = trimmed_position
+
+    def to_original(self, trimmed_seconds: float) -> float:
+        if not self.keep_intervals:
+            return trimmed_seconds
+        index = max(0, bisect.bisect_right(self.trimmed_starts, trimmed_seconds) - 1)
+        return self.original_starts[index] + (trimmed_seconds - self.trimmed_starts[index])
+
+
+def analyze_audio_sync(
+    raw_file_path: str,
+    target_seconds: float | None = None,
+    search_seconds: float = 30.0,
+    trim_min_silence_seconds: float | None = None,
+    trim_keep_seconds: float = 0.5,
+) -> dict:
+    """
+    Runs one energy-analysis pass over the file and plans the segment pass from it.
+    With `trim_min_silence_seconds`, pauses at least that long are compressed to
+    `trim_keep_seconds`; with `target_seconds`, silence-aware cut points are planned
+    on the (possibly trimmed) timeline.
+    Returns {"segment_times", "keep_intervals", "original_duration_seconds"}.
+    """
+    energy_db = compute_frame_energy_sync(raw_file_path)
+    original_duration_seconds = len(energy_db) * ANALYSIS_FRAME_MS / 1000
+
+    keep_intervals = None
+    if trim_min_silence_seconds:
+        silences = find_long_silences(energy_db, trim_min_silence_seconds)
+        keep_intervals = plan_keep_intervals(silences, original_duration_seconds, trim_keep_seconds) or None
+    if keep_intervals:
+        frame_times = np.arange(len(energy_db)) * (ANALYSIS_FRAME_MS / 1000)
+        # The intervals are ordered and disjoint: a frame is kept if it falls before the
+        # end of the last interval starting at or before it.
+        starts = np.array([start for start, _ in keep_intervals])
+        ends = np.array([end for _, end in keep_intervals])
+        interval = np.searchsorted(starts, frame_times, side="right") - 1
+        kept = (interval >= 0) & (frame_times < ends[np.maximum(interval, 0)])
+        energy_db = energy_db[kept]
+        logging.info(
+            f"Silence trimming for {raw_file_path}: {original_duration_seconds:.1f}s -> "
+            f"{len(energy_db) * ANALYSIS_FRAME_MS / 1000:.1f}s in {len(keep_intervals)} interval(s)"
+        )
+    elif trim_min_silence_seconds:
+        # An all-silent file, or no pause kept at all, would leave nothing to send.
+        logging.info(f"Silence trimming for {raw_file_path} would keep nothing, sending it untrimmed.")
+
+    segment_times = []
+    if target_seconds:
+        segment_times = plan_chunk_boundaries(energy_db, target_seconds, search_seconds)
+        logging.info(f"Planned {len(segment_times)} silence-aware cut(s) for {raw_file_path}: {segment_times}")
+
+    return {
+        "segment_times": segment_times,
+        "keep_intervals": keep_intervals,
+        "original_duration_seconds": original_duration_seconds,
+    }
+
+
+def build_segment_args(
+    raw_file_path: str,
+    chunk_path_prefix: str,
+    chunk_length_seconds: int,
+    segment_times: list[float] | None = None,
+    keep_intervals: list[tuple[float, float]] | None = None,
+    profile: str = DEFAULT_ENCODING_PROFILE,
+) -> tuple[list[str], str, list[str]]:
+    """
+    Builds the ffmpeg arguments for a single-pass segmenting run (see segment_audio_sync)
+    encoding chunks with `profile`, and writes the silence-trimming filter script if needed.
+    Returns (args, segment_list_path, temp_paths) where temp_paths must be removed afterwards.
+    """
+    segment_list_path = f"{chunk_path_prefix}_manifest.csv"
+    filter_script_path = f"{chunk_path_prefix}_filter.txt" if keep_intervals else None
+    if filter_script_path:
+        _write_trim_filter_script(keep_intervals, filter_script_path)
+    if segment_times:
+        split_args = ["-segment_times", ",".join(f"{t:.3f}" for t in segment_times)]
+    else:
+        split_args = ["-segment_time", str(chunk_length_seconds)]
+
+    args = [
+        "-y", "-i", raw_file_path,
+        *encoding_args(profile, filter_script_path),
+        "-f", "segment",
+        *split_args,
+        "-reset_timestamps", "1",
+        "-segment_list", segment_list_path,
+        "-segment_list_type", "csv",
+        "-progress", "pipe:1", "-nostats",
+        f"{chunk_path_prefix}_%03d.{get_encoding_profile(profile)['extension']}",
+    ]
+    temp_paths = [path for path in (segment_list_path, filter_script_path) if path]
+    return args, segment_list_path, temp_paths
+
+
+def describe_audio_error(error: Exception) -> str:
+    """Returns the user-facing (Persian) message for a failed ffmpeg run."""
+    if isinstance(error, AudioProcessingError) and error.is_decode_error:
+        return "فایل صوتی فرمت ناشناخته یا خرابی دارد و قابل پردازش نیست."
+    if isinstance(error, FileNotFoundError):
+        return "ابزار ffmpeg روی سرور یافت نشد."
+    return f"خطا در پردازش فایل: {str(error)}"
+
+
+def remove_temp_files(paths: list[str]):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def segment_audio_sync(
+    raw_file_path: str,
+    chunk_path_prefix: str,
+    chunk_length_seconds: int,
+    segment_times: list[float] | None = None,
+    keep_intervals: list[tuple[float, float]] | None = None,
+    profile: str = DEFAULT_ENCODING_PROFILE,
+) -> tuple:
+    """
+    Synchronous function that turns the original download into mono transcription chunks
+    encoded with `profile` (see ENCODING_PROFILES) in a single ffmpeg pass. Resampling, downmixing, gain, encoding
+    and segmenting are streamed by ffmpeg, so every chunk is encoded exactly once and
+    memory use does not grow with the input length. Chunks are cut every
+    `chunk_length_seconds`, or at the explicit `segment_times` when given. With
+    `keep_intervals` only those original-time ranges are encoded (silence trimming),
+    and chunk offsets refer to the trimmed timeline.
+    Returns (success: bool, error_msg: str or None, original_length_ms: int or None,
+    chunks: list[dict]) where each chunk has index, path, start_seconds and duration_seconds.
+    """
+    if not os.path.exists(raw_file_path):
+        return False, "فایل دانلود شده یافت نشد – لطفا مجددا تلاش کنید.", None, []
+
+    temp_paths = []
+    try:
+        args, segment_list_path, temp_paths = build_segment_args(
+            raw_file_path, chunk_path_prefix, chunk_length_seconds, segment_times, keep_intervals, profile
+        )
+        result = run_ffmpeg(args)
+        chunks = read_segment_manifest(segment_list_path, os.path.dirname(chunk_path_prefix))
+        original_length_ms = parse_progress_out_time_ms(result.stdout)
+        logging.info(f"Segmented {raw_file_path} into {len(chunks)} chunk(s), length: {original_length_ms} ms")
+        return True, None, original_length_ms, chunks
+
+    except Exception as e:
+        return False, describe_audio_error(e), None, []
+    finally:
+        remove_temp_files(temp_paths)
+
+
+def remove_chunk_files(chunk_path_prefix: str):
+    """
+    Deletes every chunk file written for `chunk_path_prefix`, including segments an
+    interrupted ffmpeg run never reported in its manifest.
+    """
+    extensions = {settings["extension"] for settings in ENCODING_PROFILES.values()}
+    paths = [path for extension in extensions for path in glob.glob(f"{glob.escape(chunk_path_prefix)}_*.{extension}")]
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"Failed to delete chunk {path}: {e}")
@@ -0,0 +1,277 @@
+# batch_transcription.py
+import os
+import time
+import asyncio
+import logging
+import datetime
+from datetime import UTC
+
+import config
+from prompts import TRANSCRIBER_PROMPT, TRANSCRIBER_SRT_PROMPT
+from ai_services import submit_transcription_batch_async, get_transcription_batch_async, delete_uploaded_files_async
+from audio_processing import segment_audio_sync, remove_chunk_files, estimate_audio_job_memory, TimeMap
+from limiter import is_transient_error
+from texts import Texts
+from utils import merge_srt_chunks, ProgressReporter
+from transcription import (
+    get_transcription_jobs, update_transcription_job, finish_transcription_job,
+    record_job_chunk, get_job_chunks, BotStatusMessage
+)
+from jobs import (
+    download_media_file, probe_billing_duration, get_credit_minutes,
+    plan_transcription_chunks, run_transcription_job
+)
+from send_scheduler import RESULT_TRAFFIC
+from telegram.ext import CallbackContext
+
+
+class BatchTranscriptionBackend:
+    """
+    Interface of an offline transcription backend. `submit` hands over every chunk of a
+    job at once and returns an opaque batch name and the names of any files it uploaded,
+    both stored with the job; the chunk files are deleted once it returns. `poll` is
+    called periodically with that name, also after a restart, and `release` once the
+    batch has finished either way.
+    """
+    name = "base"
+
+    async def submit(self, chunks: list[dict], model: str, prompt: str, display_name: str) -> tuple[str, list[str]]:
+        raise NotImplementedError
+
+    async def poll(self, batch_name: str) -> dict:
+        """
+        Returns {"state": "running"}, {"state": "succeeded", "results": [...]} with one
+        {"transcription"} or {"error"} dictionary per submitted chunk in order, or
+        {"state": "failed", "error"}.
+        """
+        raise NotImplementedError
+
+    async def release(self, files: list[str]):
+        """Deletes the files `submit` uploaded."""
+
+
+class GeminiBatchBackend(BatchTranscriptionBackend):
+    """Gemini Batch API: slower turnaround, but off the interactive request limits."""
+    name = "gemini"
+
+    async def submit(self, chunks: list[dict], model: str, prompt: str, display_name: str) -> tuple[str, list[str]]:
+        return await submit_transcription_batch_async(chunks, model, prompt, display_name)
+
+    async def poll(self, batch_name: str) -> dict:
+        return await get_transcription_batch_async(batch_name)
+
+    async def release(self, files: list[str]):
+        await delete_uploaded_files_async(files)
+
+
+class LocalStubBatchBackend(BatchTranscriptionBackend):
+    """
+    Offline stand-in that never calls an API: a batch "finishes" BATCH_STUB_DELAY_SECONDS
+    after submission with a placeholder transcript per chunk. The state lives in the
+    batch name itself, so polling keeps working across restarts.
+    """
+    name = "local"
+
+    async def submit(self, chunks: list[dict], model: str, prompt: str, display_name: str) -> tuple[str, list[str]]:
+        return f"local:{len(chunks)}:{time.time():.0f}:{display_name}", []
+
+    async def poll(self, batch_name: str) -> dict:
+        _, chunk_count, submitted_at, _ = batch_name.split(":", 3)
+        if time.time() - float(submitted_at) < config.BATCH_STUB_DELAY_SECONDS:
+            return {"state": "running"}
+        return {
+            "state": "succeeded",
+            "results": [{"transcription": f"[stub transcript {index + 1}]"} for index in range(int(chunk_count))],
+        }
+
+
+BATCH_BACKENDS = {
+    GeminiBatchBackend.name: GeminiBatchBackend,
+    LocalStubBatchBackend.name: LocalStubBatchBackend,
+}
+
+
+def get_batch_backend() -> BatchTranscriptionBackend:
+    return BATCH_BACKENDS[config.BATCH_TRANSCRIPTION_BACKEND]()
+
+
+async def submit_batch_job(application, backend: BatchTranscriptionBackend, job: dict):
+    """
+    Downloads, credit-checks and segments a QUEUED job and submits all its chunks in one
+    batch. The job becomes SUBMITTED with the backend's batch name.
+    """
+    job_id = job["id"]
+    status_message = ProgressReporter(BotStatusMessage(application.bot, job["chat_id"], job["status_message_id"]))
+    context = CallbackContext(application, chat_id=job["chat_id"], user_id=job["user_id"])
+
+    downloads_dir = os.path.join(os.getcwd(), "downloads")
+    os.makedirs(downloads_dir, exist_ok=True)
+    original_extension = os.path.splitext(job["original_filename"] or "")[1] or '.tmp'
+    local_file_path = os.path.join(downloads_dir, f"batch_{job['file_unique_id']}_{job_id}{original_extension}")
+    chunk_path_prefix = os.path.join(downloads_dir, f"chunk_batch_{job_id}")
+
+    try:
+        await download_media_file(
+            context,
+            job["chat_id"],
+            job["original_message_id"],
+            job["file_id"],
+            job["file_size"],
+            local_file_path
+        )
+        chunk_plan = job["chunk_plan"]
+        if chunk_plan is None:
+            billed_seconds = await probe_billing_duration(local_file_path, job["duration_seconds"])
+            credit_minutes = get_credit_minutes(job["user_id"])
+            if credit_minutes is not None and billed_seconds / 60.0 > credit_minutes:
+                finish_transcription_job(job_id, "FAILED", "insufficient credit")
+                await status_message.edit_text(Texts.User.CREDIT_INSUFFICIENT.format(
+                    current_credit=credit_minutes,
+                    cost=billed_seconds / 60.0
+                ), rate_limit_args=RESULT_TRAFFIC)
+                return
+            chunk_plan = await plan_transcription_chunks(local_file_path, billed_seconds)
+        keep_intervals = [tuple(interval) for interval in chunk_plan["keep_intervals"]] if chunk_plan["keep_intervals"] else None
+
+        loop = asyncio.get_running_loop()
+        memory_bytes = estimate_audio_job_memory(
+            job["duration_seconds"], chunk_plan.get("sample_rate"), chunk_plan.get("channels")
+        )
+        async with config.audio_memory_budget.reserve(memory_bytes):
+            success, error_msg, original_length_ms, chunks = await loop.run_in_executor(
+                config.AUDIO_PROCESS_EXECUTOR,
+                segment_audio_sync,
+                local_file_path,
+                chunk_path_prefix,
+                chunk_plan["chunk_length_seconds"],
+                chunk_plan["segment_times"],
+                keep_intervals,
+                config.AUDIO_ENCODING_PROFILE
+            )
+        if not success:
+            finish_transcription_job(job_id, "FAILED", error_msg)
+            await status_message.edit_text(Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=error_msg), rate_limit_args=RESULT_TRAFFIC)
+            return
+
+        if chunk_plan["original_duration_seconds"]:
+            original_length_ms = int(chunk_plan["original_duration_seconds"] * 1000)
+        for chunk in chunks:
+            record_job_chunk(job_id, chunk)
+
+        prompt = TRANSCRIBER_SRT_PROMPT if job["output_kind"] == "video_srt" else TRANSCRIBER_PROMPT
+        batch_name, batch_files = await backend.submit(chunks, config.TRANSCRIPTION_MODEL, prompt, f"job-{job_id}")
+        fields = {"status": "SUBMITTED", "batch_name": batch_name, "batch_files": batch_files, "chunk_plan": chunk_plan}
+        if original_length_ms:
+            fields["cost_minutes"] = original_length_ms / 60000
+        update_transcription_job(job_id, **fields)
+        logging.info(f"Batch job {job_id}: submitted {len(chunks)} chunk(s) to {backend.name} as {batch_name}.")
+        await status_message.edit_text(Texts.User.BATCH_SUBMITTED, rate_limit_args=RESULT_TRAFFIC)
+    finally:
+        remove_chunk_files(chunk_path_prefix)
+        if os.path.exists(local_file_path):
+            os.remove(local_file_path)
+        await status_message.flush()
+
+
+async def poll_batch_job(application, backend: BatchTranscriptionBackend, job: dict):
+    """
+    Polls a SUBMITTED job. When the batch is done, stores the chunk transcripts and
+    starts run_transcription_job, which charges and delivers it like any interactive
+    transcription.
+    """
+    job_id = job["id"]
+    outcome = await backend.poll(job["batch_name"])
+    if outcome["state"] == "running":
+        return
+    if job["batch_files"]:
+        await backend.release(job["batch_files"])
+        update_transcription_job(job_id, batch_files=[])
+
+    status_message = ProgressReporter(BotStatusMessage(application.bot, job["chat_id"], job["status_message_id"]))
+    chunks = get_job_chunks(job_id)
+    results = outcome.get("results") or []
+    errors = [result["error"] for result in results if result.get("error")]
+    if outcome["state"] == "failed" or errors or len(results) != len(chunks):
+        error = outcome.get("error") or (errors[0] if errors else f"expected {len(chunks)} results, got {len(results)}")
+        logging.error(f"Batch job {job_id} failed: {error}")
+        finish_transcription_job(job_id, "FAILED", error)
+        await status_message.edit_text(Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=error), rate_limit_args=RESULT_TRAFFIC)
+        await status_message.flush()
+        return
+
+    transcripts = []
+    for chunk, result in zip(chunks, results):
+        transcripts.append(result.get("transcription", ""))
+        record_job_chunk(job_id, chunk, transcripts[-1])
+    if job["output_kind"] == "video_srt":
+        keep_intervals = job["chunk_plan"]["keep_intervals"]
+        time_map = TimeMap([tuple(interval) for interval in keep_intervals]) if keep_intervals else None
+        transcript = merge_srt_chunks(chunks, transcripts, time_map)
+    else:
+        transcript = " ".join(transcripts).strip()
+
+    update_transcription_job(job_id, status="TRANSCRIBED", transcript=transcript)
+    context = CallbackContext(application, chat_id=job["chat_id"], user_id=job["user_id"])
+    # Delivered in its own task so a large result doesn't hold up polling the other jobs.
+    application.create_task(run_transcription_job(context, job_id, status_message))
+
+
+async def run_batch_step(application, backend: BatchTranscriptionBackend, job: dict, step):
+    """
+    Runs `step` (submit_batch_job or poll_batch_job) for one job. A transient failure
+    leaves the job as it is for the next pass; any other failure fails the job.
+    """
+    try:
+        await step(application, backend, job)
+    except Exception as e:
+        logging.error(f"Batch transcription step failed for job {job['id']}: {e}", exc_info=True)
+        if is_transient_error(e):
+            return  # Retried on the next pass.
+        finish_transcription_job(job["id"], "FAILED", str(e))
+        status_message = BotStatusMessage(application.bot, job["chat_id"], job["status_message_id"])
+        try:
+            await status_message.edit_text(Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=e))
+        except Exception as edit_error:
+            logging.warning(f"Failed to update status message of batch job {job['id']}: {edit_error}")
+
+
+async def expire_draft_jobs(application):
+    """Fails DRAFT jobs whose mode wasn't chosen within BATCH_MODE_CHOICE_TIMEOUT_MINUTES."""
+    deadline = datetime.datetime.now(UTC) - datetime.timedelta(minutes=config.BATCH_MODE_CHOICE_TIMEOUT_MINUTES)
+    expired = [job for job in get_transcription_jobs(("DRAFT",)) if job["created_at"].replace(tzinfo=UTC) < deadline]
+    # Failed before anything is awaited, so a choice made meanwhile can't be overwritten.
+    for job in expired:
+        finish_transcription_job(job["id"], "FAILED", "mode choice expired")
+    for job in expired:
+        if job["status_message_id"] is None:
+            continue
+        status_message = BotStatusMessage(application.bot, job["chat_id"], job["status_message_id"])
+        try:
+            await status_message.edit_text(Texts.Errors.TRANSCRIPTION_MODE_EXPIRED)
+        except Exception as e:
+            logging.warning(f"Failed to update the mode prompt of job {job['id']}: {e}")
+
+
+async def run_batch_transcription_loop(application):
+    """
+    Background task started with the bot: every BATCH_POLL_SECONDS it expires unanswered
+    DRAFT jobs, submits QUEUED "deliver later" jobs and polls SUBMITTED ones. A submit
+    downloads and segments the whole file, so each runs as its own task (the segment
+    passes are bounded by the audio memory budget) and a long one doesn't hold up polling
+    and delivery of the others. All state is in the database, so jobs continue where
+    they were after a restart.
+    """
+    backend = get_batch_backend()
+    logging.info(f"Batch transcription loop started with the '{backend.name}' backend.")
+    submitting: dict[int, asyncio.Task] = {}
+    while True:
+        await expire_draft_jobs(application)
+        for job in get_transcription_jobs(("QUEUED", "SUBMITTED")):
+            if job["status"] == "QUEUED":
+                if job["id"] not in submitting:
+                    task = application.create_task(run_batch_step(application, backend, job, submit_batch_job))
+                    submitting[job["id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["id"]: submitting.pop(job_id, None))
+            else:
+                await run_batch_step(application, backend, job, poll_batch_job)
+        await asyncio.sleep(config.BATCH_POLL_SECONDS)
@@ -0,0 +1,88 @@
+# benchmarks/bench_chunk_boundaries.py
+"""
+Benchmarks the silence-aware chunk boundary planner on synthetic multi-hour inputs.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_chunk_boundaries --hours 1 3 6 --chunk-minutes 5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from audio_processing import (
+    ANALYSIS_FRAME_MS,
+    ANALYSIS_SAMPLE_RATE,
+    frame_energy_db,
+    plan_chunk_boundaries,
+)
+
+
+def synthetic_speech_envelope(hours: float, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds a per-frame energy envelope alternating speech bursts (1-8 s, around -20 dBFS)
+    and pauses (0.15-2 s, around -60 dBFS). Returns (energy_db, is_silence).
+    """
+    frames_per_second = 1000 // ANALYSIS_FRAME_MS
+    total_frames = int(hours * 3600 * frames_per_second)
+    is_silence = np.zeros(total_frames, dtype=bool)
+    position = 0
+    while position < total_frames:
+        position += int(rng.uniform(1.0, 8.0) * frames_per_second)
+        pause = int(rng.uniform(0.15, 2.0) * frames_per_second)
+        is_silence[position:position + pause] = True
+        position += pause
+    energy_db = np.where(is_silence, -60.0, -20.0) + rng.normal(0.0, 4.0, total_frames)
+    return energy_db.astype(np.float32), is_silence
+
+
+def cut_in_silence_ratio(cuts: list[float], is_silence: np.ndarray) -> float:
+    if not cuts:
+        return 1.0
+    frames_per_second = 1000 / ANALYSIS_FRAME_MS
+    indices = np.minimum((np.asarray(cuts) * frames_per_second).astype(int), len(is_silence) - 1)
+    return float(np.mean(is_silence[indices]))
+
+
+def bench_energy(hours: float, rng: np.random.Generator) -> float:
+    """Times frame energy extraction over `hours` of 8 kHz PCM fed in 10 second blocks."""
+    frame_samples = ANALYSIS_SAMPLE_RATE * ANALYSIS_FRAME_MS // 1000
+    block = rng.integers(-8000, 8000, ANALYSIS_SAMPLE_RATE * 10, dtype=np.int16)
+    blocks = int(hours * 360)
+    start = time.perf_counter()
+    for _ in range(blocks):
+        frame_energy_db(block, frame_samples)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark silence-aware chunk boundary planning.")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1.0, 3.0, 6.0])
+    parser.add_argument("--chunk-minutes", type=float, default=5.0)
+    parser.add_argument("--search-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    target_seconds = args.chunk_minutes * 60
+    print(f"{'hours':>6} {'energy s':>9} {'plan ms':>8} {'cuts':>5} {'silent cuts':>12} {'fixed silent':>13} {'max chunk s':>12}")
+    for hours in args.hours:
+        energy_seconds = bench_energy(hours, rng)
+        energy_db, is_silence = synthetic_speech_envelope(hours, rng)
+
+        start = time.perf_counter()
+        cuts = plan_chunk_boundaries(energy_db, target_seconds, args.search_seconds)
+        plan_ms = (time.perf_counter() - start) * 1000
+
+        fixed_cuts = list(np.arange(target_seconds, hours * 3600, target_seconds))
+        edges = [0.0, *cuts, hours * 3600]
+        max_chunk = max(b - a for a, b in zip(edges, edges[1:]))
+        print(
+            f"{hours:>6.1f} {energy_seconds:>9.2f} {plan_ms:>8.1f} {len(cuts):>5} "
+            f"{cut_in_silence_ratio(cuts, is_silence):>12.1%} "
+            f"{cut_in_silence_ratio(fixed_cuts, is_silence):>13.1%} {max_chunk:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
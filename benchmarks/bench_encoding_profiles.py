@@ -0,0 +1,118 @@
+# benchmarks/bench_encoding_profiles.py
+"""
+Compares the audio encoding profiles on a corpus of sample recordings: encode CPU time,
+output size (upload cost) and audio seconds encoded per CPU-second (throughput per
+core), plus an end-to-end estimate of encoding followed by upload at a given bandwidth.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_encoding_profiles samples/ --upload-mbps 20 --repeat 3
+"""
+import argparse
+import csv
+import os
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+
+from audio_processing import (
+    ENCODING_PROFILES,
+    FFMPEG_BINARY,
+    encoding_args,
+    probe_duration_sync,
+)
+
+AUDIO_EXTENSIONS = {".mp3", ".oga", ".ogg", ".opus", ".m4a", ".aac", ".wav", ".flac", ".mp4", ".mkv", ".webm"}
+
+
+def collect_corpus(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def encode_once(input_path: str, profile: str, output_path: str) -> tuple[float, float, int]:
+    """Encodes the whole file with `profile` exactly as the segment pass would. Returns (wall s, cpu s, bytes)."""
+    command = [FFMPEG_BINARY, "-hide_banner", "-nostdin", "-v", "error", "-y", "-i", input_path,
+               *encoding_args(profile), output_path]
+    cpu_before = children_cpu_seconds()
+    start = time.perf_counter()
+    subprocess.run(command, check=True, capture_output=True)
+    wall = time.perf_counter() - start
+    return wall, children_cpu_seconds() - cpu_before, os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio encoding profiles on sample files.")
+    parser.add_argument("corpus", nargs="+", help="Audio/video files or directories of them.")
+    parser.add_argument("--profiles", nargs="+", default=list(ENCODING_PROFILES), choices=list(ENCODING_PROFILES))
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per file and profile; the median is reported.")
+    parser.add_argument("--upload-mbps", type=float, default=20.0, help="Upload bandwidth used for the end-to-end estimate.")
+    parser.add_argument("--csv", help="Also write per-file results to this CSV file.")
+    args = parser.parse_args()
+
+    files = collect_corpus(args.corpus)
+    if not files:
+        parser.error("no sample files found")
+    durations = {path: probe_duration_sync(path) for path in files}
+    total_audio = sum(durations.values())
+    print(f"{len(files)} file(s), {total_audio / 60:.1f} min of audio, upload at {args.upload_mbps} Mbit/s\n")
+
+    rows = []
+    totals = {profile: {"wall": 0.0, "cpu": 0.0, "bytes": 0} for profile in args.profiles}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for path in files:
+            for profile in args.profiles:
+                extension = ENCODING_PROFILES[profile]["extension"]
+                output_path = os.path.join(output_dir, f"out.{extension}")
+                runs = [encode_once(path, profile, output_path) for _ in range(args.repeat)]
+                wall = statistics.median(run[0] for run in runs)
+                cpu = statistics.median(run[1] for run in runs)
+                size = runs[-1][2]
+                totals[profile]["wall"] += wall
+                totals[profile]["cpu"] += cpu
+                totals[profile]["bytes"] += size
+                rows.append({
+                    "file": os.path.basename(path),
+                    "profile": profile,
+                    "audio_seconds": round(durations[path], 2),
+                    "encode_wall_seconds": round(wall, 3),
+                    "encode_cpu_seconds": round(cpu, 3),
+                    "output_bytes": size,
+                })
+
+    print(f"{'profile':>10} {'cpu s':>8} {'wall s':>8} {'MB':>8} {'KB/min':>8} {'x rt/core':>10} {'upload s':>9} {'e2e s':>8}")
+    estimates = {}
+    for profile, total in totals.items():
+        upload_seconds = total["bytes"] * 8 / (args.upload_mbps * 1_000_000)
+        estimates[profile] = total["wall"] + upload_seconds
+        per_core = total_audio / total["cpu"] if total["cpu"] else float("inf")
+        print(
+            f"{profile:>10} {total['cpu']:>8.2f} {total['wall']:>8.2f} {total['bytes'] / 1e6:>8.2f} "
+            f"{total['bytes'] / 1024 / (total_audio / 60):>8.1f} {per_core:>10.0f} "
+            f"{upload_seconds:>9.2f} {estimates[profile]:>8.2f}"
+        )
+    best = min(estimates, key=estimates.get)
+    print(f"\nLowest encode + upload time: {best} (set AUDIO_ENCODING_PROFILE={best})")
+
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# benchmarks/bench_update_latency.py
+"""
+Compares update-to-handler latency of polling and webhook mode against a local fake
+Bot API. The fake API timestamps each update as it "receives" it, then either hands it
+to the bot's getUpdates long poll or POSTs it to the bot's webhook server (webhook.py,
+with the secret-token check) the way Telegram does. A handler records the time until
+the update reaches it. Network latency to Telegram isn't part of the numbers; what's
+left is the cost of each delivery path inside the bot.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_update_latency --updates 1000 --rate 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from telegram.ext import Application, MessageHandler, filters
+
+from webhook import build_webhook_server, SECRET_TOKEN_HEADER
+
+TOKEN = "123456:BENCHMARK"
+SECRET_TOKEN = "benchmark-secret"
+WEBHOOK_PATH = "/telegram"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+
+class FakeBotApi:
+    """
+    Just enough of the Bot API for an Application to start, poll and register a
+    webhook. Every other method succeeds without doing anything.
+    """
+
+    def __init__(self, max_connections: int):
+        self.pending: list[dict] = []
+        self.new_update = asyncio.Event()
+        self.webhook_url: str | None = None
+        self.secret_token: str | None = None
+        self.injected_at: dict[int, float] = {}
+        self.failed_deliveries = 0
+        self._next_update_id = 1
+        self._deliveries = asyncio.Semaphore(max_connections)
+        self._delivery_tasks: set[asyncio.Task] = set()
+        self._client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=max_connections))
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/bot{token}/{method}", self.handle, methods=["GET", "POST"])])
+
+    async def handle(self, request: Request) -> JSONResponse:
+        params = {}
+        for key, values in parse_qs((await request.body()).decode()).items():
+            try:
+                params[key] = json.loads(values[0])
+            except ValueError:
+                params[key] = values[0]
+        method = request.path_params["method"]
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method == "setWebhook":
+            self.webhook_url = params["url"]
+            self.secret_token = params.get("secret_token")
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            result = True
+        else:
+            result = True
+        return JSONResponse({"ok": True, "result": result})
+
+    async def get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        self.pending = [update for update in self.pending if update["update_id"] >= offset]
+        if not self.pending:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:int(params.get("limit") or 100)]
+
+    def inject(self):
+        """A user sends the bot a message."""
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        update = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": 1, "type": "private", "first_name": "User"},
+                "from": {"id": 1, "is_bot": False, "first_name": "User"},
+                "text": "ping",
+            },
+        }
+        self.injected_at[update_id] = time.perf_counter()
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver(update))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+        else:
+            self.pending.append(update)
+            self.new_update.set()
+
+    async def _deliver(self, update: dict):
+        async with self._deliveries:
+            headers = {SECRET_TOKEN_HEADER: self.secret_token} if self.secret_token else {}
+            response = await self._client.post(self.webhook_url, json=update, headers=headers)
+            if response.status_code != 200:
+                self.failed_deliveries += 1
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class LatencyRecorder:
+    def __init__(self, api: FakeBotApi):
+        self.api = api
+        self.latencies: list[float] = []
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    async def handle(self, update, context):
+        self.latencies.append(time.perf_counter() - self.api.injected_at[update.update_id])
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+    async def measure(self, count: int, rate: float) -> list[float]:
+        """Injects `count` updates at `rate` per second and waits until all were handled."""
+        self.latencies = []
+        self.expected = count
+        self.done.clear()
+        start = time.perf_counter()
+        for index in range(count):
+            self.api.inject()
+            delay = start + (index + 1) / rate - time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+        await asyncio.wait_for(self.done.wait(), timeout=60)
+        return self.latencies
+
+
+async def start_server(server: uvicorn.Server) -> asyncio.Task:
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return task
+
+
+async def stop_server(server: uvicorn.Server, task: asyncio.Task):
+    server.should_exit = True
+    await task
+
+
+async def run_mode(mode: str, api: FakeBotApi, args) -> list[float]:
+    builder = Application.builder().token(TOKEN).base_url(f"http://127.0.0.1:{args.api_port}/bot").concurrent_updates(True)
+    if mode == "webhook":
+        builder.updater(None)
+    application = builder.build()
+    recorder = LatencyRecorder(api)
+    application.add_handler(MessageHandler(filters.TEXT, recorder.handle))
+
+    async with application:
+        server = server_task = None
+        if mode == "polling":
+            await application.updater.start_polling(poll_interval=args.poll_interval, timeout=10, drop_pending_updates=True)
+        else:
+            server = build_webhook_server(application, "127.0.0.1", args.webhook_port, WEBHOOK_PATH, SECRET_TOKEN)
+            server_task = await start_server(server)
+            await application.bot.set_webhook(
+                url=f"http://127.0.0.1:{args.webhook_port}{WEBHOOK_PATH}",
+                secret_token=SECRET_TOKEN,
+                max_connections=args.max_connections,
+            )
+        await application.start()
+        try:
+            await recorder.measure(args.warmup, args.rate)
+            return await recorder.measure(args.updates, args.rate)
+        finally:
+            if mode == "polling":
+                await application.updater.stop()
+            else:
+                await application.bot.delete_webhook()
+                await stop_server(server, server_task)
+            await application.stop()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    api = FakeBotApi(args.max_connections)
+    api_server = uvicorn.Server(uvicorn.Config(api.app(), host="127.0.0.1", port=args.api_port, log_level="warning", access_log=False))
+    api_task = await start_server(api_server)
+    results = {}
+    try:
+        for mode in args.modes:
+            results[mode] = await run_mode(mode, api, args)
+    finally:
+        await stop_server(api_server, api_task)
+        await api.close()
+
+    print(f"{args.updates} updates per mode at {args.rate:.0f}/s after {args.warmup} warmup updates\n")
+    print(f"{'mode':>8} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode, latencies in results.items():
+        ms = [latency * 1000 for latency in latencies]
+        print(
+            f"{mode:>8} {statistics.mean(ms):>8.2f} {percentile(ms, 0.5):>8.2f} {percentile(ms, 0.9):>8.2f} "
+            f"{percentile(ms, 0.99):>8.2f} {max(ms):>8.2f}"
+        )
+    if api.failed_deliveries:
+        print(f"\n{api.failed_deliveries} webhook deliveries were not answered with 200.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark update latency of polling vs webhook mode.")
+    parser.add_argument("--modes", nargs="+", default=["polling", "webhook"], choices=["polling", "webhook"])
+    parser.add_argument("--updates", type=int, default=1000, help="Measured updates per mode.")
+    parser.add_argument("--warmup", type=int, default=50, help="Updates sent first and not measured.")
+    parser.add_argument("--rate", type=float, default=200.0, help="Updates per second sent by the fake API.")
+    parser.add_argument("--poll-interval", type=float, default=0.0, help="Updater poll interval in polling mode.")
+    parser.add_argument("--max-connections", type=int, default=40, help="Parallel webhook deliveries, as in setWebhook.")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,10 @@ import asyncio
 
 from telethon import TelegramClient
 from google import genai
-from google.genai import types
+
+from limiter import AdaptiveConcurrencyLimiter, MemoryBudget
+from audio_processing import get_encoding_profile
+from token_estimator import TokenEstimator, TokenCountCache
 
 load_dotenv()
 
@@ -45,10 +48,141 @@ MAX_AUDIO_DURATION_SECONDS = int(os.getenv('MAX_AUDIO_DURATION_SECONDS', 10800))
 TTS_FARSI_TOKEN_PER_MINUTE_EST = int(os.getenv('TTS_FARSI_TOKEN_PER_MINUTE_EST', 200)) 
 TTS_MAX_DURATION_MINUTE = int(os.getenv('TTS_MAX_DURATION_MINUTE', 10))  
 
-TRANSCRIPTION_EXECUTOR = ThreadPoolExecutor(max_workers=2000, thread_name_prefix="transcription_worker")
-TOKEN_COUNTING_EXECUTOR = ThreadPoolExecutor(max_workers=100, thread_name_prefix="token_counter")
-TEXT_PROCESS_EXECUTOR = ThreadPoolExecutor(max_workers=500, thread_name_prefix="text_processor")
-AUDIO_PROCESS_EXECUTOR = ThreadPoolExecutor(max_workers=10, thread_name_prefix="audio_processor")
+# Gemini calls run on the event loop through the SDK's asyncio client. Each budget
+# starts at its *_CONCURRENCY and adapts (AIMD) between 1 and twice that value.
+TOKEN_COUNTING_CONCURRENCY = int(os.getenv('TOKEN_COUNTING_CONCURRENCY', 100))
+TEXT_PROCESS_CONCURRENCY = int(os.getenv('TEXT_PROCESS_CONCURRENCY', 100))
+TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', 20))
+token_counting_limiter = AdaptiveConcurrencyLimiter("token_counting", TOKEN_COUNTING_CONCURRENCY, 2 * TOKEN_COUNTING_CONCURRENCY)
+text_process_limiter = AdaptiveConcurrencyLimiter("text_actions", TEXT_PROCESS_CONCURRENCY, 2 * TEXT_PROCESS_CONCURRENCY)
+tts_limiter = AdaptiveConcurrencyLimiter("tts", TTS_CONCURRENCY, 2 * TTS_CONCURRENCY)
+
+# Outbound Bot API traffic goes through send_scheduler.TelegramSendScheduler: at most
+# TELEGRAM_GLOBAL_SENDS_PER_SECOND message sends/edits overall, TELEGRAM_CHAT_SENDS_PER_SECOND
+# per private chat and TELEGRAM_GROUP_SENDS_PER_MINUTE per group (bursts of TELEGRAM_CHAT_BURST).
+# Flood waits are retried up to TELEGRAM_SEND_MAX_RETRIES times.
+TELEGRAM_GLOBAL_SENDS_PER_SECOND = float(os.getenv('TELEGRAM_GLOBAL_SENDS_PER_SECOND', 30))
+TELEGRAM_CHAT_SENDS_PER_SECOND = float(os.getenv('TELEGRAM_CHAT_SENDS_PER_SECOND', 1))
+TELEGRAM_GROUP_SENDS_PER_MINUTE = float(os.getenv('TELEGRAM_GROUP_SENDS_PER_MINUTE', 20))
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', 3))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv('TELEGRAM_SEND_MAX_RETRIES', 3))
+
+# How updates arrive: "polling" (getUpdates) or "webhook", served by uvicorn (webhook.py).
+# In webhook mode TLS ends at a reverse proxy that forwards WEBHOOK_URL + WEBHOOK_PATH
+# to WEBHOOK_LISTEN:WEBHOOK_PORT; requests must carry WEBHOOK_SECRET_TOKEN. With several
+# replicas behind a load balancer, set WEBHOOK_SET_ON_START=false on all but one.
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or None
+WEBHOOK_TRUSTED_PROXIES = os.getenv('WEBHOOK_TRUSTED_PROXIES', '127.0.0.1')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+WEBHOOK_SET_ON_START = os.getenv('WEBHOOK_SET_ON_START', 'true').lower() == 'true'
+if UPDATE_MODE not in ('polling', 'webhook'):
+    raise ValueError(f"Unknown UPDATE_MODE '{UPDATE_MODE}', expected 'polling' or 'webhook'.")
+if UPDATE_MODE == 'webhook' and (not WEBHOOK_URL.startswith('https://') or not WEBHOOK_SECRET_TOKEN):
+    raise ValueError("UPDATE_MODE=webhook needs an https:// WEBHOOK_URL and a WEBHOOK_SECRET_TOKEN.")
+
+# Status messages of long-running jobs are edited at most once per this many seconds
+# (utils.ProgressReporter); intermediate updates are merged.
+PROGRESS_MIN_INTERVAL_SECONDS = float(os.getenv('PROGRESS_MIN_INTERVAL_SECONDS', 3.0))
+
+# Text actions stream the model's reply into the processing message, edited at most once
+# per TEXT_STREAM_EDIT_INTERVAL_SECONDS; the formatted result is sent when it completes.
+TEXT_ACTION_STREAMING = os.getenv('TEXT_ACTION_STREAMING', 'true').lower() == 'true'
+TEXT_STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv('TEXT_STREAM_EDIT_INTERVAL_SECONDS', 1.5))
+
+# Token counts for cost estimates come from a local estimator calibrated on real Gemini
+# counts. Until its recent error is within TOKEN_ESTIMATE_MAX_ERROR, counts go to the
+# count_tokens API (unless TOKEN_ESTIMATOR_REMOTE_FALLBACK is off) and calibrate it.
+TOKEN_ESTIMATOR_ENABLED = os.getenv('TOKEN_ESTIMATOR_ENABLED', 'true').lower() == 'true'
+TOKEN_ESTIMATOR_REMOTE_FALLBACK = os.getenv('TOKEN_ESTIMATOR_REMOTE_FALLBACK', 'true').lower() == 'true'
+TOKEN_ESTIMATE_MAX_ERROR = float(os.getenv('TOKEN_ESTIMATE_MAX_ERROR', 0.1))
+TOKEN_ESTIMATOR_STATE_PATH = os.getenv('TOKEN_ESTIMATOR_STATE_PATH', 'persistent_data/token_estimator.json')
+token_estimator = TokenEstimator(max_relative_error=TOKEN_ESTIMATE_MAX_ERROR, state_path=TOKEN_ESTIMATOR_STATE_PATH)
+token_estimator.load()
+# Token counts memoized by text hash and model, shared by every caller of count_text_tokens_async.
+TOKEN_COUNT_CACHE_MAX_ENTRIES = int(os.getenv('TOKEN_COUNT_CACHE_MAX_ENTRIES', 20000))
+TOKEN_COUNT_CACHE_MAX_MB = float(os.getenv('TOKEN_COUNT_CACHE_MAX_MB', 8))
+token_count_cache = TokenCountCache(TOKEN_COUNT_CACHE_MAX_ENTRIES, int(TOKEN_COUNT_CACHE_MAX_MB * 1024 * 1024))
+# Audio jobs are ffmpeg subprocesses with bounded memory, so many can run at once.
+AUDIO_PROCESS_WORKERS = int(os.getenv('AUDIO_PROCESS_WORKERS', 32))
+AUDIO_PROCESS_EXECUTOR = ThreadPoolExecutor(max_workers=AUDIO_PROCESS_WORKERS, thread_name_prefix="audio_processor")
+# Audio jobs are admitted against this budget by their estimated peak memory
+# (audio_processing.estimate_audio_job_memory); the rest wait in a FIFO queue.
+AUDIO_MEMORY_BUDGET_MB = int(os.getenv('AUDIO_MEMORY_BUDGET_MB', 1024))
+audio_memory_budget = MemoryBudget("audio_memory", AUDIO_MEMORY_BUDGET_MB * 1024 * 1024)
+
+TRANSCRIPTION_MODEL = os.getenv('TRANSCRIPTION_MODEL', 'gemini-2.5-flash-preview-09-2025')
+# Audio up to this size is sent inline with the request instead of through the Files API
+# (Gemini caps a whole inline request at 20MB).
+INLINE_AUDIO_MAX_BYTES = int(os.getenv('INLINE_AUDIO_MAX_BYTES', 8 * 1024 * 1024))
+
+# Format of the chunks sent for transcription, a name from audio_processing.ENCODING_PROFILES
+# (mp3_32k, opus_16k, flac_16k); compare them with benchmarks/bench_encoding_profiles.py.
+AUDIO_ENCODING_PROFILE = os.getenv('AUDIO_ENCODING_PROFILE', 'mp3_32k')
+get_encoding_profile(AUDIO_ENCODING_PROFILE)
+
+# Single-chunk inputs matching this profile (Telegram voice notes are mono Opus in OGG)
+# are sent as downloaded instead of being re-encoded to the intermediate MP3.
+AUDIO_PASSTHROUGH_ENABLED = os.getenv('AUDIO_PASSTHROUGH_ENABLED', 'true').lower() == 'true'
+AUDIO_PASSTHROUGH_CODECS = [codec.strip() for codec in os.getenv('AUDIO_PASSTHROUGH_CODECS', 'opus,vorbis,mp3').split(',') if codec.strip()]
+AUDIO_PASSTHROUGH_MAX_CHANNELS = int(os.getenv('AUDIO_PASSTHROUGH_MAX_CHANNELS', 1))
+AUDIO_PASSTHROUGH_MAX_SAMPLE_RATE = int(os.getenv('AUDIO_PASSTHROUGH_MAX_SAMPLE_RATE', 48000))
+AUDIO_PASSTHROUGH_MAX_BITRATE = int(os.getenv('AUDIO_PASSTHROUGH_MAX_BITRATE', 96000))
+
+# Transcripts cached by file_unique_id, prompt and model. Off by default because it
+# stores transcripts; enabling it needs a matching update to Texts.User.PRIVACY.
+TRANSCRIPTION_CACHE_ENABLED = os.getenv('TRANSCRIPTION_CACHE_ENABLED', 'false').lower() == 'true'
+TRANSCRIPTION_CACHE_MAX_MB = int(os.getenv('TRANSCRIPTION_CACHE_MAX_MB', 200))
+TRANSCRIPTION_CACHE_MAX_AGE_DAYS = int(os.getenv('TRANSCRIPTION_CACHE_MAX_AGE_DAYS', 30))
+
+# Sends each finished part of a multi-chunk transcript as soon as it and all earlier
+# parts are done; the complete transcript is still delivered (and billed) at the end.
+INCREMENTAL_DELIVERY_ENABLED = os.getenv('INCREMENTAL_DELIVERY_ENABLED', 'false').lower() == 'true'
 
 MAX_CHUNK_LEN = 19
-CHUNK_SIZE = 10
\ No newline at end of file
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 5))
+
+# Long files are cut inside pauses near each CHUNK_SIZE boundary instead of at fixed offsets.
+SILENCE_AWARE_CHUNKING = os.getenv('SILENCE_AWARE_CHUNKING', 'true').lower() == 'true'
+CHUNK_BOUNDARY_SEARCH_SECONDS = int(os.getenv('CHUNK_BOUNDARY_SEARCH_SECONDS', 30))
+
+# Optional: pauses longer than SILENCE_TRIM_MIN_SECONDS are compressed before upload.
+SILENCE_TRIMMING = os.getenv('SILENCE_TRIMMING', 'false').lower() == 'true'
+SILENCE_TRIM_MIN_SECONDS = float(os.getenv('SILENCE_TRIM_MIN_SECONDS', 2.0))
+SILENCE_TRIM_KEEP_SECONDS = float(os.getenv('SILENCE_TRIM_KEEP_SECONDS', 0.5))
+
+# Chunks of one job are transcribed concurrently, bounded per job and across all jobs.
+TRANSCRIPTION_JOB_CONCURRENCY = int(os.getenv('TRANSCRIPTION_JOB_CONCURRENCY', 6))
+TRANSCRIPTION_GLOBAL_CONCURRENCY = int(os.getenv('TRANSCRIPTION_GLOBAL_CONCURRENCY', 64))
+transcription_limiter = AdaptiveConcurrencyLimiter("transcription", TRANSCRIPTION_GLOBAL_CONCURRENCY, 2 * TRANSCRIPTION_GLOBAL_CONCURRENCY)
+gemini_limiters = [transcription_limiter, text_process_limiter, tts_limiter, token_counting_limiter]
+
+# Transient chunk failures (429/5xx, timeouts) are retried with jittered exponential
+# backoff, at most TRANSCRIPTION_MAX_CHUNK_ATTEMPTS times per chunk and
+# TRANSCRIPTION_RETRY_BUDGET times per job.
+TRANSCRIPTION_MAX_CHUNK_ATTEMPTS = int(os.getenv('TRANSCRIPTION_MAX_CHUNK_ATTEMPTS', 4))
+TRANSCRIPTION_RETRY_BUDGET = int(os.getenv('TRANSCRIPTION_RETRY_BUDGET', 10))
+TRANSCRIPTION_RETRY_BASE_DELAY = float(os.getenv('TRANSCRIPTION_RETRY_BASE_DELAY', 2.0))
+TRANSCRIPTION_RETRY_MAX_DELAY = float(os.getenv('TRANSCRIPTION_RETRY_MAX_DELAY', 30.0))
+
+# Transcription jobs interrupted by a restart are resumed on startup unless older than this.
+TRANSCRIPTION_JOB_RESUME_MAX_AGE_HOURS = int(os.getenv('TRANSCRIPTION_JOB_RESUME_MAX_AGE_HOURS', 24))
+
+# A job that fails transiently is run again after TRANSCRIPTION_JOB_RETRY_DELAY_SECONDS,
+# keeping its finished chunks, and only fails after TRANSCRIPTION_JOB_MAX_RUNS runs.
+TRANSCRIPTION_JOB_MAX_RUNS = int(os.getenv('TRANSCRIPTION_JOB_MAX_RUNS', 3))
+TRANSCRIPTION_JOB_RETRY_DELAY_SECONDS = int(os.getenv('TRANSCRIPTION_JOB_RETRY_DELAY_SECONDS', 60))
+
+# Opt-in "deliver later" mode: files of at least BATCH_TRANSCRIPTION_MIN_MINUTES can be
+# queued for an offline batch backend ("gemini" or the offline "local" stub).
+BATCH_TRANSCRIPTION_ENABLED = os.getenv('BATCH_TRANSCRIPTION_ENABLED', 'false').lower() == 'true'
+BATCH_TRANSCRIPTION_MIN_MINUTES = int(os.getenv('BATCH_TRANSCRIPTION_MIN_MINUTES', 60))
+BATCH_TRANSCRIPTION_BACKEND = os.getenv('BATCH_TRANSCRIPTION_BACKEND', 'gemini')
+BATCH_POLL_SECONDS = int(os.getenv('BATCH_POLL_SECONDS', 60))
+BATCH_STUB_DELAY_SECONDS = int(os.getenv('BATCH_STUB_DELAY_SECONDS', 30))
+# A file whose mode isn't chosen within this many minutes is dropped.
+BATCH_MODE_CHOICE_TIMEOUT_MINUTES = int(os.getenv('BATCH_MODE_CHOICE_TIMEOUT_MINUTES', 60))
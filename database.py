@@ -12,7 +12,10 @@ from sqlalchemy import (
     BigInteger,
     ForeignKey,
     Text,
+    UniqueConstraint,
     func,
+    inspect,
+    text,
 )
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 
@@ -75,6 +78,11 @@ class ActivityLog(Base):
         )
 
 class BatchJob(Base):
+    """
+    A durable transcription job. The source file reference, the chunk plan and the
+    status message are recorded up front and every finished chunk is stored in
+    BatchJobChunk, so a restarted bot resumes unfinished jobs instead of starting over.
+    """
     __tablename__ = "batch_jobs"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -82,7 +90,7 @@ class BatchJob(Base):
     user_id = Column(BigInteger, nullable=False)
     chat_id = Column(BigInteger, nullable=False)
     original_message_id = Column(Integer, nullable=False)
-    status = Column(String, default="PENDING", nullable=False)  # PENDING, SUCCEEDED, FAILED
+    status = Column(String, default="PENDING", nullable=False)  # DRAFT, QUEUED, SUBMITTED, PENDING, RUNNING, RETRYABLE, TRANSCRIBED, CHARGED, SUCCEEDED, FAILED
     cost_minutes = Column(Float, nullable=False)
     original_filename = Column(String, nullable=True)
     # created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -90,13 +98,89 @@ class BatchJob(Base):
     
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    status_message_id = Column(Integer, nullable=True)
+    output_kind = Column(String, nullable=True)  # media, video_raw, video_srt
+    file_id = Column(String, nullable=True)
+    file_unique_id = Column(String, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    duration_seconds = Column(Integer, nullable=True)
+    chunk_manifest = Column(Text, nullable=True)  # JSON chunk plan: chunk length, cut points, kept intervals
+    transcript = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    batch_name = Column(String, nullable=True)  # Offline backend batch for "deliver later" jobs
+    batch_files = Column(Text, nullable=True)  # JSON list of the files uploaded for the batch
+
+    chunks = relationship("BatchJobChunk", back_populates="job", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<BatchJob(id={self.id}, user_id={self.user_id}, kind='{self.output_kind}', status='{self.status}')>"
+
+class BatchJobChunk(Base):
+    """One chunk of a BatchJob: its place on the timeline and, once done, its transcript."""
+    __tablename__ = "batch_job_chunks"
+    __table_args__ = (UniqueConstraint("job_id", "chunk_index"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("batch_jobs.id"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    start_seconds = Column(Float, nullable=False)
+    duration_seconds = Column(Float, nullable=False)
+    status = Column(String, default="PENDING", nullable=False)  # PENDING, DONE
+    transcript = Column(Text, nullable=True)
+
+    job = relationship("BatchJob", back_populates="chunks")
+
+class TranscriptionCache(Base):
+    """
+    Cached transcripts keyed by Telegram file_unique_id, prompt hash and model.
+    Entries are evicted by age and by total transcript size.
+    """
+    __tablename__ = "transcription_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True, nullable=False)
+    file_unique_id = Column(String, nullable=False, index=True)
+    prompt_hash = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    transcript = Column(Text, nullable=False)
+    duration_seconds = Column(Float, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(UTC), nullable=False)
+    last_accessed_at = Column(DateTime, default=lambda: datetime.datetime.now(UTC), nullable=False, index=True)
+
+    def __repr__(self):
+        return (
+            f"<TranscriptionCache(file_unique_id='{self.file_unique_id}', model='{self.model}', "
+            f"size={self.size_bytes}, hits={self.hit_count})>"
+        )
+
 # --- Database Initialization ---
+def add_missing_columns():
+    """
+    Adds nullable columns that were introduced after a table was created.
+    create_all() never alters existing tables, so older databases need this.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"Added column {table.name}.{column.name}")
+
 def create_db_and_tables():
     """
     Creates the database and all tables if they don't already exist.
     """
     try:
         print("Initializing database and creating tables...")
+        add_missing_columns()
         Base.metadata.create_all(bind=engine)
         print("Database and tables created successfully (if they didn't exist).")
     except Exception as e:
@@ -9,20 +9,15 @@ import asyncio
 from asyncio import TimeoutError as AsyncioTimeoutError
 import jdatetime
 import pytz
-import math
 from sqlalchemy import desc
 
 from functools import wraps
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 
 import config
 from prompts import (
-    TRANSCRIBER_PROMPT, 
     ACTIONS_PROMPT_MAPPING, 
-    ACTIONS_MAX_TOKENS_MAPPING,
-    TRANSCRIBER_SRT_PROMPT
+    ACTIONS_MAX_TOKENS_MAPPING
 )
 
 
@@ -40,21 +35,25 @@ from telegram.constants import ParseMode
 # Import from our modules
 import config
 from ai_services import (
-    count_text_tokens,
-    process_text_with_gemini,
-    transcribe_audio_google_sync,
-    generate_speech_gemini
+    count_text_tokens_async,
+    process_text_with_gemini_async,
+    stream_text_with_gemini_async,
+    generate_speech_gemini_async
 )
 from database import SessionLocal, User, ActivityLog
 from texts import Texts
 from utils import (
-    convert_md_to_html, deliver_transcription_result, 
+    convert_md_to_html, deliver_transcription_result,
     log_activity, check_user_status,
-    get_action_keyboard, ensure_telethon_client,
+    get_action_keyboard,
     create_word_document, extract_text_from_docx,
-    preprocess_audio_sync, deliver_srt_file,
-    get_tts_keyboard 
+    get_tts_keyboard, StreamingMessage
 )
+from transcription import (
+    active_pipeline_stats, create_transcription_job, get_transcription_job, update_transcription_job
+)
+from jobs import run_transcription_job
+from send_scheduler import TelegramSendScheduler, ADMIN_TRAFFIC
 
 admin_user_id = config.ADMIN_USER_ID
 
@@ -91,13 +90,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logging.info(f"Received text input from user {update.effective_user.id}. Length: {len(text)} chars.")
     context.user_data['last_text'] = text
 
-    loop = asyncio.get_event_loop()
-    input_text_tokens = await loop.run_in_executor(
-        config.TOKEN_COUNTING_EXECUTOR,
-        count_text_tokens,
-        text,
-        "gemini-2.0-flash-lite"
-    )    
+    input_text_tokens = await count_text_tokens_async(text, "gemini-2.0-flash-lite")
     action1_estimated_minutes = (input_text_tokens + 500) / config.TEXT_TOKENS_TO_MINUTES_COEFF
     action2_estimated_minutes = (input_text_tokens + 2000) / config.TEXT_TOKENS_TO_MINUTES_COEFF
     action3_estimated_minutes = (input_text_tokens + 1000) / config.TEXT_TOKENS_TO_MINUTES_COEFF
@@ -136,13 +129,7 @@ async def handle_text_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         os.remove(file_path)
         context.user_data['last_text'] = text
 
-        loop = asyncio.get_event_loop()
-        input_text_tokens = await loop.run_in_executor(
-            config.TOKEN_COUNTING_EXECUTOR,
-            count_text_tokens,
-            text,
-            "gemini-2.0-flash-lite"
-        )    
+        input_text_tokens = await count_text_tokens_async(text, "gemini-2.0-flash-lite")
         action1_estimated_minutes = (input_text_tokens + 500) / config.TEXT_TOKENS_TO_MINUTES_COEFF
         action2_estimated_minutes = (input_text_tokens + 2000) / config.TEXT_TOKENS_TO_MINUTES_COEFF
         action3_estimated_minutes = (input_text_tokens + 1000) / config.TEXT_TOKENS_TO_MINUTES_COEFF
@@ -187,7 +174,6 @@ async def handle_media_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     duration_seconds = file_object.duration
     cost_minutes = duration_seconds / 60.0
-    duration_minutes = duration_seconds / 60.0 
 
     if cost_minutes > db_user.credit_minutes:
         await message.reply_text(
@@ -199,6 +185,32 @@ async def handle_media_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     duration_str = f"{duration_seconds // 60:02d}:{ duration_seconds % 60:02d}"
+    job_fields = dict(
+        user_id=db_user.user_id,
+        chat_id=message.chat_id,
+        original_message_id=message.message_id,
+        output_kind="media",
+        file_id=file_object.file_id,
+        file_unique_id=file_object.file_unique_id,
+        file_size=file_object.file_size,
+        duration_seconds=duration_seconds,
+        original_filename=original_filename
+    )
+
+    if config.BATCH_TRANSCRIPTION_ENABLED and duration_seconds >= config.BATCH_TRANSCRIPTION_MIN_MINUTES * 60:
+        # Long files may go to the offline batch backend; the user picks the mode.
+        job_id = create_transcription_job(status_message_id=None, status="DRAFT", **job_fields)
+        keyboard = [
+            [InlineKeyboardButton(Texts.User.TRANSCRIPTION_MODE_NOW, callback_data=f"job_now:{job_id}")],
+            [InlineKeyboardButton(Texts.User.TRANSCRIPTION_MODE_LATER, callback_data=f"job_later:{job_id}")]
+        ]
+        choice_message = await message.reply_text(
+            Texts.User.TRANSCRIPTION_MODE_PROMPT.format(duration=duration_str),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        update_transcription_job(job_id, status_message_id=choice_message.message_id)
+        return
+
     status_message = await message.reply_text(
         Texts.User.MEDIA_PROCESSING_MSG.format(
             duration = duration_str,
@@ -208,214 +220,38 @@ async def handle_media_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     )
 
-    downloads_dir = os.path.join(os.getcwd(), "downloads")
-    os.makedirs(downloads_dir, exist_ok=True)
-
-    original_extension = os.path.splitext(original_filename)[1] or '.tmp'
-    local_file_path = os.path.join(downloads_dir, f"downloaded_{file_object.file_unique_id}{original_extension}")    
-    processed_audio_path = f"downloads/converted_{file_object.file_unique_id}.mp3"
+    job_id = create_transcription_job(status_message_id=status_message.message_id, **job_fields)
+    await run_transcription_job(context, job_id, status_message)
 
-    try:
-        logging.info(f"Downloading Audio file. Size: {file_object.file_size} bytes.")
 
-        if file_object.file_size > config.TELEGRAM_MAX_BOT_API_FILE_SIZE:
-            logging.info("File is larger than 20MB, using Telethon for download.")
-            client = await ensure_telethon_client()
-            logging.info(f"Starting download using file_id: {file_object.file_id}")
+async def transcription_mode_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the "now" / "deliver later" choice for a long file."""
+    query = update.callback_query
+    await query.answer()
 
-            telethon_message = await client.get_messages(entity=message.chat_id, ids=message.message_id)
-            if not telethon_message or not (telethon_message.audio or telethon_message.voice or telethon_message.video or telethon_message.document):
-                raise ValueError("Could not find media in message via Telethon.")
-            await client.download_media(telethon_message, file=local_file_path)
-        else:
-            logging.info("File is smaller than 20MB, using Bot API for download.")
-            bot_file = await context.bot.get_file(file_object.file_id)
-            await bot_file.download_to_drive(local_file_path)
-
-        await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "آغاز شد...",
-                transcription = "..."
-            ))                        
-
-        loop = asyncio.get_event_loop()
-        success, error_msg, original_length_ms = await loop.run_in_executor(
-            config.AUDIO_PROCESS_EXECUTOR,
-            preprocess_audio_sync,
-            local_file_path,
-            processed_audio_path
-        )
-        if not success:
-            await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                    duration = duration_str,
-                    download = "✅",
-                    process = f"خطا در آماده‌سازی فایل: {error_msg}",
-                    transcription = "..."
-                ))              
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
-            if os.path.exists(processed_audio_path):
-                os.remove(processed_audio_path)
-            return
+    mode, job_id_str = query.data.split(":")
+    job = get_transcription_job(int(job_id_str))
+    if not job or job["user_id"] != query.from_user.id or job["status"] != "DRAFT":
+        await query.edit_message_text(Texts.Errors.TRANSCRIPTION_MODE_EXPIRED)
+        return
 
-        if original_length_ms:
-            refined_duration_seconds = original_length_ms / 1000
-            duration_str = f"{original_length_ms // 60000:02d}:{(original_length_ms // 1000) % 60:02d}"
-            cost_minutes = refined_duration_seconds / 60.0  
-
-        await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "✅",
-                transcription = "آغاز شد..."
-            ))  
-        full_transcript = ""
-        loop = asyncio.get_event_loop()
-
-        if duration_minutes > config.MAX_CHUNK_LEN:
-            # Chunking mode
-            processed_audio = await loop.run_in_executor(
-                config.AUDIO_PROCESS_EXECUTOR,
-                AudioSegment.from_file,
-                processed_audio_path
-            )
+    if mode == "job_later":
+        update_transcription_job(job["id"], status="QUEUED")
+        await query.edit_message_text(Texts.User.BATCH_QUEUED)
+        return
 
-            chunk_length_ms = config.CHUNK_SIZE * 60 * 1000
-            total_length_ms = len(processed_audio)
-            num_chunks = math.ceil(total_length_ms / chunk_length_ms)
-            logging.info(f"duration_minutes: {duration_minutes} (MAX_CHUNK_LEN: {config.MAX_CHUNK_LEN}), We need to chunk file, num_chunks: {num_chunks}")
-            
-            for i in range(num_chunks):
-                progress = int(100 * (i+1) / num_chunks)
-                logging.info(f"Prcessing chunk: {i+1} from {num_chunks}, progress: {progress}")
-
-                await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                        duration = duration_str,
-                        download = "✅",
-                        process = "✅",
-                        transcription = str(progress) + " %"
-                    ))
-                
-                start_ms = i * chunk_length_ms
-                end_ms = min(start_ms + chunk_length_ms, total_length_ms)
-                chunk = processed_audio[start_ms:end_ms] 
-                chunk_path = os.path.join(downloads_dir, f"temp_chunk_{file_object.file_unique_id}_{i+1}.mp3")
-                chunk.export(chunk_path, format="mp3", bitrate="32k")
-                
-                chunk_duration = int(duration_seconds / num_chunks)
-                transcription_result_dict = await loop.run_in_executor(
-                    config.TRANSCRIPTION_EXECUTOR,
-                    transcribe_audio_google_sync,
-                    chunk_path,
-                    chunk_duration,
-                    "gemini-2.5-flash-preview-09-2025",
-                    TRANSCRIBER_PROMPT,
-                )
-                
-                if transcription_result_dict.get("error"):
-                    await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                            duration = duration_str,
-                            download = "✅",
-                            process = "✅",
-                            transcription = Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=transcription_result_dict['error'])
-                        ))                    
-                    return
-
-                chunk_transcript = transcription_result_dict.get("transcription", "")
-                full_transcript += chunk_transcript + " "
-                os.remove(chunk_path)
-
-            os.remove(processed_audio_path)
-        else:
-            # No chunking: Transcribe the single file
-            logging.info(f"duration_minutes: {duration_minutes} (MAX_CHUNK_LEN: {config.MAX_CHUNK_LEN}), No chunking is needed.")
-            await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                    duration = duration_str,
-                    download = "✅",
-                    process = "✅",
-                    transcription="در حال شروع..."
-                ))              
-            transcription_result_dict = await loop.run_in_executor(
-                config.TRANSCRIPTION_EXECUTOR,
-                transcribe_audio_google_sync,
-                processed_audio_path,
-                duration_seconds,
-                "gemini-2.5-flash-preview-09-2025",
-                TRANSCRIBER_PROMPT,
-            )
-            
-            if transcription_result_dict.get("error"):
-                await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                        duration = duration_str,
-                        download = "✅",
-                        process = "✅",
-                        transcription = Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=transcription_result_dict['error'])
-                    ))                  
-                return
-            
-            full_transcript = transcription_result_dict.get("transcription", "")
-            
-            # Cleanup
-            os.remove(processed_audio_path)
-        
-        raw_transcript = full_transcript.strip()
-        language = db_user.preferred_language
-        logging.info(f"Transcription successful. Length: {len(raw_transcript)} chars")
-
-        await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "✅",
-                transcription = "✅"
-            ))   
-        
-        # Credit Deduction & Logging
-        db = SessionLocal()
-        try:
-            user_to_update = db.query(User).filter(User.user_id == db_user.user_id).first()
-            if user_to_update:
-                user_to_update.credit_minutes -= cost_minutes
-                db.commit()
-                log_activity(
-                    db=db,
-                    user_id=user_to_update.user_id,
-                    action='transcription',
-                    credit_change=-cost_minutes,
-                    details=f"Media duration: {duration_seconds:.2f}s, File: {original_filename}"
-                )
-                db.refresh(user_to_update)
-                logging.info(f"Deducted {cost_minutes:.2f} minutes from user {db_user.user_id}. New balance: {user_to_update.credit_minutes:.2f}")
-                context.user_data['db_user'] = user_to_update
-            else:
-                logging.error(f"Could not find user {db_user.user_id} to deduct credit.")
-        finally:
-            db.close()
+    update_transcription_job(job["id"], status="PENDING")
+    duration_seconds = job["duration_seconds"]
+    status_message = await query.edit_message_text(
+        Texts.User.MEDIA_PROCESSING_MSG.format(
+            duration = f"{duration_seconds // 60:02d}:{ duration_seconds % 60:02d}",
+            download = "آغاز شد...",
+            process = "...",
+            transcription = "..."
+        )
+    )
+    await run_transcription_job(context, job["id"], status_message)
 
-        source_info = {
-            'type': 'media',
-            'cost': cost_minutes,
-            'language':language
-        }
-        await deliver_transcription_result(update, context, raw_transcript, source_info)
-        
-    except CouldntDecodeError:
-        logging.error(f"Pydub/FFmpeg could not decode the file: {local_file_path}", exc_info=True)
-        await status_message.edit_text("خطا: فایل ارسال شده فرمت ناشناخته یا خرابی دارد و قابل پردازش نیست.")
-    except Exception as e:
-        logging.error(f"An error occurred in handle_media_file: {e}", exc_info=True)
-        error_msg = str(e)
-        if "Message is too long" in error_msg:
-            error_msg = Texts.Errors.OUTPUT_TOO_LONG
-        await status_message.edit_text(Texts.Errors.GENERIC_UNEXPECTED.format(error=error_msg))        
-    finally:
-        for file_path in [local_file_path, processed_audio_path]:
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logging.info(f"Cleaned up: {file_path}")
-                except Exception as cleanup_error:
-                    logging.warning(f"Failed to delete {file_path}: {cleanup_error}")
 
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -455,13 +291,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
         # --- TTS LOGIC ---
         if action  in ['text_to_speech', 'tts_from_result']:
             # 1. Calculate cost based on the input text
-            loop = asyncio.get_event_loop()
-            input_tokens = await loop.run_in_executor(
-                config.TOKEN_COUNTING_EXECUTOR,
-                count_text_tokens,
-                text_to_process,
-                "gemini-2.0-flash-lite"
-            )
+            input_tokens = await count_text_tokens_async(text_to_process, "gemini-2.0-flash-lite")
             # Cost is based on action3's formula, multiplied by 4
 
             
@@ -484,11 +314,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
                 )
                 return
 
-            result_dict = await loop.run_in_executor(
-                config.TEXT_PROCESS_EXECUTOR,
-                generate_speech_gemini,
-                text_to_process
-            )
+            result_dict = await generate_speech_gemini_async(text_to_process)
 
             if result_dict.get("error"):
                 await processing_message.edit_text(f"خطا در تبدیل متن به صوت: {result_dict['error']}")
@@ -531,13 +357,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
         full_prompt = prompt_template.format(text=text_to_process)
         max_tokens = ACTIONS_MAX_TOKENS_MAPPING.get(action)
 
-        loop = asyncio.get_event_loop()
-        estimated_input_tokens = await loop.run_in_executor(
-            config.TOKEN_COUNTING_EXECUTOR,
-            count_text_tokens,
-            full_prompt,
-            "gemini-2.0-flash-lite"
-        )   
+        estimated_input_tokens = await count_text_tokens_async(full_prompt, "gemini-2.0-flash-lite")
 
         estimated_tokens = estimated_input_tokens + max_tokens
         cost_minutes =  estimated_tokens / config.TEXT_TOKENS_TO_MINUTES_COEFF
@@ -550,14 +370,29 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
             )
             return
 
-        loop = asyncio.get_event_loop()
-        result_dict = await loop.run_in_executor(
-            config.TEXT_PROCESS_EXECUTOR,
-            process_text_with_gemini,
-            full_prompt,
-            "gemini-2.5-flash-lite-preview-09-2025",
-            max_tokens
-        )
+        if config.TEXT_ACTION_STREAMING:
+            # The reply grows in the processing message; the formatted result replaces it below.
+            stream_view = StreamingMessage(
+                processing_message,
+                Texts.User.PROCESSING_ACTION.format(action_text=button_text),
+                config.TEXT_STREAM_EDIT_INTERVAL_SECONDS
+            )
+            try:
+                result_dict = await stream_text_with_gemini_async(
+                    full_prompt,
+                    "gemini-2.5-flash-lite-preview-09-2025",
+                    max_tokens,
+                    on_text=stream_view.update
+                )
+            finally:
+                # No preview edit may land after the final edit below.
+                await stream_view.close()
+        else:
+            result_dict = await process_text_with_gemini_async(
+                full_prompt,
+                "gemini-2.5-flash-lite-preview-09-2025",
+                max_tokens
+            )
         
         if result_dict.get("error"):
             await processing_message.edit_text(Texts.Errors.TEXT_PROCESS_FAILED.format(error=result_dict['error']))
@@ -692,7 +527,6 @@ async def handle_video_callback(update, context):
     duration_seconds = file_data['duration_seconds']
     original_message_id = file_data['original_message_id'] 
 
-    cost_minutes = int(duration_seconds / 60.0 )
     db_user = context.user_data['db_user']
    
     duration_str = f"{duration_seconds // 60:02d}:{ duration_seconds % 60:02d}"
@@ -706,189 +540,19 @@ async def handle_video_callback(update, context):
         )
     )
 
-    downloads_dir = os.path.join(os.getcwd(), "downloads")
-    os.makedirs(downloads_dir, exist_ok=True)
-    
-    local_file_path = os.path.join(downloads_dir, f"video_{file_id}.mp4")
-    processed_audio_path = os.path.join(downloads_dir, f"processed_{file_id}.mp3")
-    
-    try:       
-        logging.info(f"Downloading Video file. Size: {file_size} bytes.")
-
-        if file_size > config.TELEGRAM_MAX_BOT_API_FILE_SIZE:
-            logging.info("Video file is larger than 20MB, using Telethon for download.")
-            client = await ensure_telethon_client()
-            logging.info(f"Starting download using file_id: {file_id}")
-            
-            # telethon_message = await client.get_messages(entity=update.effective_chat.id, ids=query.message.message_id)
-            telethon_message = await client.get_messages(entity=query.message.chat_id, ids=original_message_id)
-            
-            if not telethon_message or not (telethon_message.audio or telethon_message.voice or telethon_message.video or telethon_message.document):
-                logging.error(f"Telethon could not find media: chat={query.message.chat_id}, msg_id={original_message_id}")
-                raise ValueError("Could not find media in message via Telethon.")
-            await client.download_media(telethon_message, file=local_file_path)
-        else:
-            logging.info("Video file is smaller than 20MB, using Bot API for download.")
-            bot_file = await context.bot.get_file(file_id)
-            await bot_file.download_to_drive(local_file_path) 
-
-        await status_message.edit_text(
-            Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "شروع شد...",
-                transcription = "..."
-            )
-        )
-        loop = asyncio.get_event_loop()
-        success, error_msg, original_length_ms = await loop.run_in_executor(
-            config.AUDIO_PROCESS_EXECUTOR, 
-            preprocess_audio_sync, 
-            local_file_path, 
-            processed_audio_path
-        )
-
-        if not success:
-            # await status_message.edit_text(f"خطا در پردازش ویدیو: {error_msg}")
-            await status_message.edit_text(
-                Texts.User.MEDIA_PROCESSING_MSG.format(
-                    duration = duration_str,
-                    download = "✅",
-                    process = f"خطا در آماده‌سازی فایل: {error_msg}",
-                    transcription = "..."
-                )
-            )            
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
-            if os.path.exists(processed_audio_path):
-                os.remove(processed_audio_path)            
-            return
-        
-        if original_length_ms:
-            refined_duration_seconds = original_length_ms / 1000
-            duration_str = f"{original_length_ms // 60000:02d}:{(original_length_ms // 1000) % 60:02d}"
-            cost_minutes = refined_duration_seconds / 60.0  # Update cost for precision
-
-        # await status_message.edit_text(f"ویدیو پردازش شد (طول: {duration_str}). در حال رونویسی...")
-        await status_message.edit_text(
-            Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "✅",
-                transcription = "شروع شد...",
-            )
-        )  
-
-        full_transcript = ""
-        duration_minutes = duration_seconds / 60.0
-        
-        if duration_minutes > config.MAX_CHUNK_LEN:
-            processed_audio = AudioSegment.from_file(processed_audio_path)
-            chunk_length_ms = config.CHUNK_SIZE * 60 * 1000
-            total_length_ms = len(processed_audio)
-            num_chunks = math.ceil(total_length_ms / chunk_length_ms)
-            
-            for i in range(num_chunks):
-                progress = int(100 * (i+1) / num_chunks)
-                logging.info(f"Prcessing chunk: {i+1} from {num_chunks}, progress: {progress}")
-                await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                        duration = duration_str,
-                        download = "✅",
-                        process = "✅",
-                        transcription = str(progress) + " %"
-                    ))
-                                                
-                start_ms = i * chunk_length_ms
-                end_ms = min(start_ms + chunk_length_ms, total_length_ms)
-                chunk = processed_audio[start_ms:end_ms]
-                chunk_path = f"downloads/temp_chunk_{file_id}_{i+1}.mp3"
-                chunk.export(chunk_path, format="mp3", bitrate="32k")
-                
-                prompt = TRANSCRIBER_SRT_PROMPT if action == "video_srt" else TRANSCRIBER_PROMPT
-                chunk_duration = int(duration_seconds / num_chunks)
-                transcription_result_dict = await loop.run_in_executor(
-                    config.TRANSCRIPTION_EXECUTOR, 
-                    transcribe_audio_google_sync, 
-                    chunk_path, 
-                    chunk_duration, 
-                    "gemini-2.5-flash-preview-09-2025", 
-                    prompt
-                )
-                
-                if transcription_result_dict.get("error"):
-                    # await status_message.edit_text(f"خطا در رونویسی: {transcription_result_dict['error']}")
-                    await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                            duration = duration_str,
-                            download = "✅",
-                            process = "✅",
-                            transcription = Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=transcription_result_dict['error'])
-                        ))                      
-                    return
-                
-                full_transcript += transcription_result_dict.get("transcription", "") + " "
-                os.remove(chunk_path)
-            
-            os.remove(processed_audio_path)
-        else:
-            prompt = TRANSCRIBER_SRT_PROMPT if action == "video_srt" else TRANSCRIBER_PROMPT
-            await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                    duration = duration_str,
-                    download = "✅",
-                    process = "✅",
-                    transcription="در حال شروع..."
-                ))  
-            transcription_result_dict = await loop.run_in_executor(
-                config.TRANSCRIPTION_EXECUTOR, 
-                transcribe_audio_google_sync, 
-                processed_audio_path, 
-                duration_seconds, 
-                "gemini-2.5-flash-preview-09-2025", 
-                prompt
-            )
-            
-            if transcription_result_dict.get("error"):
-                # await status_message.edit_text(f"خطا در رونویسی: {transcription_result_dict['error']}")
-                # return
-                await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                        duration = duration_str,
-                        download = "✅",
-                        process = "✅",
-                        transcription = Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=transcription_result_dict['error'])
-                    ))                  
-                return
-                        
-            full_transcript = transcription_result_dict.get("transcription", "")
-            os.remove(processed_audio_path)
-        
-        os.remove(local_file_path)
-
-        await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
-                duration = duration_str,
-                download = "✅",
-                process = "✅",
-                transcription = "✅"
-            ))   
-                
-        if action == "video_srt":
-            # full_transcript = correct_srt_format(full_transcript)
-            await deliver_srt_file(update, context, full_transcript, user_file_name, cost_minutes)
-        else:
-            source_info = {'type': 'video_raw', 'cost': cost_minutes, 'language': db_user.preferred_language}
-            await deliver_transcription_result(update, context, full_transcript, source_info)
-        
-        db = SessionLocal()
-        user_to_update = db.query(User).filter(User.user_id == db_user.user_id).first()
-        if user_to_update:
-            user_to_update.credit_minutes -= cost_minutes
-            db.commit()
-        db.close()
-        
-    except Exception as e:
-        await status_message.edit_text(f"خطا: {str(e)}")
-    finally:
-        for f in [local_file_path, processed_audio_path]:
-            if os.path.exists(f):
-                os.remove(f)
+    job_id = create_transcription_job(
+        user_id=db_user.user_id,
+        chat_id=query.message.chat_id,
+        original_message_id=original_message_id,
+        status_message_id=status_message.message_id,
+        output_kind=action,
+        file_id=file_id,
+        file_unique_id=unique_key,
+        file_size=file_size,
+        duration_seconds=duration_seconds,
+        original_filename=user_file_name
+    )
+    await run_transcription_job(context, job_id, status_message)
 
 
 async def approval_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1082,7 +746,8 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
     for chunk in chunks:
         await context.bot.send_message(
-            chat_id=admin_user_id, text=chunk, parse_mode=ParseMode.HTML
+            chat_id=admin_user_id, text=chunk, parse_mode=ParseMode.HTML,
+            rate_limit_args=ADMIN_TRAFFIC
         )
 
 def admin_only(func):
@@ -1136,7 +801,10 @@ async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         limit = 4096
         for i in range(0, len(full_message), limit):
             chunk = full_message[i:i + limit]
-            await update.message.reply_text(chunk, parse_mode=ParseMode.HTML)
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, text=chunk, parse_mode=ParseMode.HTML,
+                rate_limit_args=ADMIN_TRAFFIC
+            )
             
     finally:
         db.close()
@@ -1527,4 +1195,32 @@ async def youtube_callback_handler(update: Update, context: ContextTypes.DEFAULT
             text=Texts.Errors.YOUTUBE_TRANSCRIPT_UNAVAILABLE_WORKAROUND,
             parse_mode=ParseMode.HTML,
             disable_web_page_preview=True
-        )
\ No newline at end of file
+        )
+
+
+@admin_only
+async def system_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the Gemini limiters, audio memory, token estimator, send queue and running pipelines."""
+    message_parts = [Texts.Admin.SYSTEM_STATS_HEADER]
+    for limiter in config.gemini_limiters:
+        message_parts.append(Texts.Admin.SYSTEM_STATS_LIMITER_ITEM.format(**limiter.stats()))
+    message_parts.append(Texts.Admin.SYSTEM_STATS_MEMORY_ITEM.format(**config.audio_memory_budget.stats()))
+    message_parts.append(Texts.Admin.SYSTEM_STATS_TOKENS_ITEM.format(**config.token_estimator.stats()))
+    message_parts.append(Texts.Admin.SYSTEM_STATS_TOKEN_CACHE_ITEM.format(**config.token_count_cache.stats()))
+    if isinstance(context.bot.rate_limiter, TelegramSendScheduler):
+        message_parts.append(Texts.Admin.SYSTEM_STATS_SEND_QUEUE_ITEM.format(**context.bot.rate_limiter.stats()))
+
+    message_parts.append(Texts.Admin.SYSTEM_STATS_PIPELINES_HEADER)
+    pipelines = active_pipeline_stats()
+    if not pipelines:
+        message_parts.append(Texts.Admin.SYSTEM_STATS_NO_PIPELINES)
+    for pipeline in pipelines:
+        message_parts.append(Texts.Admin.SYSTEM_STATS_PIPELINE_ITEM.format(**{**pipeline, "label": html.escape(pipeline["label"])}))
+
+    full_message = "".join(message_parts)
+    limit = 4096
+    for i in range(0, len(full_message), limit):
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id, text=full_message[i:i + limit], parse_mode=ParseMode.HTML,
+            rate_limit_args=ADMIN_TRAFFIC
+        )
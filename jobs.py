@@ -0,0 +1,521 @@
+# jobs.py
+import os
+import math
+import asyncio
+import logging
+import datetime
+from datetime import UTC
+
+from telegram.ext import ContextTypes, CallbackContext
+
+import config
+from prompts import TRANSCRIBER_PROMPT, TRANSCRIBER_SRT_PROMPT
+from database import SessionLocal, User, BatchJob
+from texts import Texts
+from utils import (
+    send_transcription_result, deliver_srt_file, merge_srt_chunks, send_transcript_part,
+    log_activity, ensure_telethon_client, ProgressReporter
+)
+from audio_processing import (
+    remove_chunk_files, analyze_audio_sync, probe_audio_sync, probe_duration_sync, passthrough_mime_type,
+    estimate_audio_job_memory, TimeMap, AudioProcessingError
+)
+from transcription import (
+    TranscriptionPipeline, segment_into_pipeline,
+    get_cached_transcription, store_cached_transcription,
+    make_transcription_cache_key, coalesce_transcription,
+    get_transcription_job, get_unfinished_transcription_jobs,
+    update_transcription_job, finish_transcription_job, get_job_chunk_transcripts,
+    record_job_chunk, BotStatusMessage
+)
+from limiter import is_transient_error
+from send_scheduler import RESULT_TRAFFIC
+
+
+async def download_media_file(context, chat_id: int, message_id: int, file_id: str, file_size: int, local_file_path: str):
+    """Downloads a media file through the Bot API, or through Telethon above the Bot API's 20MB limit."""
+    if file_size > config.TELEGRAM_MAX_BOT_API_FILE_SIZE:
+        logging.info("File is larger than 20MB, using Telethon for download.")
+        client = await ensure_telethon_client()
+        logging.info(f"Starting download using file_id: {file_id}")
+
+        telethon_message = await client.get_messages(entity=chat_id, ids=message_id)
+        if not telethon_message or not (telethon_message.audio or telethon_message.voice or telethon_message.video or telethon_message.document):
+            logging.error(f"Telethon could not find media: chat={chat_id}, msg_id={message_id}")
+            raise ValueError("Could not find media in message via Telethon.")
+        await client.download_media(telethon_message, file=local_file_path)
+    else:
+        logging.info("File is smaller than 20MB, using Bot API for download.")
+        bot_file = await context.bot.get_file(file_id)
+        await bot_file.download_to_drive(local_file_path)
+
+
+async def probe_billing_duration(local_file_path: str, fallback_seconds: float) -> float:
+    """Probed duration of a download, or `fallback_seconds` (Telegram's value) if it can't be probed."""
+    loop = asyncio.get_event_loop()
+    try:
+        async with config.audio_memory_budget.reserve(estimate_audio_job_memory(fallback_seconds)):
+            return await loop.run_in_executor(config.AUDIO_PROCESS_EXECUTOR, probe_duration_sync, local_file_path)
+    except Exception as e:
+        logging.warning(f"Could not measure the duration of {local_file_path}, using {fallback_seconds}s: {e}")
+        return fallback_seconds
+
+
+def get_credit_minutes(user_id: int) -> float | None:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        return user.credit_minutes if user else None
+    finally:
+        db.close()
+
+
+async def plan_transcription_chunks(local_file_path: str, duration_seconds: float) -> dict:
+    """
+    Decides how a downloaded file is cut (chunk length, cut points, kept intervals, or
+    passthrough as downloaded). Returns the JSON chunk plan stored with a job.
+    """
+    is_chunked = duration_seconds / 60.0 > config.MAX_CHUNK_LEN
+    if is_chunked:
+        chunk_length_seconds = config.CHUNK_SIZE * 60
+    else:
+        # A segment longer than any accepted file yields a single chunk.
+        chunk_length_seconds = 24 * 3600
+
+    loop = asyncio.get_event_loop()
+    try:
+        async with config.audio_memory_budget.reserve(estimate_audio_job_memory(duration_seconds)):
+            probe = await loop.run_in_executor(config.AUDIO_PROCESS_EXECUTOR, probe_audio_sync, local_file_path)
+    except Exception as e:
+        logging.warning(f"Probing {local_file_path} failed, transcoding it: {e}")
+        probe = None
+    stream = {
+        "sample_rate": probe["sample_rate"] if probe else None,
+        "channels": probe["channels"] if probe else None,
+    }
+
+    if probe and not is_chunked and config.AUDIO_PASSTHROUGH_ENABLED:
+        mime_type = passthrough_mime_type(
+            probe,
+            config.AUDIO_PASSTHROUGH_CODECS,
+            config.AUDIO_PASSTHROUGH_MAX_CHANNELS,
+            config.AUDIO_PASSTHROUGH_MAX_SAMPLE_RATE,
+            config.AUDIO_PASSTHROUGH_MAX_BITRATE
+        )
+        if mime_type:
+            logging.info(f"Passing {local_file_path} through without re-encoding: {probe}")
+            return {
+                "chunk_length_seconds": chunk_length_seconds,
+                "segment_times": None,
+                "keep_intervals": None,
+                "original_duration_seconds": duration_seconds,
+                "passthrough": True,
+                "mime_type": mime_type,
+                **stream,
+            }
+
+    plan_boundaries = is_chunked and config.SILENCE_AWARE_CHUNKING
+    analysis = None
+    if plan_boundaries or config.SILENCE_TRIMMING:
+        try:
+            async with config.audio_memory_budget.reserve(estimate_audio_job_memory(duration_seconds, **stream, analysis=True)):
+                analysis = await loop.run_in_executor(
+                    config.AUDIO_PROCESS_EXECUTOR,
+                    analyze_audio_sync,
+                    local_file_path,
+                    chunk_length_seconds if plan_boundaries else None,
+                    config.CHUNK_BOUNDARY_SEARCH_SECONDS,
+                    config.SILENCE_TRIM_MIN_SECONDS if config.SILENCE_TRIMMING else None,
+                    config.SILENCE_TRIM_KEEP_SECONDS
+                )
+        except Exception as e:
+            logging.warning(f"Silence analysis failed, continuing without it: {e}")
+    return {
+        "chunk_length_seconds": chunk_length_seconds,
+        "segment_times": analysis["segment_times"] if analysis else None,
+        "keep_intervals": analysis["keep_intervals"] if analysis else None,
+        "original_duration_seconds": analysis["original_duration_seconds"] if analysis else duration_seconds,
+        **stream,
+    }
+
+
+async def transcribe_downloaded_media(
+    status_message,
+    local_file_path: str,
+    chunk_path_prefix: str,
+    duration_seconds: int,
+    duration_str: str,
+    prompt: str,
+    srt: bool = False,
+    job_id: int | None = None,
+    credit_minutes: float | None = None,
+    on_part_ready=None
+) -> dict | None:
+    """
+    Plans, segments and transcribes a downloaded file, persisting chunks under `job_id`.
+    Returns {"transcription", "cost_minutes", "duration_str"}, {"rejected", "billed_seconds"}
+    if it costs more than `credit_minutes`, or {"error", "retryable"}; only a final error is shown.
+    """
+    def status_text(process: str, transcription: str) -> str:
+        return Texts.User.MEDIA_PROCESSING_MSG.format(
+            duration = duration_str,
+            download = "✅",
+            process = process,
+            transcription = transcription
+        )
+
+    await status_message.edit_text(status_text("آغاز شد...", "..."))
+
+    duration_minutes = duration_seconds / 60.0
+    job = get_transcription_job(job_id) if job_id else None
+    chunk_plan = job["chunk_plan"] if job else None
+    completed_transcripts = get_job_chunk_transcripts(job_id) if chunk_plan else {}
+
+    try:
+        if chunk_plan is None:
+            billed_seconds = await probe_billing_duration(local_file_path, duration_seconds)
+            if credit_minutes is not None and billed_seconds / 60.0 > credit_minutes:
+                logging.info(f"Not transcribing {local_file_path}: {billed_seconds:.1f}s exceeds the user's {credit_minutes:.2f} minutes.")
+                return {"rejected": True, "billed_seconds": billed_seconds}
+            chunk_plan = await plan_transcription_chunks(local_file_path, billed_seconds)
+            if job_id:
+                # Stored before any chunk is sent, so a resumed run cuts identical chunks.
+                update_transcription_job(job_id, status="RUNNING", chunk_plan=chunk_plan)
+        elif completed_transcripts:
+            logging.info(f"Resuming job {job_id} with {len(completed_transcripts)} chunk(s) already transcribed.")
+
+        chunk_length_seconds = chunk_plan["chunk_length_seconds"]
+        segment_times = chunk_plan["segment_times"]
+        keep_intervals = [tuple(interval) for interval in chunk_plan["keep_intervals"]] if chunk_plan["keep_intervals"] else None
+
+        if segment_times:
+            expected_chunks = len(segment_times) + 1
+        else:
+            expected_chunks = max(1, math.ceil(duration_seconds / chunk_length_seconds))
+
+        async def report_chunk_progress(completed, total):
+            progress = int(100 * completed / total)
+            process_state = "در حال انجام..." if pipeline.producing else "✅"
+            await status_message.edit_text(status_text(process_state, str(progress) + " %"))
+
+        pipeline = TranscriptionPipeline(
+            config.TRANSCRIPTION_MODEL,
+            prompt,
+            on_progress=report_chunk_progress if expected_chunks > 1 else None,
+            expected_chunks=expected_chunks,
+            label=os.path.basename(chunk_path_prefix),
+            completed_transcripts=completed_transcripts,
+            on_chunk_produced=(lambda chunk: record_job_chunk(job_id, chunk)) if job_id else None,
+            on_chunk_done=(lambda chunk, text: record_job_chunk(job_id, chunk, text)) if job_id else None,
+            on_part_ready=on_part_ready if expected_chunks > 1 else None
+        )
+
+        async def produce_chunks(pipeline):
+            if chunk_plan.get("passthrough"):
+                # The download itself is the only chunk; the job's finally block deletes it.
+                duration = chunk_plan["original_duration_seconds"] or duration_seconds
+                await pipeline.feed({
+                    "index": 0,
+                    "path": local_file_path,
+                    "start_seconds": 0.0,
+                    "duration_seconds": duration,
+                    "mime_type": chunk_plan["mime_type"],
+                })
+                return int(duration * 1000)
+            # Held for the whole encode, as long as the ffmpeg process lives.
+            memory_bytes = estimate_audio_job_memory(
+                duration_seconds, chunk_plan.get("sample_rate"), chunk_plan.get("channels")
+            )
+            async with config.audio_memory_budget.reserve(memory_bytes):
+                return await segment_into_pipeline(
+                    pipeline,
+                    local_file_path,
+                    chunk_path_prefix,
+                    chunk_length_seconds,
+                    segment_times,
+                    keep_intervals,
+                    config.AUDIO_ENCODING_PROFILE
+                )
+
+        # Encoding and transcription overlap: chunks are uploaded as soon as ffmpeg closes them.
+        await status_message.edit_text(status_text("در حال انجام...", "آغاز شد..."))
+        transcription_result_dict = await pipeline.run(produce_chunks)
+        chunks = pipeline.chunks
+        if transcription_result_dict.get("error"):
+            if transcription_result_dict.get("stage") == "process":
+                await status_message.edit_text(
+                    status_text(f"خطا در آماده‌سازی فایل: {transcription_result_dict['error']}", "..."),
+                    rate_limit_args=RESULT_TRAFFIC
+                )
+            elif not transcription_result_dict["retryable"]:
+                # A retryable failure is reported by run_transcription_job, which runs the job again.
+                await status_message.edit_text(status_text(
+                    "✅",
+                    Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=transcription_result_dict['error'])
+                ), rate_limit_args=RESULT_TRAFFIC)
+            return {"error": transcription_result_dict["error"], "retryable": transcription_result_dict["retryable"]}
+
+        original_length_ms = transcription_result_dict["producer_result"]
+        if chunk_plan["original_duration_seconds"]:
+            # Billing uses the probed (or analysed), untrimmed recording length.
+            original_length_ms = int(chunk_plan["original_duration_seconds"] * 1000)
+
+        cost_minutes = duration_seconds / 60.0
+        if original_length_ms:
+            refined_duration_seconds = original_length_ms / 1000
+            duration_str = f"{original_length_ms // 60000:02d}:{(original_length_ms // 1000) % 60:02d}"
+            cost_minutes = refined_duration_seconds / 60.0
+        logging.info(f"duration_minutes: {duration_minutes} (chunk length: {chunk_length_seconds}s), num_chunks: {len(chunks)}")
+    finally:
+        remove_chunk_files(chunk_path_prefix)
+
+    transcription = transcription_result_dict.get("transcription", "")
+    if srt:
+        time_map = TimeMap(keep_intervals) if keep_intervals else None
+        transcription = merge_srt_chunks(chunks, transcription_result_dict["chunk_transcripts"], time_map)
+
+    await status_message.edit_text(status_text("✅", "✅"))
+    return {
+        "transcription": transcription,
+        "cost_minutes": cost_minutes,
+        "duration_str": duration_str,
+    }
+
+
+def charge_transcription_job(job: dict, cost_minutes: float) -> User | None:
+    """Deducts a job's cost and marks it CHARGED in the same commit."""
+    db = SessionLocal()
+    try:
+        user_to_update = db.query(User).filter(User.user_id == job["user_id"]).first()
+        job_row = db.query(BatchJob).filter(BatchJob.id == job["id"]).first()
+        if job_row:
+            job_row.status = "CHARGED"
+            job_row.cost_minutes = cost_minutes
+        if not user_to_update:
+            db.commit()
+            logging.error(f"Could not find user {job['user_id']} to deduct credit.")
+            return None
+        user_to_update.credit_minutes -= cost_minutes
+        db.commit()
+        log_activity(
+            db=db,
+            user_id=user_to_update.user_id,
+            action='transcription',
+            credit_change=-cost_minutes,
+            details=f"Media duration: {job['duration_seconds']:.2f}s, File: {job['original_filename']}"
+        )
+        db.refresh(user_to_update)
+        logging.info(f"Deducted {cost_minutes:.2f} minutes from user {job['user_id']}. New balance: {user_to_update.credit_minutes:.2f}")
+        return user_to_update
+    finally:
+        db.close()
+
+
+async def reject_if_over_credit(job: dict, status_message, cost_minutes: float) -> bool:
+    """Fails `job` with CREDIT_INSUFFICIENT if its user's credit doesn't cover `cost_minutes`."""
+    credit_minutes = get_credit_minutes(job["user_id"])
+    if credit_minutes is None or cost_minutes <= credit_minutes:
+        return False
+    logging.info(f"Rejecting job {job['id']}: {cost_minutes:.2f} minutes exceed the user's {credit_minutes:.2f} minutes.")
+    finish_transcription_job(job["id"], "FAILED", "insufficient credit")
+    await status_message.edit_text(Texts.User.CREDIT_INSUFFICIENT.format(
+        current_credit=credit_minutes,
+        cost=cost_minutes
+    ), rate_limit_args=RESULT_TRAFFIC)
+    return True
+
+
+async def run_transcription_job(context: ContextTypes.DEFAULT_TYPE, job_id: int, status_message):
+    """
+    Transcribes, charges and delivers a recorded job. A transient failure is retried here,
+    up to TRANSCRIPTION_JOB_MAX_RUNS runs, and the user is told the job continues.
+    """
+    if not isinstance(status_message, ProgressReporter):
+        status_message = ProgressReporter(status_message)
+    try:
+        for run in range(1, config.TRANSCRIPTION_JOB_MAX_RUNS + 1):
+            error = await run_transcription_job_once(context, job_id, status_message)
+            if error is None:
+                return
+            if run == config.TRANSCRIPTION_JOB_MAX_RUNS:
+                logging.error(f"Transcription job {job_id} failed after {run} run(s): {error}")
+                finish_transcription_job(job_id, "FAILED", error)
+                await status_message.edit_text(Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error=error), rate_limit_args=RESULT_TRAFFIC)
+                return
+            # Left resumable, so a restart during the wait still continues it as promised.
+            delay = config.TRANSCRIPTION_JOB_RETRY_DELAY_SECONDS
+            logging.warning(f"Transcription job {job_id} failed transiently (run {run}), running it again in {delay}s: {error}")
+            finish_transcription_job(job_id, "RETRYABLE", error)
+            await status_message.edit_text(Texts.User.TRANSCRIPTION_RETRYING.format(delay=delay), rate_limit_args=RESULT_TRAFFIC)
+            await status_message.flush()
+            await asyncio.sleep(delay)
+    finally:
+        await status_message.flush()
+
+
+async def run_transcription_job_once(context: ContextTypes.DEFAULT_TYPE, job_id: int, status_message) -> str | None:
+    """
+    One run of a job from its last persisted step. Returns the error of a transient
+    failure, or None once the job succeeded or failed for good.
+    """
+    job = get_transcription_job(job_id)
+    output_kind = job["output_kind"]
+    file_unique_id = job["file_unique_id"]
+    duration_seconds = job["duration_seconds"]
+    duration_str = f"{duration_seconds // 60:02d}:{ duration_seconds % 60:02d}"
+    prompt = TRANSCRIBER_SRT_PROMPT if output_kind == "video_srt" else TRANSCRIBER_PROMPT
+
+    downloads_dir = os.path.join(os.getcwd(), "downloads")
+    os.makedirs(downloads_dir, exist_ok=True)
+
+    original_extension = os.path.splitext(job["original_filename"] or "")[1] or '.tmp'
+    # Per job, so a coalesced job never deletes a download another run still uses.
+    local_file_path = os.path.join(downloads_dir, f"{output_kind}_{file_unique_id}_{job_id}{original_extension}")
+
+    try:
+        if job["status"] in ("PENDING", "RUNNING", "RETRYABLE"):
+            cached = get_cached_transcription(file_unique_id, prompt, config.TRANSCRIPTION_MODEL)
+            if cached:
+                full_transcript = cached["transcription"]
+                cost_minutes = cached["duration_seconds"] / 60.0
+                await status_message.edit_text(Texts.User.MEDIA_PROCESSING_MSG.format(
+                        duration = duration_str,
+                        download = "✅",
+                        process = "✅",
+                        transcription = "✅"
+                    ))
+            else:
+                async def send_part(index, text):
+                    try:
+                        await send_transcript_part(context.bot, job["chat_id"], index + 1, text)
+                    except Exception as e:
+                        logging.warning(f"Failed to send part {index + 1} of job {job_id}: {e}")
+
+                async def transcribe_work(status):
+                    logging.info(f"Downloading media for job {job_id}. Size: {job['file_size']} bytes.")
+                    await download_media_file(
+                        context,
+                        job["chat_id"],
+                        job["original_message_id"],
+                        job["file_id"],
+                        job["file_size"],
+                        local_file_path
+                    )
+                    result = await transcribe_downloaded_media(
+                        status,
+                        local_file_path,
+                        os.path.join(downloads_dir, f"chunk_{output_kind}_{file_unique_id}_{job_id}"),
+                        duration_seconds,
+                        duration_str,
+                        prompt,
+                        srt=(output_kind == "video_srt"),
+                        job_id=job_id,
+                        credit_minutes=get_credit_minutes(job["user_id"]),
+                        on_part_ready=send_part if config.INCREMENTAL_DELIVERY_ENABLED and output_kind != "video_srt" else None
+                    )
+                    if result and "transcription" in result:
+                        store_cached_transcription(
+                            file_unique_id,
+                            prompt,
+                            config.TRANSCRIPTION_MODEL,
+                            result["transcription"],
+                            result["cost_minutes"] * 60
+                        )
+                    return result
+
+                flight_key, _ = make_transcription_cache_key(file_unique_id, prompt, config.TRANSCRIPTION_MODEL)
+                while True:
+                    pipeline_result = await coalesce_transcription(flight_key, status_message, transcribe_work)
+                    if pipeline_result.get("error"):
+                        if pipeline_result["retryable"]:
+                            # The chunks already done are kept for the next run.
+                            return pipeline_result["error"]
+                        finish_transcription_job(job_id, "FAILED", pipeline_result["error"])
+                        return None
+                    if not pipeline_result.get("rejected"):
+                        break
+                    # Rejected for the leader's credit; this job is judged by its own.
+                    if await reject_if_over_credit(job, status_message, pipeline_result["billed_seconds"] / 60.0):
+                        return None
+                full_transcript = pipeline_result["transcription"]
+                cost_minutes = pipeline_result["cost_minutes"]
+
+            logging.info(f"Transcription successful. Length: {len(full_transcript.strip())} chars")
+            update_transcription_job(job_id, status="TRANSCRIBED", transcript=full_transcript, cost_minutes=cost_minutes)
+            job.update(status="TRANSCRIBED", transcript=full_transcript, cost_minutes=cost_minutes)
+
+        if job["status"] == "TRANSCRIBED":
+            # Checked right before the charge, also for batch jobs whose credit was checked
+            # at submission; shared and cached runs are priced from the probed file.
+            if await reject_if_over_credit(job, status_message, job["cost_minutes"]):
+                return None
+            user_to_update = charge_transcription_job(job, job["cost_minutes"])
+            if user_to_update:
+                context.user_data['db_user'] = user_to_update
+            job["status"] = "CHARGED"
+
+        # The last status edit is shown before the result messages are sent.
+        await status_message.flush()
+        cost_minutes = job["cost_minutes"]
+        if output_kind == "video_srt":
+            await deliver_srt_file(context, job["chat_id"], job["transcript"], job["original_filename"], cost_minutes)
+        else:
+            db = SessionLocal()
+            try:
+                owner = db.query(User).filter(User.user_id == job["user_id"]).first()
+                language = owner.preferred_language if owner else 'fa'
+            finally:
+                db.close()
+            source_info = {
+                'type': output_kind,
+                'cost': cost_minutes,
+                'language': language
+            }
+            await send_transcription_result(context, job["chat_id"], job["user_id"], job["transcript"].strip(), source_info)
+        finish_transcription_job(job_id, "SUCCEEDED")
+
+    except AudioProcessingError as e:
+        logging.error(f"FFmpeg could not process the file: {local_file_path}", exc_info=True)
+        finish_transcription_job(job_id, "FAILED", str(e))
+        await status_message.edit_text(
+            "خطا: فایل ارسال شده فرمت ناشناخته یا خرابی دارد و قابل پردازش نیست.",
+            rate_limit_args=RESULT_TRAFFIC
+        )
+    except Exception as e:
+        logging.error(f"An error occurred in transcription job {job_id}: {e}", exc_info=True)
+        if is_transient_error(e):
+            return str(e)
+        finish_transcription_job(job_id, "FAILED", str(e))
+        error_msg = str(e)
+        if "Message is too long" in error_msg:
+            error_msg = Texts.Errors.OUTPUT_TOO_LONG
+        await status_message.edit_text(Texts.Errors.GENERIC_UNEXPECTED.format(error=error_msg), rate_limit_args=RESULT_TRAFFIC)
+    finally:
+        if os.path.exists(local_file_path):
+            try:
+                os.remove(local_file_path)
+                logging.info(f"Cleaned up: {local_file_path}")
+            except Exception as cleanup_error:
+                logging.warning(f"Failed to delete {local_file_path}: {cleanup_error}")
+    return None
+
+
+async def resume_transcription_jobs(application):
+    """Resumes jobs a restart interrupted; those older than TRANSCRIPTION_JOB_RESUME_MAX_AGE_HOURS are failed."""
+    jobs = get_unfinished_transcription_jobs()
+    if not jobs:
+        return
+    logging.info(f"Resuming {len(jobs)} unfinished transcription job(s).")
+    max_age = datetime.timedelta(hours=config.TRANSCRIPTION_JOB_RESUME_MAX_AGE_HOURS)
+    for job in jobs:
+        status_message = BotStatusMessage(application.bot, job["chat_id"], job["status_message_id"])
+        if job["created_at"].replace(tzinfo=UTC) < datetime.datetime.now(UTC) - max_age:
+            finish_transcription_job(job["id"], "FAILED", "expired before it could be resumed")
+            try:
+                await status_message.edit_text(Texts.Errors.TRANSCRIPTION_JOB_EXPIRED)
+            except Exception as e:
+                logging.warning(f"Failed to update status message of expired job {job['id']}: {e}")
+            continue
+        context = CallbackContext(application, chat_id=job["chat_id"], user_id=job["user_id"])
+        application.create_task(run_transcription_job(context, job["id"], status_message))
+
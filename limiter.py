@@ -0,0 +1,265 @@
+# limiter.py
+import logging
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+def is_overload_error(e: Exception) -> bool:
+    """
+    True for errors that mean the upstream API is shedding load: HTTP 429 and 5xx.
+    Works with google-genai's APIError (`code`) and HTTP client errors (`status_code`).
+    """
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(e, "status_code", None)
+    if not isinstance(code, int):
+        response = getattr(e, "response", None)
+        code = getattr(response, "status_code", None)
+    return isinstance(code, int) and (code == 429 or 500 <= code < 600)
+
+
+def is_transient_error(e: Exception) -> bool:
+    """True for failures worth retrying: upstream overload, timeouts and dropped connections."""
+    if is_overload_error(e) or isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    # httpx transport errors (ReadTimeout, ConnectError, RemoteProtocolError, ...).
+    return any(cls.__name__ == "TransportError" for cls in type(e).__mro__)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    In-flight limit for one budget of upstream calls, adjusted with AIMD.
+    Each successful call while the limiter is saturated adds 1/limit (about +1 per
+    round of calls); a 429/5xx or a call much slower than the running latency
+    baseline multiplies the limit by `decrease_factor`. Calls that started before the
+    last decrease can't trigger another one, so a burst of errors from one round only
+    backs off once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        max_limit: int,
+        min_limit: int = 1,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_alpha: float = 0.1,
+        latency_warmup: int = 10,
+        is_overload=is_overload_error,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.latency_alpha = latency_alpha
+        self.latency_warmup = latency_warmup
+        self.is_overload = is_overload
+
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease_at = 0.0
+        self.latency_baseline: float | None = None
+        self.latency_samples = 0
+
+        self.successes = 0
+        self.failures = 0
+        self.rejections = 0
+        self.latency_backoffs = 0
+        self.queued = 0
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < self.current_limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self):
+        if self.in_flight < self.current_limit and not self._waiters:
+            self.in_flight += 1
+            return
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on.
+                self.in_flight -= 1
+                self._wake_waiters()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def _decrease(self, reason: str):
+        previous = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self._last_decrease_at = time.monotonic()
+        logging.warning(f"Limiter '{self.name}': {reason}, limit {previous} -> {self.current_limit}")
+
+    def _release(self, started_at: float, cost: float, error: Exception | None):
+        latency = time.monotonic() - started_at
+        saturated = self.in_flight >= self.current_limit
+        self.in_flight -= 1
+        can_decrease = started_at >= self._last_decrease_at
+
+        if error is not None:
+            self.failures += 1
+            if self.is_overload(error):
+                self.rejections += 1
+                if can_decrease:
+                    self._decrease(f"upstream rejected a call ({error})")
+        else:
+            self.successes += 1
+            normalized = latency / max(cost, 1e-6)
+            slow = (
+                self.latency_samples >= self.latency_warmup
+                and normalized > self.latency_baseline * self.latency_tolerance
+            )
+            if self.latency_baseline is None:
+                self.latency_baseline = normalized
+            else:
+                self.latency_baseline += self.latency_alpha * (normalized - self.latency_baseline)
+            self.latency_samples += 1
+
+            if slow and can_decrease:
+                self.latency_backoffs += 1
+                self._decrease(f"latency {normalized:.2f}s/unit above baseline {self.latency_baseline:.2f}s/unit")
+            elif not slow and saturated:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 1.0):
+        """
+        Holds one in-flight slot for the duration of the block and feeds its outcome
+        back into the limit. `cost` normalizes latency, e.g. seconds of audio per call.
+        """
+        await self._acquire()
+        started_at = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.in_flight -= 1
+            self._wake_waiters()
+            raise
+        except Exception as e:
+            self._release(started_at, cost, e)
+            raise
+        else:
+            self._release(started_at, cost, None)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "limit": self.current_limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "queued": self.queued,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejections": self.rejections,
+            "latency_backoffs": self.latency_backoffs,
+            "latency_baseline": round(self.latency_baseline, 3) if self.latency_baseline is not None else None,
+        }
+
+
+class MemoryBudget:
+    """
+    Admits jobs against a shared memory budget, first come first served. A job waits
+    until its estimated footprint fits next to the jobs already admitted; a job larger
+    than the whole budget is admitted once nothing else is running, so it can't starve.
+    """
+
+    def __init__(self, name: str, budget_bytes: int):
+        self.name = name
+        self.budget_bytes = max(1, budget_bytes)
+        self.in_use = 0
+        self.running = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+
+        self.admitted = 0
+        self.queued = 0
+        self.peak_in_use = 0
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.running == 0 or self.in_use + nbytes <= self.budget_bytes
+
+    def _admit(self, nbytes: int):
+        self.in_use += nbytes
+        self.running += 1
+        self.admitted += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _wake_waiters(self):
+        while self._waiters:
+            nbytes, waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._admit(nbytes)
+            waiter.set_result(None)
+
+    def _release(self, nbytes: int):
+        self.in_use -= nbytes
+        self.running -= 1
+        self._wake_waiters()
+
+    async def _acquire(self, nbytes: int):
+        if not self._waiters and self._fits(nbytes):
+            self._admit(nbytes)
+            return
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as we were cancelled; give the memory back.
+                self._release(nbytes)
+            else:
+                # A cancelled job at the head may have been holding back smaller ones.
+                self._wake_waiters()
+            raise
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """Holds `nbytes` of the budget for the duration of the block, waiting until it fits."""
+        nbytes = max(0, int(nbytes))
+        await self._acquire(nbytes)
+        try:
+            yield
+        finally:
+            self._release(nbytes)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "budget_mb": round(self.budget_bytes / 2**20),
+            "in_use_mb": round(self.in_use / 2**20),
+            "peak_mb": round(self.peak_in_use / 2**20),
+            "running": self.running,
+            "waiting": sum(1 for _, waiter in self._waiters if not waiter.done()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+        }
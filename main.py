@@ -1,5 +1,6 @@
 # main.py
 import logging
+import asyncio
 from telegram import Update, BotCommand, BotCommandScopeChat
 from telegram.ext import (
     Application,
@@ -9,6 +10,7 @@ from telegram.ext import (
     filters,
 )
 
+import config
 from config import TG_BOT_TOKEN, configure_logging, ADMIN_USER_ID 
 from handlers import (
     start,
@@ -32,9 +34,15 @@ from handlers import (
     youtube_callback_handler,   
     handle_video_file,
     handle_video_callback,    
-    delete_user_command
+    delete_user_command,
+    system_stats_command,
+    transcription_mode_callback
 )
+from jobs import resume_transcription_jobs
+from batch_transcription import run_batch_transcription_loop
 from database import create_db_and_tables
+from send_scheduler import TelegramSendScheduler
+from webhook import run_webhook
 from texts import Texts  
 
 async def post_init(application: Application):
@@ -60,6 +68,7 @@ async def post_init(application: Application):
         BotCommand("/set_status", Texts.BotCommands.SET_STATUS),
         BotCommand("/user_logs", Texts.BotCommands.USER_LOGS),
         BotCommand("/delete_user", Texts.BotCommands.DEL_USER),
+        BotCommand("/system_stats", Texts.BotCommands.SYSTEM_STATS),
     ]
     # Set the admin commands only for the admin's chat
     await application.bot.set_my_commands(
@@ -68,6 +77,11 @@ async def post_init(application: Application):
     )
     logging.info(f"Admin commands have been set for admin user {ADMIN_USER_ID}.")
 
+    # Finish transcription jobs that a restart or redeploy interrupted.
+    await resume_transcription_jobs(application)
+    if config.BATCH_TRANSCRIPTION_ENABLED:
+        application.create_task(run_batch_transcription_loop(application))
+
 def main() -> None:
     """Start the bot."""
     configure_logging()
@@ -81,6 +95,19 @@ def main() -> None:
     builder.read_timeout(60.0)
     builder.write_timeout(60.0)
 
+    # All sends and edits are paced to Telegram's global and per-chat limits, results first.
+    builder.rate_limiter(TelegramSendScheduler(
+        global_rate=config.TELEGRAM_GLOBAL_SENDS_PER_SECOND,
+        chat_rate=config.TELEGRAM_CHAT_SENDS_PER_SECOND,
+        group_rate_per_minute=config.TELEGRAM_GROUP_SENDS_PER_MINUTE,
+        chat_burst=config.TELEGRAM_CHAT_BURST,
+        max_retries=config.TELEGRAM_SEND_MAX_RETRIES,
+    ))
+
+    if config.UPDATE_MODE == 'webhook':
+        # Updates are pushed to webhook.py, which feeds the update queue directly.
+        builder.updater(None)
+
     application = (
         builder
         .concurrent_updates(True)
@@ -102,6 +129,7 @@ def main() -> None:
     application.add_handler(CommandHandler('set_status', set_status_command)) 
     application.add_handler(CommandHandler('user_logs', user_logs_command)) 
     application.add_handler(CommandHandler("delete_user", delete_user_command))
+    application.add_handler(CommandHandler("system_stats", system_stats_command))
 
     application.add_handler(MessageHandler(
         filters.VOICE | filters.AUDIO, 
@@ -125,10 +153,28 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(set_language_callback_handler, pattern=r'^set_lang:'))
     application.add_handler(CallbackQueryHandler(youtube_callback_handler, pattern=r'^yt:'))
     application.add_handler(CallbackQueryHandler(handle_video_callback, pattern=r'^video_(raw|srt):'))
+    application.add_handler(CallbackQueryHandler(transcription_mode_callback, pattern=r'^job_(now|later):'))
     application.add_handler(CallbackQueryHandler(button_callback_handler))
 
     application.add_error_handler(error_handler)
 
+    if config.UPDATE_MODE == 'webhook':
+        logging.info("Starting bot in webhook mode...")
+        asyncio.run(run_webhook(
+            application,
+            url=config.WEBHOOK_URL,
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            path=config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET_TOKEN,
+            trusted_proxies=config.WEBHOOK_TRUSTED_PROXIES,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=True,
+            set_webhook=config.WEBHOOK_SET_ON_START,
+            post_init=post_init,
+        ))
+        return
+
     logging.info("Starting bot polling...")
     application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
 
@@ -0,0 +1,240 @@
+# send_scheduler.py
+import time
+import asyncio
+import bisect
+import logging
+import itertools
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Lower values are sent first when requests compete for the global or a chat's budget.
+PRIORITY_RESULT = 0
+PRIORITY_PROGRESS = 1
+PRIORITY_ADMIN = 2
+PRIORITY_NAMES = {PRIORITY_RESULT: "results", PRIORITY_PROGRESS: "progress", PRIORITY_ADMIN: "admin"}
+
+# Pass as `rate_limit_args` to set a call's priority; calls without one are results.
+# utils.ProgressReporter marks its edits as progress, and admin reports and listings are admin.
+RESULT_TRAFFIC = {"priority": PRIORITY_RESULT}
+PROGRESS_TRAFFIC = {"priority": PRIORITY_PROGRESS}
+ADMIN_TRAFFIC = {"priority": PRIORITY_ADMIN}
+
+# Endpoints that post or change messages in a chat and count against Telegram's limits.
+_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+# Idle chat buckets are dropped once more than this many are tracked.
+MAX_TRACKED_CHATS = 10000
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the PTB settings."""
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class _TokenBucket:
+    """`rate` sends per second with bursts of up to `burst`, optionally paused by a flood wait."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a send is allowed, 0 if it is allowed now."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class TelegramSendScheduler(BaseRateLimiter[dict]):
+    """
+    Rate limiter for the Application's bot: every message send or edit waits for a
+    token of the global budget (`global_rate` per second) and of its chat's budget
+    (`chat_rate` per second in private chats, `group_rate_per_minute` in groups, with
+    bursts of `chat_burst`). Waiting requests are released by one dispatcher task in
+    priority order (from `rate_limit_args`), user-facing results before progress edits
+    before admin traffic, FIFO within a priority; a request whose chat has no token yet
+    doesn't hold up other chats. A RetryAfter pauses the chat for as long as Telegram asks and the
+    request is retried up to `max_retries` times, so callers only see it when the
+    flood wait persists. Other Bot API calls (getUpdates, getFile, answerCallbackQuery,
+    ...) are not throttled but get the same retries.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate_per_minute: float = 20.0,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60.0
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global = _TokenBucket(global_rate, global_rate)
+        self._chats: dict[int | str, _TokenBucket] = {}
+        self._waiting: list[tuple[int, int, int | str, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+
+        self.sent = 0
+        self.queued = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        # Let whatever is still queued through rather than strand it.
+        for _, _, _, waiter in self._waiting:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiting.clear()
+
+    def _chat_bucket(self, chat_id: int | str) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_TRACKED_CHATS:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle(now)}
+            # Group and channel ids are negative; @usernames are public channels.
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = _TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _release_ready(self) -> float | None:
+        """
+        Releases the first waiting request, in priority order, whose chat has a token.
+        Returns None if one was released, otherwise how long until one might be.
+        """
+        now = time.monotonic()
+        global_wait = self._global.wait_time(now)
+        if global_wait > 0:
+            return global_wait
+        next_wait = None
+        for index, (_, _, chat_id, waiter) in enumerate(self._waiting):
+            if waiter.done():
+                # Cancelled while queued.
+                del self._waiting[index]
+                return None
+            bucket = self._chat_bucket(chat_id)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait == 0:
+                del self._waiting[index]
+                self._global.take()
+                bucket.take()
+                waiter.set_result(None)
+                return None
+            next_wait = chat_wait if next_wait is None else min(next_wait, chat_wait)
+        return next_wait
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._release_ready() if self._waiting else None
+            if delay is None and self._waiting:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, chat_id: int | str, priority: int):
+        if self._dispatcher is None or self._dispatcher.done():
+            await self.initialize()
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id)
+        if not self._waiting and self._global.wait_time(now) == 0 and bucket.wait_time(now) == 0:
+            self._global.take()
+            bucket.take()
+            return
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiting, (priority, next(self._sequence), chat_id, waiter))
+        self._wakeup.set()
+        await waiter
+        self.max_wait = max(self.max_wait, time.monotonic() - now)
+
+    @staticmethod
+    def _priority(rate_limit_args: dict | None) -> int:
+        return (rate_limit_args or RESULT_TRAFFIC).get("priority", PRIORITY_RESULT)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id") if endpoint.startswith(_LIMITED_PREFIXES) else None
+        priority = self._priority(rate_limit_args)
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._acquire(chat_id, priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.flood_waits += 1
+                delay = retry_after_seconds(e)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logging.warning(
+                    f"Flood wait of {delay:.0f}s on {endpoint} for chat {chat_id}, "
+                    f"retry {attempt}/{self.max_retries}."
+                )
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+            if chat_id is not None:
+                self.sent += 1
+            return result
+
+    def stats(self) -> dict:
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, waiter in self._waiting:
+            if not waiter.done():
+                waiting[PRIORITY_NAMES.get(priority, "admin")] += 1
+        return {
+            "global_rate": self.global_rate,
+            "waiting": sum(waiting.values()),
+            **{f"waiting_{name}": count for name, count in waiting.items()},
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "queued": self.queued,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "max_wait": round(self.max_wait, 2),
+        }
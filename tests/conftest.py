@@ -0,0 +1,55 @@
+# tests/conftest.py
+import os
+import sys
+import importlib.util
+
+import pytest
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config reads these at import time; the tests never reach Telegram or Google.
+for name, value in {
+    "ADMIN_USER_ID": "1",
+    "TELEGRAM_BOT_TOKEN": "1:test",
+    "TELEGRAM_API_ID": "1",
+    "TELEGRAM_API_HASH": "test",
+    "TELEGRAM_BOT_NAME": "test_bot",
+    "GOOGLE_GEMINI_API_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+# prompts.py is created from prompts.example.py on setup; fall back to the example.
+if importlib.util.find_spec("prompts") is None:
+    spec = importlib.util.spec_from_file_location("prompts", os.path.join(ROOT, "prompts.example.py"))
+    sys.modules["prompts"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["prompts"])
+
+from database import Base, SessionLocal, User
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Points SessionLocal at an empty SQLite database for the test."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    original_bind = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(user_id: int = 100, credit_minutes: float = 60.0) -> int:
+        session = SessionLocal()
+        try:
+            session.add(User(user_id=user_id, first_name="Test", status="approved", credit_minutes=credit_minutes))
+            session.commit()
+        finally:
+            session.close()
+        return user_id
+    return make_user
+
@@ -0,0 +1,260 @@
+# tests/test_jobs.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import jobs
+from database import SessionLocal, User, BatchJob, ActivityLog
+from texts import Texts
+from transcription import (
+    create_transcription_job, get_transcription_job, update_transcription_job,
+    finish_transcription_job, record_job_chunk, get_job_chunk_transcripts,
+    get_unfinished_transcription_jobs, UNFINISHED_JOB_STATUSES
+)
+from utils import ProgressReporter
+
+
+class FakeMessage:
+    """Status message that records the texts it is edited to."""
+
+    message_id = 1
+
+    def __init__(self):
+        self.texts = []
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def make_job(user_id: int, status: str = "PENDING", duration_seconds: int = 120) -> int:
+    return create_transcription_job(
+        user_id=user_id,
+        chat_id=user_id,
+        original_message_id=10,
+        status_message_id=11,
+        output_kind="media",
+        file_id="file",
+        file_unique_id=f"unique-{status}",
+        file_size=1000,
+        duration_seconds=duration_seconds,
+        original_filename="voice.oga",
+        status=status,
+    )
+
+
+def get_credit(user_id: int) -> float:
+    db = SessionLocal()
+    try:
+        return db.query(User).filter(User.user_id == user_id).first().credit_minutes
+    finally:
+        db.close()
+
+
+def charge_count(user_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(ActivityLog).filter(ActivityLog.user_id == user_id, ActivityLog.action_type == "transcription").count()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """Replaces result delivery with a list of the transcripts that would be sent."""
+    sent = []
+
+    async def send_transcription_result(context, chat_id, user_id, text, source_info):
+        sent.append(text)
+
+    monkeypatch.setattr(jobs, "send_transcription_result", send_transcription_result)
+    return sent
+
+
+def run_job(job_id: int) -> FakeMessage:
+    message = FakeMessage()
+    context = SimpleNamespace(user_data={}, bot=None)
+    asyncio.run(jobs.run_transcription_job(context, job_id, ProgressReporter(message, min_interval=0)))
+    return message
+
+
+# --- Job status transitions ---
+
+def test_unfinished_statuses_are_resumed(make_user):
+    user_id = make_user()
+    for status in ("DRAFT", "QUEUED", "SUBMITTED", "SUCCEEDED", "FAILED", *UNFINISHED_JOB_STATUSES):
+        make_job(user_id, status)
+    assert sorted(job["status"] for job in get_unfinished_transcription_jobs()) == sorted(UNFINISHED_JOB_STATUSES)
+
+
+@pytest.mark.parametrize("status", ["SUCCEEDED", "FAILED"])
+def test_final_status_drops_transcript_and_chunks(make_user, status):
+    job_id = make_job(make_user(), "TRANSCRIBED")
+    update_transcription_job(job_id, transcript="text")
+    record_job_chunk(job_id, {"index": 0, "start_seconds": 0.0, "duration_seconds": 60.0}, "text")
+
+    finish_transcription_job(job_id, status, "error" if status == "FAILED" else None)
+
+    job = get_transcription_job(job_id)
+    assert job["status"] == status
+    assert job["transcript"] is None
+    assert get_job_chunk_transcripts(job_id) == {}
+
+
+def test_retryable_keeps_finished_chunks(make_user):
+    job_id = make_job(make_user(), "RUNNING")
+    record_job_chunk(job_id, {"index": 0, "start_seconds": 0.0, "duration_seconds": 60.0}, "first")
+
+    finish_transcription_job(job_id, "RETRYABLE", "timeout")
+
+    job = get_transcription_job(job_id)
+    assert job["status"] == "RETRYABLE"
+    assert get_job_chunk_transcripts(job_id) == {0: "first"}
+
+
+@pytest.mark.parametrize("status", ["TRANSCRIBED", "CHARGED"])
+def test_retryable_does_not_rewind_a_later_step(make_user, status):
+    job_id = make_job(make_user(), status)
+    update_transcription_job(job_id, transcript="text")
+
+    finish_transcription_job(job_id, "RETRYABLE", "timeout")
+
+    job = get_transcription_job(job_id)
+    assert job["status"] == status
+    assert job["transcript"] == "text"
+
+
+# --- Credit checks and charging ---
+
+def test_charge_deducts_credit_and_marks_job_charged(make_user):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id, "TRANSCRIBED")
+
+    user = jobs.charge_transcription_job(get_transcription_job(job_id), 2.5)
+
+    assert user.credit_minutes == pytest.approx(7.5)
+    assert get_credit(user_id) == pytest.approx(7.5)
+    job = get_transcription_job(job_id)
+    assert job["status"] == "CHARGED"
+    assert job["cost_minutes"] == pytest.approx(2.5)
+    assert charge_count(user_id) == 1
+
+
+def test_reject_if_over_credit(make_user):
+    user_id = make_user(credit_minutes=1.0)
+    job = get_transcription_job(make_job(user_id))
+    message = FakeMessage()
+
+    async def check(cost_minutes):
+        reporter = ProgressReporter(message, min_interval=0)
+        rejected = await jobs.reject_if_over_credit(job, reporter, cost_minutes)
+        await reporter.flush()
+        return rejected
+
+    assert asyncio.run(check(1.0)) is False
+    assert get_transcription_job(job["id"])["status"] == "PENDING"
+
+    assert asyncio.run(check(2.0)) is True
+    assert get_transcription_job(job["id"])["status"] == "FAILED"
+    assert message.texts == [Texts.User.CREDIT_INSUFFICIENT.format(current_credit=1.0, cost=2.0)]
+
+
+def test_transcribed_batch_job_is_charged_and_delivered(make_user, delivered):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id, "TRANSCRIBED", duration_seconds=180)
+    update_transcription_job(job_id, transcript=" batch transcript ")
+
+    run_job(job_id)
+
+    assert delivered == ["batch transcript"]
+    assert get_credit(user_id) == pytest.approx(7.0)
+    assert get_transcription_job(job_id)["status"] == "SUCCEEDED"
+
+
+def test_transcribed_batch_job_rechecks_credit_before_charging(make_user, delivered):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id, "TRANSCRIBED", duration_seconds=180)
+    update_transcription_job(job_id, transcript="batch transcript")
+    # The credit was spent elsewhere while the batch ran.
+    db = SessionLocal()
+    db.query(User).filter(User.user_id == user_id).update({"credit_minutes": 1.0})
+    db.commit()
+    db.close()
+
+    message = run_job(job_id)
+
+    assert delivered == []
+    assert get_credit(user_id) == pytest.approx(1.0)
+    assert get_transcription_job(job_id)["status"] == "FAILED"
+    assert message.texts[-1] == Texts.User.CREDIT_INSUFFICIENT.format(current_credit=1.0, cost=3.0)
+
+
+def test_charged_job_is_delivered_without_charging_again(make_user, delivered):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id, "CHARGED", duration_seconds=180)
+    update_transcription_job(job_id, transcript="already paid")
+
+    run_job(job_id)
+
+    assert delivered == ["already paid"]
+    assert get_credit(user_id) == pytest.approx(10.0)
+    assert charge_count(user_id) == 0
+
+
+# --- In-process retries ---
+
+@pytest.fixture
+def pipeline_results(monkeypatch):
+    """Feeds run_transcription_job the given transcription results, one per run."""
+    results = []
+
+    async def coalesce_transcription(key, status_message, work):
+        return results.pop(0)
+
+    monkeypatch.setattr(jobs, "coalesce_transcription", coalesce_transcription)
+    monkeypatch.setattr(config, "TRANSCRIPTION_JOB_RETRY_DELAY_SECONDS", 0)
+    monkeypatch.setattr(config, "TRANSCRIPTION_JOB_MAX_RUNS", 2)
+    return results
+
+
+def test_transient_failure_is_retried_in_process(make_user, delivered, pipeline_results):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id)
+    pipeline_results.extend([
+        {"error": "timeout", "retryable": True},
+        {"transcription": "done", "cost_minutes": 2.0, "duration_str": "02:00"},
+    ])
+
+    message = run_job(job_id)
+
+    assert Texts.User.TRANSCRIPTION_RETRYING.format(delay=0) in message.texts
+    assert delivered == ["done"]
+    assert charge_count(user_id) == 1
+    assert get_credit(user_id) == pytest.approx(8.0)
+    assert get_transcription_job(job_id)["status"] == "SUCCEEDED"
+
+
+def test_transient_failure_fails_the_job_after_the_last_run(make_user, delivered, pipeline_results):
+    user_id = make_user(credit_minutes=10.0)
+    job_id = make_job(user_id)
+    pipeline_results.extend([{"error": "timeout", "retryable": True}] * 2)
+
+    message = run_job(job_id)
+
+    assert message.texts[-1] == Texts.Errors.AUDIO_TRANSCRIPTION_FAILED.format(error="timeout")
+    assert delivered == []
+    assert get_credit(user_id) == pytest.approx(10.0)
+    # FAILED keeps the job out of the jobs resumed on startup.
+    assert get_transcription_job(job_id)["status"] == "FAILED"
+    assert get_unfinished_transcription_jobs() == []
+
+
+def test_permanent_failure_is_not_retried(make_user, delivered, pipeline_results):
+    job_id = make_job(make_user())
+    pipeline_results.append({"error": "bad request", "retryable": False})
+
+    run_job(job_id)
+
+    assert pipeline_results == []
+    assert get_transcription_job(job_id)["status"] == "FAILED"
@@ -70,6 +70,18 @@ class Texts:
             "رونویسی: {transcription}\n\n"
             "@SedaNevis_bot\n"
         )
+        TRANSCRIPTION_MODE_PROMPT = (
+            "فایل دریافت شد. طول فایل: {duration}\n\n"
+            "این فایل طولانی است. می‌توانید رونویسی را همین حالا دریافت کنید، "
+            "یا آن را در صف پردازش دسته‌ای قرار دهید تا نتیجه کمی بعد (معمولاً تا چند ساعت) برایتان ارسال شود.\n\n"
+            "@SedaNevis_bot\n"
+        )
+        TRANSCRIPTION_MODE_NOW = "⚡️ رونویسی فوری"
+        TRANSCRIPTION_MODE_LATER = "🕓 ارسال نتیجه بعداً"
+        BATCH_QUEUED = "🕓 فایل در صف پردازش دسته‌ای قرار گرفت. پس از آماده شدن، رونویسی برای شما ارسال می‌شود.\n\n@SedaNevis_bot\n"
+        BATCH_SUBMITTED = "🕓 فایل آماده و برای رونویسی دسته‌ای ارسال شد. نتیجه پس از آماده شدن برای شما ارسال می‌شود.\n\n@SedaNevis_bot\n"
+        TRANSCRIPTION_RETRYING = "⏳ رونویسی با یک خطای موقت متوقف شد. بخش‌های انجام‌شده حفظ شده‌اند و پردازش حدود {delay} ثانیه دیگر به‌طور خودکار ادامه پیدا می‌کند.\n\n@SedaNevis_bot\n"
+        TRANSCRIPT_PART_HEADER = "📝 بخش {part} رونوشت (رونوشت کامل پس از پایان ارسال می‌شود):"
         MEDIA_DOWNLOAD_START = "فایل دریافت شد! در حال دانلود و پردازش اولیه هستیم.\n\nاز شکیبایی شما سپاس‌گذاریم 🙏\n\n@SedaNevis_bot\n"
         MEDIA_DOWNLOAD_DONE = "فایل دانلود شد. در حال پردازش و استخراج صدا..."
         MEDIA_PROCESSING_DONE = (
@@ -179,7 +191,8 @@ class Texts:
             "<code>/user_info &lt;user_id&gt;</code>\nGet detailed info for a single user.\n\n"
             "<code>/add_credit &lt;user_id&gt; &lt;minutes&gt;</code>\nAdd credit to a user.\n\n"
             "<code>/set_status &lt;user_id&gt; &lt;status&gt;</code>\nChange a user's status (e.g., approved, banned).\n\n"
-            "<code>/user_logs &lt;user_id&gt;</code>\nShow recent activity for a user."            
+            "<code>/user_logs &lt;user_id&gt;</code>\nShow recent activity for a user.\n\n"
+            "<code>/system_stats</code>\nShow Gemini limiter and transcription pipeline stats."
         )
         
         LIST_USERS_HEADER = "<b>👥 Users List</b>\n\n"
@@ -210,6 +223,36 @@ class Texts:
         USER_LOGS_ITEM = "<code>{timestamp}</code>\n<b>Action:</b> {action}\n<b>Change:</b> {change:.2f} min | <b>Details:</b> {details}\n--------------------\n"
         NO_LOGS_FOUND = "No activity logs found for user <code>{user_id}</code>."
 
+        SYSTEM_STATS_HEADER = "<b>📊 Gemini Limiters</b>\n\n"
+        SYSTEM_STATS_LIMITER_ITEM = (
+            "<b>{name}</b>: limit {limit} ({min_limit}-{max_limit}) | in flight {in_flight} | waiting {waiting}\n"
+            "ok {successes} | failed {failures} | rejected {rejections} | latency backoffs {latency_backoffs}\n"
+            "--------------------\n"
+        )
+        SYSTEM_STATS_MEMORY_ITEM = (
+            "<b>{name}</b>: {in_use_mb}/{budget_mb} MB (peak {peak_mb}) | running {running} | waiting {waiting}\n"
+            "admitted {admitted} | queued {queued}\n"
+        )
+        SYSTEM_STATS_TOKENS_ITEM = (
+            "<b>token estimator</b>: trusted {trusted} | error {relative_error} (max {max_relative_error}) | "
+            "samples {samples} | estimates {estimates}\n"
+        )
+        SYSTEM_STATS_TOKEN_CACHE_ITEM = (
+            "<b>token count cache</b>: {entries}/{max_entries} entries ({size_kb} KB) | "
+            "hit rate {hit_rate} ({hits} hits, {misses} misses) | evictions {evictions}\n"
+        )
+        SYSTEM_STATS_SEND_QUEUE_ITEM = (
+            "<b>telegram sends</b>: waiting {waiting} (results {waiting_results}, progress {waiting_progress}, "
+            "admin {waiting_admin}) | sent {sent} | queued {queued} | max wait {max_wait}s\n"
+            "flood waits {flood_waits} | retries {retries} | chats tracked {chats}\n"
+        )
+        SYSTEM_STATS_PIPELINES_HEADER = "\n<b>🎙 Active Transcriptions</b>\n\n"
+        SYSTEM_STATS_PIPELINE_ITEM = (
+            "<code>{label}</code>: {completed}/{produced} done | waiting {chunks_waiting} | "
+            "transcribing {transcribing} | producing: {producing}\n"
+        )
+        SYSTEM_STATS_NO_PIPELINES = "No transcriptions running.\n"
+
         SET_STATUS_SUCCESS = "✅ Status for <b>{first_name}</b> (<code>{user_id}</code>) has been updated to <code>{new_status}</code>."
 
     class Errors:
@@ -225,6 +268,8 @@ class Texts:
         INVALID_TEXT_FILE = "لطفا فقط فایل متنی (مانند .txt) ارسال کنید."
         TEXT_FILE_PROCESS_FAILED = "خطا در پردازش فایل: {error}"
         AUDIO_TRANSCRIPTION_FAILED = "رونویسی با خطا مواجه شد: {error}"
+        TRANSCRIPTION_MODE_EXPIRED = "درخواست منقضی شده است. لطفاً فایل را دوباره ارسال کنید."
+        TRANSCRIPTION_JOB_EXPIRED = "پردازش این فایل به دلیل راه‌اندازی مجدد ربات متوقف شد و دیگر قابل ادامه نیست. لطفاً فایل را دوباره ارسال کنید."
         TEXT_PROCESS_FAILED = "پردازش متن با خطا مواجه شد: {error}"
         VIDEO_TOO_LONG = "⛔ فایل ارسال شده طولانی‌تر از حد مجاز (۱۸۰ دقیقه) است."
         TTS_TEXT_TOO_LONG = (
@@ -279,4 +324,5 @@ class Texts:
         ADD_CREDIT = "Add credit to a user"
         SET_STATUS = "Set a user's status"
         USER_LOGS = "Get activity logs for a user"
-        DEL_USER = "Delete a user from the database"
\ No newline at end of file
+        DEL_USER = "Delete a user from the database"
+        SYSTEM_STATS = "Show limiter and pipeline stats"
\ No newline at end of file
@@ -0,0 +1,211 @@
+# token_estimator.py
+import os
+import re
+import json
+import hashlib
+import logging
+from collections import deque, OrderedDict
+
+import numpy as np
+
+# Character classes the estimate is built from. Gemini's tokenizer spends very different
+# numbers of tokens per character on Latin text, Persian/Arabic script and symbols.
+_LATIN = re.compile(r"[A-Za-z0-9]")
+_ARABIC_SCRIPT = re.compile(r"[؀-ۿݐ-ݿࢠ-ࣿﭐ-﷿ﹰ-﻿]")
+_WHITESPACE = re.compile(r"\s")
+FEATURE_NAMES = ("latin", "arabic_script", "whitespace", "other")
+
+# Tokens per character before any calibration data is available.
+DEFAULT_COEFFICIENTS = (0.25, 0.3, 0.05, 0.6)
+# Pull of the defaults in the refit, so that few or similar samples can't swing the model.
+PRIOR_WEIGHT = 0.1
+
+
+def text_features(text: str) -> np.ndarray:
+    """Returns the per-class character counts of `text`, in FEATURE_NAMES order."""
+    latin = len(_LATIN.findall(text))
+    arabic_script = len(_ARABIC_SCRIPT.findall(text))
+    whitespace = len(_WHITESPACE.findall(text))
+    other = len(text) - latin - arabic_script - whitespace
+    return np.array([latin, arabic_script, whitespace, other], dtype=np.float64)
+
+
+class TokenEstimator:
+    """
+    Offline estimate of Gemini token counts: a linear model over per-script character
+    counts, refitted (least squares on relative error, pulled towards the defaults) from
+    real counts as they come in. Each sample is first scored against the current model,
+    so `relative_error` tracks out-of-sample accuracy over the last `error_window`
+    samples. The estimate is `trusted` once `min_samples` have been seen and the 90th
+    percentile of that error is within `max_relative_error`; until then, callers should
+    count remotely and feed the result back with `observe`.
+    """
+
+    def __init__(
+        self,
+        max_relative_error: float = 0.1,
+        min_samples: int = 20,
+        window: int = 500,
+        error_window: int = 100,
+        state_path: str | None = None,
+        save_every: int = 20,
+    ):
+        self.max_relative_error = max_relative_error
+        self.min_samples = min_samples
+        self.state_path = state_path
+        self.save_every = save_every
+        self.coefficients = np.array(DEFAULT_COEFFICIENTS, dtype=np.float64)
+        self._samples: deque[tuple[list[float], int]] = deque(maxlen=window)
+        self._errors: deque[float] = deque(maxlen=error_window)
+        self._unsaved = 0
+
+        self.estimates = 0
+        self.observations = 0
+
+    def estimate(self, text: str) -> int:
+        self.estimates += 1
+        return self._predict(text_features(text))
+
+    def _predict(self, features: np.ndarray) -> int:
+        return int(round(float(features @ self.coefficients)))
+
+    @property
+    def relative_error(self) -> float | None:
+        """90th percentile relative error of recent estimates against real counts."""
+        return float(np.percentile(self._errors, 90)) if self._errors else None
+
+    @property
+    def trusted(self) -> bool:
+        return (
+            len(self._samples) >= self.min_samples
+            and self.relative_error is not None
+            and self.relative_error <= self.max_relative_error
+        )
+
+    def observe(self, text: str, actual_tokens: int):
+        """Records a real token count for `text` and refits the model."""
+        if actual_tokens <= 0 or not text:
+            return
+        features = text_features(text)
+        self._errors.append(abs(self._predict(features) - actual_tokens) / actual_tokens)
+        self._samples.append((features.tolist(), actual_tokens))
+        self.observations += 1
+        self._fit()
+        self._unsaved += 1
+        if self.state_path and self._unsaved >= self.save_every:
+            self.save()
+
+    def _fit(self):
+        if len(self._samples) < len(FEATURE_NAMES):
+            return
+        features = np.array([sample[0] for sample in self._samples])
+        actual = np.array([sample[1] for sample in self._samples], dtype=np.float64)
+        # Dividing each row by its count turns this into a fit of relative error.
+        weights = 1.0 / actual
+        prior = np.array(DEFAULT_COEFFICIENTS)
+        design = np.vstack([features * weights[:, None], PRIOR_WEIGHT * np.eye(len(FEATURE_NAMES))])
+        target = np.concatenate([actual * weights, PRIOR_WEIGHT * prior])
+        coefficients, *_ = np.linalg.lstsq(design, target, rcond=None)
+        self.coefficients = np.clip(coefficients, 0.0, None)
+
+    def save(self):
+        state = {
+            "samples": list(self._samples),
+            "errors": list(self._errors),
+        }
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+            self._unsaved = 0
+        except OSError as e:
+            logging.warning(f"Failed to save token estimator state to {self.state_path}: {e}")
+
+    def load(self):
+        """Restores the calibration samples saved by a previous run, if any."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._samples.extend((list(features), int(actual)) for features, actual in state["samples"])
+            self._errors.extend(float(error) for error in state["errors"])
+            self._fit()
+            logging.info(
+                f"Loaded {len(self._samples)} token estimator samples, "
+                f"coefficients {np.round(self.coefficients, 3).tolist()}, trusted: {self.trusted}"
+            )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable token estimator state {self.state_path}: {e}")
+
+    def stats(self) -> dict:
+        error = self.relative_error
+        return {
+            "trusted": self.trusted,
+            "samples": len(self._samples),
+            "estimates": self.estimates,
+            "observations": self.observations,
+            "relative_error": round(error, 3) if error is not None else None,
+            "max_relative_error": self.max_relative_error,
+            "coefficients": dict(zip(FEATURE_NAMES, np.round(self.coefficients, 3).tolist())),
+        }
+
+
+class TokenCountCache:
+    """
+    LRU memo of token counts keyed by model and SHA-256 of the text, so the same text
+    is counted once however many actions are priced from it. Bounded both by entry count
+    and by an estimate of its memory use; only digests are kept, never the text.
+    """
+    # Key tuple, digest bytes, int and OrderedDict node, not counting the model name.
+    ENTRY_OVERHEAD_BYTES = 250
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._entries: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, model: str) -> tuple[str, bytes]:
+        return model, hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _entry_bytes(self, key: tuple[str, bytes]) -> int:
+        return self.ENTRY_OVERHEAD_BYTES + len(key[0])
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        count = self._entries.get(key)
+        if count is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return count
+
+    def put(self, key: tuple[str, bytes], count: int):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self.size_bytes += self._entry_bytes(key)
+        self._entries[key] = count
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self.size_bytes -= self._entry_bytes(evicted_key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "size_kb": round(self.size_bytes / 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,656 @@
+# transcription.py
+import os
+import logging
+import asyncio
+import math
+import time
+import random
+import json
+import uuid
+import hashlib
+import datetime
+from datetime import UTC
+
+from sqlalchemy import func
+
+import config
+from ai_services import transcribe_audio_google_async
+from audio_processing import (
+    FFMPEG_BINARY, DEFAULT_ENCODING_PROFILE, AudioProcessingError, build_segment_args, read_segment_manifest,
+    parse_progress_out_time_ms, describe_audio_error, remove_temp_files
+)
+from database import SessionLocal, TranscriptionCache, BatchJob, BatchJobChunk
+
+
+# How often the segment manifest is checked for newly finished chunks.
+SEGMENT_POLL_SECONDS = 0.5
+
+
+class ChunkTranscriptionError(Exception):
+    """Raised when a single chunk of a chunked transcription fails."""
+
+    def __init__(self, index: int, error: str, retryable: bool = False):
+        super().__init__(error)
+        self.index = index
+        self.error = error
+        self.retryable = retryable
+
+
+_active_pipelines: set["TranscriptionPipeline"] = set()
+
+
+class TranscriptionPipeline:
+    """
+    Producer/consumer pipeline for one job: a producer feeds encoded chunks, a pool of
+    workers transcribes them and a collector reassembles the results in chunk order.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        prompt: str,
+        on_progress=None,
+        expected_chunks: int = 0,
+        label: str = "",
+        completed_transcripts: dict[int, str] | None = None,
+        on_chunk_produced=None,
+        on_chunk_done=None,
+        on_part_ready=None,
+    ):
+        self.model = model
+        self.prompt = prompt
+        self.on_progress = on_progress
+        self.on_chunk_produced = on_chunk_produced
+        self.on_chunk_done = on_chunk_done
+        self.on_part_ready = on_part_ready
+        self.expected_chunks = expected_chunks
+        self.label = label
+        self.worker_count = config.TRANSCRIPTION_JOB_CONCURRENCY
+        self.chunk_queue: asyncio.Queue = asyncio.Queue()
+        self.result_queue: asyncio.Queue = asyncio.Queue()
+        self.chunks: list[dict] = []
+        self.chunks_by_index: dict[int, dict] = {}
+        # Chunks finished by an earlier run of the same job are kept and not resent.
+        self.transcripts: dict[int, str] = dict(completed_transcripts or {})
+        self.producing = True
+        self.dispatched = 0
+        self.transcribing = 0
+        self.results_posted = len(self.transcripts)
+        # Next chunk index for on_part_ready; a resumed job doesn't repeat parts it already had.
+        self.next_part = 0
+        while self.next_part in self.transcripts:
+            self.next_part += 1
+        self.retries = 0
+        self.retry_budget = config.TRANSCRIPTION_RETRY_BUDGET
+        self.max_queue_depths = {"chunks_waiting": 0, "transcribing": 0, "results_waiting": 0}
+        self.started_at = time.monotonic()
+
+    async def feed(self, chunk: dict):
+        """Called by the producer for every chunk that is ready to be transcribed."""
+        self.chunks.append(chunk)
+        self.chunks_by_index[chunk["index"]] = chunk
+        if chunk["index"] in self.transcripts:
+            self.dispatched += 1
+            logging.info(f"Chunk {chunk['index'] + 1} already transcribed, skipping.")
+            return
+        if self.on_chunk_produced:
+            self.on_chunk_produced(chunk)
+        await self.chunk_queue.put(chunk)
+        self._track_queue_depths()
+
+    async def _close(self):
+        self.producing = False
+        for _ in range(self.worker_count):
+            await self.chunk_queue.put(None)
+
+    def queue_depths(self) -> dict:
+        """Current per-stage depths: chunks waiting for a worker, uploads in flight, results waiting for the collector."""
+        return {
+            "label": self.label,
+            "chunks_waiting": len(self.chunks) - self.dispatched,
+            "transcribing": self.transcribing,
+            "results_waiting": self.results_posted - len(self.transcripts),
+            "produced": len(self.chunks),
+            "completed": len(self.transcripts),
+            "producing": self.producing,
+        }
+
+    def _track_queue_depths(self):
+        depths = self.queue_depths()
+        for stage in self.max_queue_depths:
+            self.max_queue_depths[stage] = max(self.max_queue_depths[stage], depths[stage])
+
+    async def _worker(self):
+        try:
+            while True:
+                chunk = await self.chunk_queue.get()
+                if chunk is None:
+                    break
+                self.dispatched += 1
+                result = await self._transcribe_with_retries(chunk)
+                if result.get("error"):
+                    raise ChunkTranscriptionError(chunk["index"], result["error"], bool(result.get("retryable")))
+                self.results_posted += 1
+                await self.result_queue.put((chunk["index"], result.get("transcription", "")))
+                self._track_queue_depths()
+        finally:
+            await self.result_queue.put(None)
+
+    async def _transcribe_with_retries(self, chunk: dict) -> dict:
+        """Transcribes one chunk, retrying transient failures with jittered backoff within the job's budget."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.transcribing += 1
+            self._track_queue_depths()
+            try:
+                logging.info(f"Transcribing chunk {chunk['index'] + 1} (attempt {attempt}): {chunk['path']}")
+                result = await transcribe_audio_google_async(
+                    chunk["path"],
+                    math.ceil(chunk["duration_seconds"]),
+                    self.model,
+                    self.prompt,
+                    chunk.get("mime_type"),
+                )
+            finally:
+                self.transcribing -= 1
+
+            if not result.get("error") or not result.get("retryable"):
+                return result
+            if attempt >= config.TRANSCRIPTION_MAX_CHUNK_ATTEMPTS:
+                logging.error(f"Chunk {chunk['index'] + 1} failed after {attempt} attempts.")
+                return result
+            if self.retries >= self.retry_budget:
+                logging.error(f"Retry budget of {self.retry_budget} exhausted for pipeline {self.label}.")
+                return result
+
+            self.retries += 1
+            backoff = min(config.TRANSCRIPTION_RETRY_MAX_DELAY, config.TRANSCRIPTION_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            delay = random.uniform(0, backoff)
+            logging.warning(
+                f"Chunk {chunk['index'] + 1} failed transiently ({result['error']}), "
+                f"retrying in {delay:.1f}s ({self.retries}/{self.retry_budget} retries used)"
+            )
+            await asyncio.sleep(delay)
+
+    async def _collect(self):
+        finished_workers = 0
+        while finished_workers < self.worker_count:
+            item = await self.result_queue.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            index, text = item
+            self.transcripts[index] = text
+            if self.on_chunk_done:
+                self.on_chunk_done(self.chunks_by_index[index], text)
+            completed = len(self.transcripts)
+            total = max(self.expected_chunks, len(self.chunks)) if self.producing else len(self.chunks)
+            logging.info(f"Chunk {index + 1} done, {completed} of {total} completed. Queues: {self.queue_depths()}")
+            if self.on_progress:
+                await self.on_progress(completed, total)
+            while self.next_part in self.transcripts:
+                if self.on_part_ready:
+                    await self.on_part_ready(self.next_part, self.transcripts[self.next_part])
+                self.next_part += 1
+
+    async def run(self, producer) -> dict:
+        """
+        Runs `producer(pipeline)` alongside the workers and the collector.
+        Returns the transcription, per-chunk texts, "producer_result" and queue statistics,
+        or {"error", "stage", "retryable"}.
+        """
+        async def produce():
+            try:
+                return await producer(self)
+            finally:
+                await self._close()
+
+        producer_task = asyncio.create_task(produce())
+        worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        collector_task = asyncio.create_task(self._collect())
+        tasks = [producer_task, *worker_tasks, collector_task]
+
+        _active_pipelines.add(self)
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if isinstance(e, ChunkTranscriptionError):
+                # Results posted but not yet collected are still good work.
+                while not self.result_queue.empty():
+                    item = self.result_queue.get_nowait()
+                    if item is not None:
+                        self.transcripts[item[0]] = item[1]
+                        if self.on_chunk_done:
+                            self.on_chunk_done(self.chunks_by_index[item[0]], item[1])
+                logging.error(f"Chunk {e.index + 1} failed: {e.error} ({len(self.transcripts)} chunks kept)")
+                return {"error": e.error, "stage": "transcription", "retryable": e.retryable}
+            if isinstance(e, (AudioProcessingError, FileNotFoundError)):
+                return {"error": describe_audio_error(e), "stage": "process", "retryable": False}
+            raise
+        finally:
+            _active_pipelines.discard(self)
+
+        transcripts = [self.transcripts[chunk["index"]] for chunk in self.chunks]
+        stats = {
+            "chunks": len(self.chunks),
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 2),
+            "max_queue_depths": dict(self.max_queue_depths),
+            "retries": self.retries,
+        }
+        logging.info(f"Transcription pipeline {self.label} finished: {stats}")
+        return {
+            "transcription": " ".join(transcripts).strip(),
+            "chunk_transcripts": transcripts,
+            "producer_result": producer_task.result(),
+            "stats": stats,
+        }
+
+
+def active_pipeline_stats() -> list[dict]:
+    """Per-stage queue depths of every running transcription pipeline, for monitoring and tuning."""
+    return [pipeline.queue_depths() for pipeline in list(_active_pipelines)]
+
+
+async def segment_into_pipeline(
+    pipeline: TranscriptionPipeline,
+    raw_file_path: str,
+    chunk_path_prefix: str,
+    chunk_length_seconds: int,
+    segment_times: list[float] | None = None,
+    keep_intervals: list[tuple[float, float]] | None = None,
+    profile: str = DEFAULT_ENCODING_PROFILE,
+) -> int | None:
+    """
+    Producer for TranscriptionPipeline: feeds each chunk of the single-pass ffmpeg
+    segmenter as soon as ffmpeg closes it. Returns the encoded length in milliseconds.
+    """
+    args, segment_list_path, temp_paths = build_segment_args(
+        raw_file_path, chunk_path_prefix, chunk_length_seconds, segment_times, keep_intervals, profile
+    )
+    chunk_dir = os.path.dirname(chunk_path_prefix)
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_BINARY, "-hide_banner", "-nostdin", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        communicate_task = asyncio.create_task(process.communicate())
+        fed = 0
+        while True:
+            done, _ = await asyncio.wait({communicate_task}, timeout=SEGMENT_POLL_SECONDS)
+            manifest = read_segment_manifest(segment_list_path, chunk_dir)
+            for chunk in manifest[fed:]:
+                await pipeline.feed(chunk)
+            fed = len(manifest)
+            if done:
+                break
+
+        stdout, stderr = communicate_task.result()
+        if process.returncode != 0:
+            stderr_tail = stderr.decode(errors="replace").strip()[-2000:]
+            logging.error(f"{FFMPEG_BINARY} failed with code {process.returncode}: {stderr_tail}")
+            raise AudioProcessingError(f"{FFMPEG_BINARY} exited with code {process.returncode}", stderr_tail)
+        original_length_ms = parse_progress_out_time_ms(stdout.decode(errors="replace"))
+        logging.info(f"Segmented {raw_file_path} into {fed} chunk(s), length: {original_length_ms} ms")
+        return original_length_ms
+    finally:
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+        remove_temp_files(temp_paths)
+
+
+def make_transcription_cache_key(file_unique_id: str, prompt: str, model: str) -> tuple[str, str]:
+    """Returns (cache_key, prompt_hash) for a Telegram file transcribed with a prompt and model."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    cache_key = hashlib.sha256(f"{file_unique_id}:{prompt_hash}:{model}".encode("utf-8")).hexdigest()
+    return cache_key, prompt_hash
+
+
+def get_cached_transcription(file_unique_id: str, prompt: str, model: str) -> dict | None:
+    """Returns {"transcription", "duration_seconds"} of a cached transcript, or None."""
+    if not config.TRANSCRIPTION_CACHE_ENABLED:
+        return None
+
+    cache_key, _ = make_transcription_cache_key(file_unique_id, prompt, model)
+    max_age = datetime.timedelta(days=config.TRANSCRIPTION_CACHE_MAX_AGE_DAYS)
+    db = SessionLocal()
+    try:
+        entry = db.query(TranscriptionCache).filter(TranscriptionCache.cache_key == cache_key).first()
+        if not entry:
+            return None
+        if entry.created_at.replace(tzinfo=UTC) < datetime.datetime.now(UTC) - max_age:
+            db.delete(entry)
+            db.commit()
+            return None
+
+        entry.hit_count += 1
+        entry.last_accessed_at = datetime.datetime.now(UTC)
+        db.commit()
+        logging.info(f"Transcription cache hit for {file_unique_id} (hits: {entry.hit_count}).")
+        return {"transcription": entry.transcript, "duration_seconds": entry.duration_seconds}
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Transcription cache lookup failed: {e}", exc_info=True)
+        return None
+    finally:
+        db.close()
+
+
+def store_cached_transcription(file_unique_id: str, prompt: str, model: str, transcript: str, duration_seconds: float):
+    """Stores a transcript in the cache and evicts old or excess entries."""
+    if not config.TRANSCRIPTION_CACHE_ENABLED or not transcript:
+        return
+
+    cache_key, prompt_hash = make_transcription_cache_key(file_unique_id, prompt, model)
+    db = SessionLocal()
+    try:
+        entry = db.query(TranscriptionCache).filter(TranscriptionCache.cache_key == cache_key).first()
+        if entry is None:
+            entry = TranscriptionCache(cache_key=cache_key, file_unique_id=file_unique_id, prompt_hash=prompt_hash, model=model)
+            db.add(entry)
+        entry.transcript = transcript
+        entry.duration_seconds = duration_seconds
+        entry.size_bytes = len(transcript.encode("utf-8"))
+        entry.created_at = datetime.datetime.now(UTC)
+        entry.last_accessed_at = entry.created_at
+        db.commit()
+        evict_transcription_cache(db)
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to store transcription in cache: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def evict_transcription_cache(db) -> int:
+    """Evicts expired, then least recently used entries until the cache fits. Returns the number evicted."""
+    cutoff = datetime.datetime.now(UTC) - datetime.timedelta(days=config.TRANSCRIPTION_CACHE_MAX_AGE_DAYS)
+    evicted = db.query(TranscriptionCache).filter(TranscriptionCache.created_at < cutoff).delete(synchronize_session=False)
+
+    max_bytes = config.TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024
+    total_bytes = db.query(func.coalesce(func.sum(TranscriptionCache.size_bytes), 0)).scalar()
+    if total_bytes > max_bytes:
+        stale_ids = []
+        entries = db.query(TranscriptionCache.id, TranscriptionCache.size_bytes).order_by(TranscriptionCache.last_accessed_at)
+        for entry_id, size_bytes in entries:
+            if total_bytes <= max_bytes:
+                break
+            total_bytes -= size_bytes
+            stale_ids.append(entry_id)
+        evicted += db.query(TranscriptionCache).filter(TranscriptionCache.id.in_(stale_ids)).delete(synchronize_session=False)
+    db.commit()
+    if evicted:
+        logging.info(f"Evicted {evicted} transcription cache entries, cache size now {total_bytes} bytes.")
+    return evicted
+
+
+class InFlightTranscription:
+    """A running transcription whose status edits and result are shared by every subscriber."""
+
+    def __init__(self, status_message):
+        self.status_messages = [status_message]
+        self.result = asyncio.get_running_loop().create_future()
+        self.last_text = None
+
+    async def edit_text(self, text: str, **kwargs):
+        self.last_text = text
+        outcomes = await asyncio.gather(
+            *(message.edit_text(text, **kwargs) for message in list(self.status_messages)),
+            return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logging.warning(f"Failed to update a subscribed status message: {outcome}")
+
+    async def subscribe(self, status_message):
+        self.status_messages.append(status_message)
+        if self.last_text:
+            try:
+                await status_message.edit_text(self.last_text)
+            except Exception as e:
+                logging.warning(f"Failed to sync a new subscriber's status message: {e}")
+
+
+_in_flight_transcriptions: dict[str, InFlightTranscription] = {}
+
+
+class LeaderCancelled(Exception):
+    """Set on an in-flight transcription whose leading run was cancelled."""
+
+
+async def coalesce_transcription(key: str, status_message, work):
+    """Runs `work(status)` once per `key`; concurrent callers with the same key share its result."""
+    while True:
+        flight = _in_flight_transcriptions.get(key)
+        if flight is None:
+            break
+        logging.info(f"Joining in-flight transcription {key[:12]} ({len(flight.status_messages)} subscriber(s)).")
+        await flight.subscribe(status_message)
+        try:
+            return await asyncio.shield(flight.result)
+        except LeaderCancelled:
+            # The next subscriber to get here leads a new run, the others join it.
+            logging.info(f"Leader of transcription {key[:12]} was cancelled, taking over.")
+
+    flight = InFlightTranscription(status_message)
+    _in_flight_transcriptions[key] = flight
+    try:
+        result = await work(flight)
+        flight.result.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        flight.result.set_exception(LeaderCancelled())
+        flight.result.exception()
+        raise
+    except Exception as e:
+        flight.result.set_exception(e)
+        # Mark the exception as retrieved when nobody else subscribed.
+        flight.result.exception()
+        raise
+    finally:
+        del _in_flight_transcriptions[key]
+
+
+# Jobs in these states still owe the user a transcript and are resumed on startup.
+UNFINISHED_JOB_STATUSES = ("PENDING", "RUNNING", "RETRYABLE", "TRANSCRIBED", "CHARGED")
+
+
+def _job_dict(job: BatchJob) -> dict:
+    return {
+        "id": job.id,
+        "user_id": job.user_id,
+        "chat_id": job.chat_id,
+        "original_message_id": job.original_message_id,
+        "status_message_id": job.status_message_id,
+        "status": job.status,
+        "output_kind": job.output_kind,
+        "file_id": job.file_id,
+        "file_unique_id": job.file_unique_id,
+        "file_size": job.file_size,
+        "duration_seconds": job.duration_seconds,
+        "original_filename": job.original_filename,
+        "cost_minutes": job.cost_minutes,
+        "chunk_plan": json.loads(job.chunk_manifest) if job.chunk_manifest else None,
+        "transcript": job.transcript,
+        "batch_name": job.batch_name,
+        "batch_files": json.loads(job.batch_files) if job.batch_files else [],
+        "created_at": job.created_at,
+    }
+
+
+def create_transcription_job(
+    user_id: int,
+    chat_id: int,
+    original_message_id: int,
+    status_message_id: int | None,
+    output_kind: str,
+    file_id: str,
+    file_unique_id: str,
+    file_size: int,
+    duration_seconds: int,
+    original_filename: str,
+    status: str = "PENDING",
+) -> int:
+    """Records a new transcription job before any work starts. Returns the job id."""
+    db = SessionLocal()
+    try:
+        job = BatchJob(
+            job_name=f"{output_kind}_{uuid.uuid4().hex}",
+            user_id=user_id,
+            chat_id=chat_id,
+            original_message_id=original_message_id,
+            status_message_id=status_message_id,
+            status=status,
+            output_kind=output_kind,
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            file_size=file_size,
+            duration_seconds=duration_seconds,
+            original_filename=original_filename,
+            cost_minutes=duration_seconds / 60.0,
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def get_transcription_job(job_id: int) -> dict | None:
+    db = SessionLocal()
+    try:
+        job = db.query(BatchJob).filter(BatchJob.id == job_id).first()
+        return _job_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def get_transcription_jobs(statuses: tuple[str, ...]) -> list[dict]:
+    """Transcription jobs in any of `statuses`, oldest first."""
+    db = SessionLocal()
+    try:
+        jobs = (
+            db.query(BatchJob)
+            .filter(BatchJob.status.in_(statuses), BatchJob.output_kind.isnot(None))
+            .order_by(BatchJob.id)
+            .all()
+        )
+        return [_job_dict(job) for job in jobs]
+    finally:
+        db.close()
+
+
+def get_unfinished_transcription_jobs() -> list[dict]:
+    """Interactive jobs interrupted by a restart, oldest first."""
+    return get_transcription_jobs(UNFINISHED_JOB_STATUSES)
+
+
+def update_transcription_job(job_id: int, **fields):
+    """Sets columns of a job; `chunk_plan` and `batch_files` are stored as JSON."""
+    if "chunk_plan" in fields:
+        fields["chunk_manifest"] = json.dumps(fields.pop("chunk_plan"))
+    if "batch_files" in fields:
+        fields["batch_files"] = json.dumps(fields["batch_files"])
+    db = SessionLocal()
+    try:
+        db.query(BatchJob).filter(BatchJob.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to update transcription job {job_id}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def finish_transcription_job(job_id: int, status: str, error: str | None = None):
+    """
+    Ends a run of a job. SUCCEEDED and FAILED are final and drop the transcript pieces;
+    RETRYABLE keeps them and leaves a TRANSCRIBED or CHARGED job at that step.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(BatchJob).filter(BatchJob.id == job_id).first()
+        if job:
+            job.error = error
+            if status != "RETRYABLE":
+                job.status = status
+                job.transcript = None
+                job.chunks.clear()
+            elif job.status not in ("TRANSCRIBED", "CHARGED"):
+                job.status = status
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to finish transcription job {job_id}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def get_job_chunk_transcripts(job_id: int) -> dict[int, str]:
+    """Transcripts of the chunks a job already finished, by chunk index."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(BatchJobChunk.chunk_index, BatchJobChunk.transcript)
+            .filter(BatchJobChunk.job_id == job_id, BatchJobChunk.status == "DONE")
+            .all()
+        )
+        return {index: transcript or "" for index, transcript in rows}
+    finally:
+        db.close()
+
+
+def get_job_chunks(job_id: int) -> list[dict]:
+    """The recorded chunk manifest of a job, in chunk order."""
+    db = SessionLocal()
+    try:
+        rows = db.query(BatchJobChunk).filter(BatchJobChunk.job_id == job_id).order_by(BatchJobChunk.chunk_index).all()
+        return [
+            {"index": row.chunk_index, "start_seconds": row.start_seconds, "duration_seconds": row.duration_seconds}
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+def record_job_chunk(job_id: int, chunk: dict, transcript: str | None = None):
+    """Upserts a chunk of a job: PENDING when produced, DONE with its transcript when finished."""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(BatchJobChunk)
+            .filter(BatchJobChunk.job_id == job_id, BatchJobChunk.chunk_index == chunk["index"])
+            .first()
+        )
+        if row is None:
+            row = BatchJobChunk(job_id=job_id, chunk_index=chunk["index"])
+            db.add(row)
+        row.start_seconds = chunk["start_seconds"]
+        row.duration_seconds = chunk["duration_seconds"]
+        if transcript is not None:
+            row.status = "DONE"
+            row.transcript = transcript
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to record chunk {chunk['index']} of job {job_id}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+class BotStatusMessage:
+    """Status message known only by chat and message id, e.g. after a restart."""
+
+    def __init__(self, bot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text: str, **kwargs):
+        return await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
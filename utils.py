@@ -1,14 +1,13 @@
 # utils.py
 import os
+import time
+import asyncio
 import logging
 import html
 from functools import wraps
 import io
-import asyncio
 import jdatetime
 import pytz
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
 import tempfile
 
 from markdown_it import MarkdownIt
@@ -26,15 +25,16 @@ from telegram import (
 
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
 from telethon import TelegramClient, errors as telethon_errors
 
 import config
 from database import SessionLocal, User, ActivityLog
 from texts import Texts
 from ai_services import (
-    count_text_tokens
+    count_text_tokens_async
 )
+from send_scheduler import retry_after_seconds, PROGRESS_TRAFFIC
 
     
 def convert_md_to_html(md_text: str, user_lang: str) -> str:
@@ -81,6 +81,110 @@ def convert_md_to_html(md_text: str, user_lang: str) -> str:
         return final_html
 
 
+class ProgressReporter:
+    """
+    Debounced, flood-wait aware wrapper around a status message, used wherever a
+    long-running handler reports progress. `edit_text` returns at once: updates are
+    merged so only the latest text is shown, at most one edit per `min_interval`
+    seconds, and an edit that would not change the message is skipped. A RetryAfter
+    pauses the message for as long as Telegram asks and then shows the latest text,
+    instead of failing the job. All edits of the message must go through the reporter.
+    Edits are progress traffic unless the caller passes other `rate_limit_args`, e.g.
+    send_scheduler.RESULT_TRAFFIC for a final result or error.
+    """
+
+    def __init__(self, message, min_interval: float | None = None):
+        self.message = message
+        self.min_interval = config.PROGRESS_MIN_INTERVAL_SECONDS if min_interval is None else min_interval
+        self._pending = None
+        self._shown = None
+        self._next_edit_at = 0.0
+        self._task = None
+
+        self.edits = 0
+        self.merged = 0
+        self.skipped = 0
+        self.flood_waits = 0
+
+    @property
+    def message_id(self):
+        return self.message.message_id
+
+    async def edit_text(self, text: str, **kwargs):
+        kwargs.setdefault("rate_limit_args", PROGRESS_TRAFFIC)
+        if self._pending is not None:
+            self.merged += 1
+        self._pending = (text, kwargs)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._deliver())
+
+    async def _deliver(self):
+        while self._pending is not None:
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update, self._pending = self._pending, None
+            if update == self._shown:
+                self.skipped += 1
+                continue
+            text, kwargs = update
+            self._next_edit_at = time.monotonic() + self.min_interval
+            try:
+                await self.message.edit_text(text, **kwargs)
+                self._shown = update
+                self.edits += 1
+            except RetryAfter as e:
+                self.flood_waits += 1
+                wait = retry_after_seconds(e)
+                logging.warning(f"Flood control on status message {self.message_id}, retrying in {wait}s.")
+                self._next_edit_at = time.monotonic() + wait
+                if self._pending is None:
+                    self._pending = update
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    self._shown = update
+                else:
+                    logging.warning(f"Failed to update status message {self.message_id}: {e}")
+            except Exception as e:
+                logging.warning(f"Failed to update status message {self.message_id}: {e}")
+
+    async def flush(self):
+        """Waits until the latest text has been shown (or has failed)."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def close(self):
+        """Drops any update not shown yet and waits out an edit in flight, e.g. before the final edit."""
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class StreamingMessage:
+    """
+    Shows a response that is still being generated in an existing message, below a
+    fixed header, through a ProgressReporter. The preview is cut below Telegram's
+    message length limit; the caller closes the view and sends the complete,
+    formatted result once the stream ends.
+    """
+    PREVIEW_LIMIT = 3800
+
+    def __init__(self, message, header: str, min_interval: float):
+        self.header = header
+        self.reporter = ProgressReporter(message, min_interval)
+
+    async def update(self, text: str):
+        preview = text if len(text) <= self.PREVIEW_LIMIT else text[:self.PREVIEW_LIMIT] + " …"
+        await self.reporter.edit_text(f"{self.header}\n\n{preview}")
+
+    async def close(self):
+        await self.reporter.close()
+
+
 def create_word_document(html_content: str, user_lang: str) -> io.BytesIO:
     """
     Converts HTML-formatted text to a correctly styled in-memory .docx file,
@@ -158,19 +262,28 @@ async def deliver_transcription_result(
     Delivers the transcription result to the user, intelligently choosing
     between sending a direct message or a file based on length.
     """
-    reply_target = update.effective_message
+    await send_transcription_result(
+        context, update.effective_chat.id, update.effective_user.id, transcript_text, source_info
+    )
+
+
+async def send_transcription_result(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    user_id: int,
+    transcript_text: str,
+    source_info: dict,
+):
+    """
+    deliver_transcription_result for a known chat and user, without an incoming Update
+    (e.g. for transcription jobs resumed after a restart).
+    """
     TELEGRAM_MESSAGE_LIMIT = 4096
     TELEGRAM_CAPTION_LIMIT = 1024
     
     context.user_data['last_text'] = transcript_text
   
-    loop = asyncio.get_event_loop()
-    transcription_tokens = await loop.run_in_executor(
-        config.TOKEN_COUNTING_EXECUTOR,
-        count_text_tokens,
-        transcript_text,
-        "gemini-2.0-flash-lite"
-    )      
+    transcription_tokens = await count_text_tokens_async(transcript_text, "gemini-2.0-flash-lite")
     
     action1_estimated_minutes = (transcription_tokens + 500) / config.TEXT_TOKENS_TO_MINUTES_COEFF
     action2_estimated_minutes = (transcription_tokens + 2000) / config.TEXT_TOKENS_TO_MINUTES_COEFF
@@ -183,7 +296,7 @@ async def deliver_transcription_result(
     db_user = context.user_data.get('db_user')
     if not db_user:
         db = SessionLocal()
-        db_user = db.query(User).filter(User.user_id == update.effective_user.id).first()
+        db_user = db.query(User).filter(User.user_id == user_id).first()
         db.close()
     remaining_credit = db_user.credit_minutes if db_user else 0.0
   
@@ -236,7 +349,8 @@ async def deliver_transcription_result(
                 "👉 What action should I perform on this text?"
             )
 
-        await reply_target.reply_text(
+        await context.bot.send_message(
+            chat_id=chat_id,
             text=message_body,
             parse_mode=ParseMode.HTML,
             reply_markup=get_action_keyboard(
@@ -281,7 +395,8 @@ async def deliver_transcription_result(
             current_report_time = jdatetime.datetime.now(tehran_tz).strftime("%Y%m%d-%H%M%S")
             transcription_filename = f"Transcription_{current_report_time}.docx"
 
-            await reply_target.reply_document(
+            await context.bot.send_document(
+                chat_id=chat_id,
                 document=document_buffer,
                 filename=transcription_filename,
                 caption=caption,
@@ -297,7 +412,7 @@ async def deliver_transcription_result(
             )
         except Exception as e:
             logging.error(f"Failed to create or send Word file: {e}", exc_info=True)
-            await reply_target.reply_text(Texts.Errors.GENERIC_UNEXPECTED_ADMIN.format(error=e))
+            await context.bot.send_message(chat_id=chat_id, text=Texts.Errors.GENERIC_UNEXPECTED_ADMIN.format(error=e))
 
 
 def get_or_create_user(session, user_id: int, first_name: str, username: str | None) -> tuple[User, bool]:
@@ -493,28 +608,16 @@ async def extract_text_from_docx(update: Update, context: ContextTypes.DEFAULT_T
         print(f"Error processing DOCX: {e}")
         return None
 
-def preprocess_audio_sync(raw_file_path: str, processed_audio_path: str) -> tuple:
-    """
-    Synchronous function to preload and preprocess audio to 32kHz mono MP3.
-    Returns (success: bool, error_msg: str or None, original_length_ms: int or None)
-    for better error handling in the main async method.
-    """
-    try:
-        audio = AudioSegment.from_file(raw_file_path)
+async def send_transcript_part(bot, chat_id: int, part_number: int, text: str):
+    """Sends one finished part of a transcript still in progress, split to fit Telegram messages."""
+    header = Texts.User.TRANSCRIPT_PART_HEADER.format(part=part_number)
+    limit = 4096 - len(header) - 2
+    text = text.strip() or "…"
+    for start in range(0, len(text), limit):
+        await bot.send_message(chat_id=chat_id, text=f"{header}\n\n{text[start:start + limit]}")
 
-        processed_audio = audio.set_frame_rate(32000).set_channels(1).apply_gain(6.0)
-        processed_audio.export(processed_audio_path, format="mp3", bitrate="32k")
 
-        return True, None, len(audio)
-    
-    except CouldntDecodeError as e:
-        return False, "فایل صوتی فرمت ناشناخته یا خرابی دارد و قابل پردازش نیست.", None
-    except FileNotFoundError:
-        return False, "فایل دانلود شده یافت نشد – لطفا مجددا تلاش کنید.", None
-    except Exception as e:
-        return False, f"خطا در پردازش فایل: {str(e)}", None
-    
-async def deliver_srt_file(update, context, srt_content, filename, cost_minutes):
+async def deliver_srt_file(context, chat_id, srt_content, filename, cost_minutes):
     srt_filename = f"{filename.replace('.mp4', '')}.srt"
     with tempfile.NamedTemporaryFile(mode='w', suffix='.srt', delete=False) as temp_file:
         temp_file.write(srt_content)
@@ -522,7 +625,7 @@ async def deliver_srt_file(update, context, srt_content, filename, cost_minutes)
     
     try:
         await context.bot.send_document(
-            update.effective_chat.id,
+            chat_id,
             document=open(temp_file_path, 'rb'),
             filename=srt_filename,
             caption=f"زیرنویس برای {filename} آماده شد. هزینه: {cost_minutes:.1f} دقیقه."
@@ -562,4 +665,50 @@ def correct_srt_format(srt_content):
             if lines[i].strip():
                 corrected.append(lines[i].strip())
             i += 1
-    return '\n'.join(corrected)
\ No newline at end of file
+    return '\n'.join(corrected)
+
+
+SRT_TIMESTAMP_PATTERN = re.compile(r'(\d{1,2}):(\d{2}):(\d{2})[,.](\d{1,3})')
+
+def remap_srt_timestamps(srt_content: str, time_mapper) -> str:
+    """
+    Rewrites every `HH:MM:SS,mmm` timestamp of an SRT document through
+    `time_mapper(seconds) -> seconds`, e.g. to move a chunk's cues onto the
+    original recording's timeline.
+    """
+    def replace(match):
+        hours, minutes, seconds, millis = match.groups()
+        total = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, '0')) / 1000
+        mapped_ms = max(0, round(time_mapper(total) * 1000))
+        return (
+            f"{mapped_ms // 3600000:02d}:{(mapped_ms // 60000) % 60:02d}:"
+            f"{(mapped_ms // 1000) % 60:02d},{mapped_ms % 1000:03d}"
+        )
+    return SRT_TIMESTAMP_PATTERN.sub(replace, srt_content)
+
+def renumber_srt(srt_content: str) -> str:
+    """Renumbers SRT cue indices sequentially, e.g. after joining several chunks."""
+    lines = srt_content.strip().split('\n')
+    seq = 1
+    for i, line in enumerate(lines):
+        if line.strip().isdigit() and i + 1 < len(lines) and '-->' in lines[i + 1]:
+            lines[i] = str(seq)
+            seq += 1
+    return '\n'.join(lines)
+
+def merge_srt_chunks(chunks: list[dict], chunk_srts: list[str], time_map=None) -> str:
+    """
+    Joins per-chunk SRT transcripts into one document on the original timeline.
+    Each chunk's cues are shifted by its start offset and, for silence-trimmed audio,
+    mapped back through `time_map.to_original`.
+    """
+    pieces = []
+    for chunk, chunk_srt in zip(chunks, chunk_srts):
+        offset = chunk["start_seconds"]
+        if time_map:
+            mapper = lambda t, offset=offset: time_map.to_original(offset + t)
+        else:
+            mapper = lambda t, offset=offset: offset + t
+        pieces.append(remap_srt_timestamps(chunk_srt.strip(), mapper))
+    return renumber_srt("\n\n".join(piece for piece in pieces if piece))
+
@@ -0,0 +1,112 @@
+# webhook.py
+import hmac
+import json
+import logging
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+from telegram import Update
+from telegram.ext import Application
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def build_webhook_app(application: Application, path: str, secret_token: str | None) -> Starlette:
+    """
+    ASGI app that feeds Telegram's webhook POSTs to `application`. A request without
+    the expected secret token is rejected before its body is parsed. The update is
+    only queued, so Telegram gets its 200 without waiting for the handler; /healthz is
+    for the load balancer.
+    """
+    expected_secret = secret_token.encode() if secret_token else None
+
+    async def receive_update(request: Request) -> Response:
+        if expected_secret is not None:
+            received = request.headers.get(SECRET_TOKEN_HEADER, "").encode()
+            if not hmac.compare_digest(received, expected_secret):
+                logging.warning(f"Rejected a webhook request from {request.client.host if request.client else 'unknown'}: bad secret token.")
+                return Response(status_code=403)
+        try:
+            update = Update.de_json(json.loads(await request.body()), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logging.warning(f"Rejected a malformed webhook update: {e}")
+            return Response(status_code=400)
+        await application.update_queue.put(update)
+        return Response()
+
+    async def health(request: Request) -> Response:
+        return PlainTextResponse("ok" if application.running else "starting", status_code=200 if application.running else 503)
+
+    return Starlette(routes=[
+        Route(path, receive_update, methods=["POST"]),
+        Route("/healthz", health, methods=["GET"]),
+    ])
+
+
+def build_webhook_server(
+    application: Application,
+    listen: str,
+    port: int,
+    path: str,
+    secret_token: str | None,
+    trusted_proxies: str = "127.0.0.1",
+) -> uvicorn.Server:
+    """
+    uvicorn server for the webhook app. TLS ends at the reverse proxy in front of it,
+    which forwards plain HTTP; X-Forwarded-* headers are honored only from
+    `trusted_proxies` (comma-separated IPs or "*").
+    """
+    server_config = uvicorn.Config(
+        app=build_webhook_app(application, path, secret_token),
+        host=listen,
+        port=port,
+        proxy_headers=True,
+        forwarded_allow_ips=trusted_proxies,
+        access_log=False,
+        log_level="warning",
+    )
+    return uvicorn.Server(server_config)
+
+
+async def run_webhook(
+    application: Application,
+    url: str,
+    listen: str,
+    port: int,
+    path: str,
+    secret_token: str | None,
+    trusted_proxies: str = "127.0.0.1",
+    max_connections: int = 40,
+    drop_pending_updates: bool = False,
+    set_webhook: bool = True,
+    post_init=None,
+):
+    """
+    Runs the bot in webhook mode until the server is stopped (SIGINT/SIGTERM):
+    registers `url` + `path` with Telegram unless `set_webhook` is off (e.g. on all
+    but one of several replicas behind a load balancer), then serves updates.
+    Application.run_webhook would also run `post_init`; here it's called explicitly.
+    """
+    server = build_webhook_server(application, listen, port, path, secret_token, trusted_proxies)
+    async with application:
+        if post_init is not None:
+            await post_init(application)
+        if set_webhook:
+            await application.bot.set_webhook(
+                url=f"{url.rstrip('/')}{path}",
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=secret_token,
+                max_connections=max_connections,
+                drop_pending_updates=drop_pending_updates,
+            )
+            logging.info(f"Webhook set to {url.rstrip('/')}{path}.")
+        await application.start()
+        logging.info(f"Serving webhook updates on {listen}:{port}{path}.")
+        try:
+            await server.serve()
+        finally:
+            await application.stop()